@@ -15,6 +15,24 @@ def create_app(config_class=Config):
     
     from app import models  # Register models with SQLAlchemy
 
+    from app.services import rag_service
+    rag_service.init_app(app)
+
+    from app.services.llm_pool import llm_pool
+    llm_pool.init_app(app)
+
+    from app.services.stream_buffer import stream_registry
+    stream_registry.init_app(app)
+
+    from app.services.scheduler import llm_scheduler
+    llm_scheduler.init_app(app)
+
+    from app.services.profiler import profiler
+    profiler.init_app(app)
+
+    from app.services.write_behind import write_behind
+    write_behind.init_app(app)
+
     @login_manager.user_loader
     def load_user(user_id):
         from app.models.user import User
@@ -44,6 +62,15 @@ def create_app(config_class=Config):
     from app.routes.admin import admin_bp
     app.register_blueprint(admin_bp, url_prefix='/admin')
 
+    from app.routes.search import search_bp
+    app.register_blueprint(search_bp, url_prefix='/search')
+
+    # CLI commands (flask search ..., flask rag ..., flask qa ...)
+    from app.cli import search_cli, rag_cli, qa_cli
+    app.cli.add_command(search_cli)
+    app.cli.add_command(rag_cli)
+    app.cli.add_command(qa_cli)
+
     # Error handlers
     @app.errorhandler(403)
     def forbidden(error):
@@ -0,0 +1,366 @@
+import json
+import os
+import time
+import click
+from flask.cli import AppGroup
+from app.extensions import db
+
+search_cli = AppGroup('search', help='Full-text search maintenance.')
+
+@search_cli.command('backfill')
+def search_backfill():
+    """Create the FTS5 tables/triggers if needed and index all existing rows."""
+    from app.services import search_service
+    if not search_service.is_supported(db.session):
+        raise click.ClickException("Full-text search requires SQLite with FTS5.")
+    counts = search_service.rebuild_fts(db.session)
+    for table, count in counts.items():
+        click.echo(f"{table}: {count} rows indexed")
+
+
+rag_cli = AppGroup('rag', help='Offline vector index maintenance.')
+
+def _checkpoint(name, params, restart):
+    from flask import current_app
+    from app.services.index_maintenance import Checkpoint
+    path = os.path.join(current_app.instance_path, 'maintenance', f"{name}.json")
+    checkpoint = Checkpoint(path, params)
+    if restart:
+        checkpoint.clear()
+        checkpoint = Checkpoint(path, params)
+    elif checkpoint.done:
+        click.echo(f"Resuming {name}: {len(checkpoint.done)} item(s) already done (use --restart to start over).")
+    return checkpoint
+
+def _require_local_store():
+    from app.services.index_maintenance import local_store
+    try:
+        local_store()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+def _selected_documents(document_ids, include_failed):
+    from app.models.document import Document
+    query = Document.query.filter_by(is_active=True)
+    if document_ids:
+        query = query.filter(Document.id.in_(document_ids))
+    statuses = ['ready', 'failed'] if include_failed else ['ready']
+    return query.filter(Document.status.in_(statuses)).order_by(Document.id).all()
+
+@rag_cli.command('rebuild')
+@click.option('--document-id', '-d', 'document_ids', type=int, multiple=True, help='Only these documents (repeatable).')
+@click.option('--include-failed', is_flag=True, help='Also retry documents whose ingest failed.')
+@click.option('--workers', default=max(1, (os.cpu_count() or 2) // 2), show_default=True, help='Worker processes.')
+@click.option('--restart', is_flag=True, help='Ignore progress from an interrupted run.')
+def rag_rebuild(document_ids, include_failed, workers, restart):
+    """Re-chunk and re-embed documents from their uploaded files (e.g. after a splitter change).
+    Each document keeps its embedding model; use 'flask rag reembed' to move to another."""
+    from app.models.document import Document
+    from app.services.index_maintenance import rebuild
+    from app.services.rag_service import fetch_upload
+
+    docs = _selected_documents(document_ids, include_failed)
+    jobs = []
+    selected = {}
+    for doc in docs:
+        if not fetch_upload(doc.file_path):
+            click.echo(f"  #{doc.id} {doc.original_filename}: upload missing, skipped")
+            continue
+        jobs.append((doc.id, doc.file_path, doc.file_path.rsplit('.', 1)[-1].lower(),
+                     doc.embedding_model, doc.embedding_version))
+        selected[doc.id] = (doc.version, doc.file_path)
+
+    # Keyed on the options rather than the ids they select, so documents uploaded
+    # or failing in the meantime don't throw the progress away
+    checkpoint = _checkpoint('rebuild', {'ids': sorted(document_ids), 'include_failed': include_failed}, restart)
+    started = time.perf_counter()
+    failed = []
+    claims = {}  # doc_id -> status to restore
+
+    def unchanged(doc_id):
+        version, file_path = selected[doc_id]
+        return Document.query.filter(
+            Document.id == doc_id, Document.is_active.is_(True),
+            Document.version == version, Document.file_path == file_path
+        )
+
+    def claim(doc_id):
+        # The same claim a replace takes, so neither overwrites the other's index;
+        # a document replaced since it was selected is left to that replace
+        previous_status = unchanged(doc_id).filter(Document.status != 'processing').with_entities(
+            Document.status
+        ).scalar()
+        claimed = previous_status is not None and unchanged(doc_id).filter(
+            Document.status == previous_status
+        ).update({'status': 'processing'}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            click.echo(f"  #{doc_id}: being processed or replaced since, skipped")
+            return False
+        claims[doc_id] = previous_status
+        return True
+
+    def release(doc_id, values):
+        updated = unchanged(doc_id).filter(Document.status == 'processing').update(
+            values, synchronize_session=False
+        )
+        db.session.commit()
+        return updated
+
+    def on_result(doc_id, chunks, seconds, error):
+        previous_status = claims.pop(doc_id)
+        if error:
+            # The old index was never replaced, so the document stays as it was
+            release(doc_id, {'status': previous_status})
+            failed.append(doc_id)
+            click.echo(f"  #{doc_id} FAILED: {error}")
+            return
+        if not release(doc_id, {'status': 'ready', 'chunk_count': chunks}):
+            click.echo(f"  #{doc_id} {chunks} chunks in {seconds:.1f}s, but the document changed meanwhile; left as it is")
+            return
+        click.echo(f"  #{doc_id} {chunks} chunks in {seconds:.1f}s")
+
+    try:
+        count = rebuild(jobs, checkpoint, workers, on_result, claim)
+    finally:
+        # Interrupted: hand back the documents still claimed
+        for doc_id, previous_status in claims.items():
+            release(doc_id, {'status': previous_status})
+    click.echo(f"Rebuilt {count - len(failed)} index(es) in {time.perf_counter() - started:.1f}s with {workers} worker(s).")
+    if failed:
+        # Keep the checkpoint: running the same command again retries only these
+        click.echo(f"{len(failed)} failed; run the same command again to retry them.")
+        raise SystemExit(1)
+    checkpoint.clear()
+
+@rag_cli.command('verify')
+@click.option('--document-id', '-d', 'document_ids', type=int, multiple=True, help='Only these documents (repeatable).')
+@click.option('--restart', is_flag=True, help='Ignore progress from an interrupted run.')
+def rag_verify(document_ids, restart):
+    """Check every ready index's vector count against Document.chunk_count."""
+    from app.services import embedding_models
+    from app.services.index_maintenance import verify
+
+    docs = _selected_documents(document_ids, include_failed=False)
+    checkpoint = _checkpoint('verify', {'ids': sorted(document_ids)}, restart)
+    bad = []
+
+    def on_result(doc_id, result):
+        if not result['ok']:
+            bad.append(doc_id)
+            click.echo(f"  #{doc_id}: {result['problem']}")
+
+    verify([(d.id, embedding_models.document_index_key(d), d.chunk_count or 0) for d in docs],
+           checkpoint, on_result)
+    # Include problems found before an interruption
+    bad_ids = sorted({int(i) for i, r in checkpoint.done.items() if not r['ok']})
+    checkpoint.clear()
+    click.echo(f"Verified {len(docs)} index(es): {len(bad_ids)} problem(s).")
+    if bad_ids:
+        click.echo("Fix with: flask rag rebuild " + " ".join(f"-d {i}" for i in bad_ids))
+        raise SystemExit(1)
+
+@rag_cli.command('compact')
+def rag_compact():
+    """Drop docstore entries that no vector refers to (e.g. from interrupted or older writes)."""
+    from app.models.document import Document
+    from app.services import embedding_models
+    from app.services.index_maintenance import compact
+
+    _require_local_store()
+    keys = [embedding_models.document_index_key(d)
+            for d in Document.query.filter_by(is_active=True, status='ready').all()]
+    rewritten = compact(keys, lambda key, n: click.echo(f"  {key}: dropped {n} stale entries"))
+    click.echo(f"Compacted {rewritten} of {len(keys)} index(es).")
+
+@rag_cli.command('gc')
+@click.option('--dry-run', is_flag=True, help='Only list what would be removed.')
+@click.option('--min-age-minutes', default=60, show_default=True, help='Never touch anything newer than this.')
+def rag_gc(dry_run, min_age_minutes):
+    """Remove index directories and uploads that no live Document refers to,
+    here and in shared storage."""
+    from flask import current_app
+    from app.models.document import Document
+    from app.services import embedding_models
+    from app.services.embedding_migration import active_migration
+    from app.services.index_maintenance import find_orphans, remove_orphans
+
+    _require_local_store()
+    docs = Document.query.all()
+    # Failed documents keep their upload (so they can be retried) but not their partial index
+    live = [d for d in docs if d.is_active and d.status in ('ready', 'processing')]
+    live_keys = [embedding_models.document_index_key(d) for d in live]
+    migration = active_migration()
+    if migration is not None:
+        # Indexes a running migration is building haven't been switched to yet
+        target = embedding_models.get(migration.model, migration.version)
+        live_keys += [embedding_models.index_key(d.id, target) for d in live]
+    referenced = [d.file_path for d in docs if d.is_active and d.file_path]
+
+    indexes, uploads = find_orphans(
+        live_keys, referenced, current_app.config['UPLOAD_FOLDER'], min_age_minutes * 60
+    )
+    for path in indexes + uploads:
+        click.echo(f"  {'would remove' if dry_run else 'removing'} {path}")
+    if dry_run:
+        click.echo(f"{len(indexes)} orphan index(es), {len(uploads)} orphan upload(s).")
+        return
+    freed = remove_orphans(indexes, uploads)
+    click.echo(f"Removed {len(indexes)} index(es) and {len(uploads)} upload(s), freed {freed / 1e6:.1f} MB.")
+
+@rag_cli.command('usage')
+def rag_usage():
+    """Disk used by uploads and indexes, per user."""
+    from app.models.document import Document
+    from app.models.user import User
+    from app.services import embedding_models
+    from app.services.index_maintenance import disk_usage
+
+    _require_local_store()
+    emails = {u.id: u.email for u in User.query.all()}
+    docs = Document.query.filter_by(is_active=True).all()
+    usage = disk_usage([
+        (embedding_models.document_index_key(d), 'global' if d.is_global else emails.get(d.owner_id, f"user #{d.owner_id}"), d.file_path)
+        for d in docs
+    ])
+    rows = sorted(usage.items(), key=lambda kv: kv[1]['uploads'] + kv[1]['indexes'], reverse=True)
+    click.echo(f"{'OWNER':40} {'DOCS':>6} {'UPLOADS MB':>11} {'INDEXES MB':>11}")
+    for owner, entry in rows:
+        click.echo(f"{owner[:40]:40} {entry['documents']:>6} "
+                   f"{entry['uploads'] / 1e6:>11.1f} {entry['indexes'] / 1e6:>11.1f}")
+
+
+@rag_cli.command('models')
+def rag_models():
+    """Registered embedding models, how many documents use each, and recent migrations."""
+    from app.models.document import Document
+    from app.models.embedding_migration import EmbeddingMigration
+    from app.services import embedding_models
+
+    counts = dict(((name, version), n) for name, version, n in db.session.query(
+        Document.embedding_model, Document.embedding_version, db.func.count(Document.id)
+    ).filter(Document.is_active == True).group_by(Document.embedding_model, Document.embedding_version))
+    current = embedding_models.current()
+    click.echo(f"{'MODEL':32} {'DIM':>5} {'DOCS':>6}")
+    for model in embedding_models.MODELS:
+        marker = ' (current)' if model.key == current.key else ''
+        click.echo(f"{model.key:32} {model.dimension:>5} {counts.pop((model.name, model.version), 0):>6}{marker}")
+    for (name, version), n in counts.items():
+        click.echo(f"{name + '@' + str(version):32} {'?':>5} {n:>6} (not registered)")
+
+    migrations = EmbeddingMigration.query.order_by(EmbeddingMigration.id.desc()).limit(5).all()
+    if migrations:
+        click.echo("\nRecent migrations:")
+    for m in migrations:
+        click.echo(f"  #{m.id} {m.model}@{m.version} {m.status}: {m.migrated_documents} migrated, "
+                   f"{m.failed_documents} failed, {m.skipped_documents} skipped of {m.total_documents}")
+
+@rag_cli.command('reembed')
+@click.argument('model_name')
+@click.option('--version', type=int, help='Model version (default: the latest registered).')
+@click.option('--document-id', '-d', 'document_ids', type=int, multiple=True, help='Only these documents (repeatable).')
+@click.option('--max-chunks-per-second', type=float, help='Embedding rate limit (default: EMBEDDING_MIGRATION_MAX_CHUNKS_PER_SECOND, 0 for none).')
+@click.option('--pause-seconds', type=float, help='Pause between documents (default: EMBEDDING_MIGRATION_PAUSE_SECONDS).')
+def rag_reembed(model_name, version, document_ids, max_chunks_per_second, pause_seconds):
+    """Move documents to another embedding model without downtime.
+
+    Each document's new index is built next to the one serving, then the
+    document is switched over and its old index dropped. Safe to interrupt and
+    rerun: documents already moved are not touched again.
+    """
+    from flask import current_app
+    from app.services import embedding_models
+    from app.services.embedding_migration import create_migration, run_migration
+
+    try:
+        target = embedding_models.get(model_name, version)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if target.key != embedding_models.current().key:
+        click.echo(f"Warning: new uploads are still indexed with {embedding_models.current().key}; "
+                   f"set EMBEDDING_MODEL={target.name} as well.")
+    if max_chunks_per_second is None:
+        max_chunks_per_second = current_app.config.get('EMBEDDING_MIGRATION_MAX_CHUNKS_PER_SECOND')
+    if pause_seconds is None:
+        pause_seconds = current_app.config.get('EMBEDDING_MIGRATION_PAUSE_SECONDS', 0.0)
+    try:
+        migration = create_migration(target, document_ids, max_chunks_per_second)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Migration #{migration.id}: {migration.total_documents} document(s) to {target.key}.")
+    started = time.perf_counter()
+
+    def on_document(doc_id, outcome, chunks, seconds, error):
+        detail = f": {error}" if error else f", {chunks} chunks in {seconds:.1f}s"
+        click.echo(f"  #{doc_id} {outcome}{detail}")
+
+    migration = run_migration(migration.id, document_ids, pause_seconds, on_document)
+    click.echo(f"Migration #{migration.id} {migration.status} in {time.perf_counter() - started:.1f}s: "
+               f"{migration.migrated_documents} migrated, {migration.failed_documents} failed, "
+               f"{migration.skipped_documents} skipped.")
+    if migration.failed_documents:
+        raise SystemExit(1)
+
+@rag_cli.command('reembed-cancel')
+@click.argument('migration_id', type=int, required=False)
+def rag_reembed_cancel(migration_id):
+    """Stop a running migration (the latest if no id is given) after its current document."""
+    from app.services.embedding_migration import active_migration, cancel_migration
+
+    if migration_id is None:
+        running = active_migration()
+        if running is None:
+            raise click.ClickException("No migration is running.")
+        migration_id = running.id
+    if not cancel_migration(migration_id):
+        raise click.ClickException(f"Migration #{migration_id} is not running.")
+    click.echo(f"Migration #{migration_id} will stop after its current document.")
+
+
+qa_cli = AppGroup('qa', help='Batch question answering.')
+
+@qa_cli.command('batch')
+@click.argument('questions_file', type=click.File('r', encoding='utf-8'))
+@click.option('--document-id', '-d', 'document_ids', type=int, multiple=True, required=True, help='Documents to answer from (repeatable).')
+@click.option('--user', 'email', required=True, help="Run as this user: their document access and Gemini API key.")
+@click.option('--concurrency', default=4, show_default=True, help='Gemini calls in flight.')
+@click.option('--pages', help='Only retrieve from these pages, e.g. 10-20 (PDF page numbers).')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-', help='NDJSON output (default: stdout).')
+def qa_batch(questions_file, document_ids, email, concurrency, pages, output):
+    """Answer each non-empty line of QUESTIONS_FILE ('-' for stdin) over the given documents.
+
+    Writes one JSON line per question as it finishes (with per-question timings), then a summary line.
+    """
+    from flask import current_app
+    from app.models.user import User
+    from app.services import batch_qa, retrieval_filter
+
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    if not user.has_api_key():
+        raise click.ClickException(f"{email} has no Gemini API key")
+    try:
+        questions, document_ids, concurrency = batch_qa.parse_request(
+            {
+                'questions': [line.strip() for line in questions_file if line.strip()],
+                'document_ids': list(document_ids),
+                'concurrency': concurrency,
+            },
+            max_concurrency=current_app.config['BATCH_QA_MAX_CONCURRENCY']
+        )
+        batch_qa.check_access(user.id, document_ids)
+        search_filter = retrieval_filter.parse({'pages': pages}, {})
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    summaries = batch_qa.batch_summaries(questions, document_ids)
+    for item in batch_qa.run_batch(questions, document_ids, user.gemini_api_key, user.id, concurrency, summaries,
+                                   search_filter):
+        output.write(json.dumps(item) + "\n")
+        output.flush()
+        if item.get('done'):
+            if 'error' in item:
+                raise click.ClickException(item['error'])
+            click.echo(f"Answered {item['ok']}/{item['questions']} question(s), {item['errors']} error(s), "
+                       f"in {item['timings']['total']:.1f}s.", err=True)
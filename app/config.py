@@ -18,3 +18,123 @@ class Config:
     )
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024
     ALLOWED_EXTENSIONS = {'pdf', 'txt', 'docx'}
+
+    # Pooled Gemini clients (one per API key, reused across chat turns)
+    LLM_POOL_MAX_CLIENTS = 32
+    LLM_POOL_IDLE_SECONDS = 600
+    # Another Gemini API endpoint, e.g. scripts/gemini_standin.py (default: Google's)
+    GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL')
+
+    # Resumable chat streams: ring buffer size per generation, how long a generation
+    # keeps running with no client attached, and how long finished streams stay resumable
+    STREAM_BUFFER_EVENTS = 512
+    STREAM_ABANDON_SECONDS = 30
+    STREAM_RETAIN_SECONDS = 120
+    # Gemini chunks are coalesced into one event per STREAM_FLUSH_CHARS or STREAM_FLUSH_MS
+    # (0/0: one event per chunk); idle streams get a keep-alive comment every
+    # STREAM_HEARTBEAT_SECONDS; STREAM_COMPRESSION gzips streams for clients that accept it
+    STREAM_FLUSH_CHARS = 64
+    STREAM_FLUSH_MS = 50
+    STREAM_HEARTBEAT_SECONDS = 15
+    STREAM_COMPRESSION = os.environ.get('STREAM_COMPRESSION', 'false').lower() in ('1', 'true', 'yes')
+
+    # On-demand request profiling (Admin > Profiles): armed requests are stack-sampled
+    # every PROFILER_INTERVAL_MS for at most PROFILER_MAX_SECONDS; an unused trigger
+    # expires after PROFILER_ARM_MINUTES; the newest PROFILER_MAX_FILES profiles are kept
+    PROFILER_INTERVAL_MS = 5
+    PROFILER_MAX_SECONDS = 300
+    PROFILER_ARM_MINUTES = 30
+    PROFILER_MAX_FILES = 200
+
+    # Write-behind persistence: chat messages and ingest status updates are committed
+    # in batches of up to WRITE_BEHIND_MAX_BATCH, at most WRITE_BEHIND_MAX_LAG_MS after
+    # being queued (and on shutdown); producers wait once WRITE_BEHIND_MAX_PENDING are queued
+    WRITE_BEHIND = os.environ.get('WRITE_BEHIND', 'true').lower() in ('1', 'true', 'yes')
+    WRITE_BEHIND_MAX_LAG_MS = 250
+    WRITE_BEHIND_MAX_BATCH = 200
+    WRITE_BEHIND_MAX_PENDING = 5000
+
+    # Admission control for retrieval + Gemini calls (per process)
+    SCHEDULER_GLOBAL_CONCURRENCY = 8
+    SCHEDULER_PER_USER_CONCURRENCY = 2
+    SCHEDULER_MAX_QUEUE_SECONDS = 20
+
+    # Bulk upload: total request size, files per batch, and parallel ingest workers
+    BULK_UPLOAD_MAX_CONTENT_LENGTH = 200 * 1024 * 1024
+    BULK_UPLOAD_MAX_FILES = 500
+    INGEST_MAX_WORKERS = 4
+
+    # Parallel per-document retrieval: shared pool size and per-turn deadline (seconds)
+    RETRIEVAL_MAX_WORKERS = 8
+    RETRIEVAL_DEADLINE_SECONDS = 5.0
+
+    # Loaded FAISS indexes kept in memory, and how many of those slots prefetching
+    # (on opening a conversation) may hold before a query has used them
+    INDEX_CACHE_MAX_ENTRIES = 32
+    PREFETCH_BUDGET_ENTRIES = 8
+    PREFETCH_MAX_DOCUMENTS = 8
+
+    # Vector store backend: 'faiss' (local index directories) or 'pinecone'
+    # (one namespace per document on the index at PINECONE_INDEX_HOST)
+    VECTOR_STORE_BACKEND = os.environ.get('VECTOR_STORE_BACKEND', 'faiss')
+    FAISS_STORAGE_PATH = "instance/faiss_indexes"
+    PINECONE_API_KEY = os.environ.get('PINECONE_API_KEY')
+    PINECONE_INDEX_HOST = os.environ.get('PINECONE_INDEX_HOST')
+    # Vectors per upsert request, upsert requests in flight, and retries per request
+    PINECONE_UPSERT_BATCH_SIZE = 100
+    PINECONE_UPSERT_WORKERS = 4
+    PINECONE_MAX_RETRIES = 5
+    PINECONE_TIMEOUT_SECONDS = 30
+
+    # Multi-node: built indexes and uploads are published as zstd-compressed,
+    # checksummed artifacts under SHARED_STORAGE_PATH (a directory every node
+    # mounts); FAISS_STORAGE_PATH then acts as this node's size-bounded cache,
+    # re-checked against the shared version at most every few seconds per document
+    SHARED_STORAGE_PATH = os.environ.get('SHARED_STORAGE_PATH')
+    NODE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+    SHARED_VERSION_CHECK_SECONDS = 5.0
+    ARTIFACT_COMPRESSION_LEVEL = 3
+
+    # Query embeddings from concurrent turns are encoded together: a batch closes
+    # after EMBED_BATCH_MAX_WAIT_MS or at EMBED_BATCH_MAX_SIZE texts (0 wait disables)
+    EMBED_BATCH_MAX_SIZE = 32
+    EMBED_BATCH_MAX_WAIT_MS = 5.0
+
+    # Embedding model new uploads are indexed with (see embedding_models.MODELS).
+    # Existing documents keep theirs until moved with 'flask rag reembed' or
+    # POST /admin/embeddings/migrate, which rate-limits to this many chunks/s (0: none)
+    EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    EMBEDDING_MIGRATION_MAX_CHUNKS_PER_SECOND = 200
+    EMBEDDING_MIGRATION_PAUSE_SECONDS = 0.0
+
+    # Build a section-then-document summary of each upload (extra Gemini calls on
+    # the uploader's key) so "summarize this"-style questions skip vector search
+    DOCUMENT_SUMMARIES = os.environ.get('DOCUMENT_SUMMARIES', 'false').lower() in ('1', 'true', 'yes')
+
+    # A question naming pages ("what do pages 10-20 say about...") only searches those
+    # pages, unless nothing there matches; an explicit page range always applies
+    QUESTION_PAGE_FILTERS = True
+
+    # Chunking: 'token' splits in the embedding model's tokens (MiniLM reads at most 256),
+    # 'recursive' keeps the original 500/50-character splitter
+    TEXT_SPLITTER = 'token'
+    CHUNK_TOKENS = 128
+    CHUNK_OVERLAP_TOKENS = 12
+    # Small-to-big retrieval: chunks are cut from PARENT_CHUNK_TOKENS sections (0: off;
+    # 'recursive' cuts sections of about four characters a token), and the prompt gets
+    # the sections of the best chunks, each once, up to CONTEXT_BUDGET_CHARS, instead
+    # of the first 40 chunks
+    PARENT_CHUNK_TOKENS = 512
+    CONTEXT_BUDGET_CHARS = 12000
+
+    # Near-duplicate chunks (MinHash/LSH against the uploader's and the global documents)
+    # are embedded and stored once as shared chunks that each document references,
+    # instead of filling every document's index and the prompt with the same boilerplate
+    NEAR_DUPLICATE_DEDUP = True
+    NEAR_DUPLICATE_THRESHOLD = 0.8
+
+    # Batch question answering (POST /chat/api/batch, 'flask qa batch'): questions per
+    # request and the most Gemini calls one batch may have in flight (each call also
+    # takes one of the user's SCHEDULER_PER_USER_CONCURRENCY slots)
+    BATCH_QA_MAX_QUESTIONS = 500
+    BATCH_QA_MAX_CONCURRENCY = 8
@@ -1,6 +1,13 @@
 from flask_wtf import FlaskForm
-from wtforms import SelectField, SubmitField
+from wtforms import SelectField, SubmitField, StringField, IntegerField
+from wtforms.validators import Optional, Length, NumberRange
 
 class RoleChangeForm(FlaskForm):
     role = SelectField('Role', choices=[('user', 'User'), ('admin', 'Admin')])
     submit = SubmitField('Save')
+
+class ProfileArmForm(FlaskForm):
+    route = StringField('Route (endpoint like chat.api_chat, or a path prefix like /chat/)', validators=[Optional(), Length(max=200)])
+    email = StringField('User email', validators=[Optional(), Length(max=255)])
+    count = IntegerField('Requests', default=5, validators=[NumberRange(min=1, max=100)])
+    submit = SubmitField('Profile next requests')
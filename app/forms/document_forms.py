@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileRequired, FileAllowed
+from flask_wtf.file import FileField, MultipleFileField, FileRequired, FileAllowed
 from wtforms import SubmitField, BooleanField
 
 class UploadDocumentForm(FlaskForm):
@@ -9,3 +9,17 @@ class UploadDocumentForm(FlaskForm):
     ])
     is_global = BooleanField('Make this document Global (visible to everyone)')
     submit = SubmitField('Upload Document')
+
+class BulkUploadDocumentsForm(FlaskForm):
+    documents = MultipleFileField('Select Documents or .zip Archives (PDF, TXT, DOCX, ZIP)', validators=[
+        FileRequired(),
+        FileAllowed(['pdf', 'txt', 'docx', 'zip'], 'Only PDF, TXT, DOCX and ZIP files are allowed.')
+    ])
+    is_global = BooleanField('Make these documents Global (visible to everyone)')
+    submit = SubmitField('Upload All')
+
+class ReplaceDocumentForm(FlaskForm):
+    document = FileField('Replace with a new version', validators=[
+        FileRequired(),
+        FileAllowed(['pdf', 'txt', 'docx'], 'Only PDF, TXT, and DOCX files are allowed.')
+    ])
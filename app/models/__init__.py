@@ -1,3 +1,5 @@
 from app.models.user import User
 from app.models.document import Document
 from app.models.conversation import Conversation, ChatMessage
+from app.models.chunk import SharedChunk, ChunkReference, ChunkFingerprint, ChunkLshBand, ParentSection
+from app.models.embedding_migration import EmbeddingMigration
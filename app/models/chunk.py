@@ -0,0 +1,67 @@
+from app.extensions import db
+from datetime import datetime
+
+# Near-duplicate chunk bookkeeping (see app.services.dedup_service).
+# scope is 'global' or 'user:<id>': a chunk is only matched against chunks its
+# document's readers can already see. model_key is the embedding model and version
+# (app.services.embedding_models) the rows belong to: chunks only match, and
+# documents only reference, shared chunks embedded with the document's own model.
+
+class SharedChunk(db.Model):
+    """One stored copy of a chunk that appears in several documents.
+    Documents that contain it hold a ChunkReference instead of their own vector."""
+    __tablename__ = 'shared_chunks'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(40), nullable=False)
+    model_key = db.Column(db.String(120), nullable=False, server_default='all-MiniLM-L6-v2@1')
+    text = db.Column(db.Text, nullable=False)
+    # float32 embedding, same model as the document indexes
+    embedding = db.Column(db.LargeBinary, nullable=False)
+    # The indexed chunk this first matched; a query over that document already covers it
+    origin_document_id = db.Column(db.Integer, nullable=True)
+    origin_chunk_id = db.Column(db.String(80), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChunkReference(db.Model):
+    __tablename__ = 'chunk_references'
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False, index=True)
+    shared_chunk_id = db.Column(db.Integer, db.ForeignKey('shared_chunks.id'), nullable=False, index=True)
+    model_key = db.Column(db.String(120), nullable=False, server_default='all-MiniLM-L6-v2@1')
+    # The referencing document's own chunk metadata (source, page, offsets)
+    chunk_metadata = db.Column(db.JSON, nullable=True)
+
+class ChunkFingerprint(db.Model):
+    """MinHash signature of an indexed chunk (document_id/chunk_id) or a shared chunk."""
+    __tablename__ = 'chunk_fingerprints'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(40), nullable=False)
+    model_key = db.Column(db.String(120), nullable=False, server_default='all-MiniLM-L6-v2@1')
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=True, index=True)
+    chunk_id = db.Column(db.String(80), nullable=True)
+    shared_chunk_id = db.Column(db.Integer, db.ForeignKey('shared_chunks.id'), nullable=True, index=True)
+    signature = db.Column(db.LargeBinary, nullable=False)
+
+class ChunkLshBand(db.Model):
+    """One LSH band hash of a fingerprint; chunks sharing any band are candidates."""
+    __tablename__ = 'chunk_lsh_bands'
+    fingerprint_id = db.Column(db.Integer, db.ForeignKey('chunk_fingerprints.id'), primary_key=True)
+    band_key = db.Column(db.BigInteger, primary_key=True, index=True)
+
+class ParentSection(db.Model):
+    """A larger section of a document (small-to-big retrieval, see
+    app.services.parent_sections). The document's indexed chunks are cut from
+    these and carry the parent_id of theirs; retrieval matches the small chunks
+    and puts their sections in the prompt."""
+    __tablename__ = 'parent_sections'
+    __table_args__ = (
+        db.Index('ix_parent_sections_lookup', 'document_id', 'model_key', 'parent_id', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    model_key = db.Column(db.String(120), nullable=False)
+    # Content hash and occurrence, like the chunk ids of the indexes
+    parent_id = db.Column(db.String(80), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    # The section's loader metadata (source, page) and offsets within the page
+    section_metadata = db.Column(db.JSON, nullable=True)
@@ -3,6 +3,10 @@ from datetime import datetime
 
 class Conversation(db.Model):
     __tablename__ = 'conversations'
+    # Backs the keyset-paginated sidebar (newest first per user)
+    __table_args__ = (
+        db.Index('ix_conversations_user_created', 'user_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     # JSON list of document IDs this conversation is querying
@@ -24,6 +28,10 @@ class Conversation(db.Model):
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    # Backs keyset-paginated message history and the recent-history lookup
+    __table_args__ = (
+        db.Index('ix_chat_messages_conversation_created', 'conversation_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer,
                                  db.ForeignKey('conversations.id'),
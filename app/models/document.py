@@ -16,6 +16,27 @@ class Document(db.Model):
     pinecone_namespace = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Bumped each time the file is replaced in place (same id, same index)
+    version = db.Column(db.Integer, default=1, nullable=False, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=True)
+    # Built at ingest when DOCUMENT_SUMMARIES is on; the chat router answers
+    # document-level questions from these instead of vector search
+    summary = db.Column(db.Text, nullable=True)
+    section_summaries = db.Column(db.JSON, nullable=True)
+    # Embedding model (see app.services.embedding_models) that built the index;
+    # queries embed with the same one
+    embedding_model = db.Column(db.String(100), nullable=False, default='all-MiniLM-L6-v2', server_default='all-MiniLM-L6-v2')
+    embedding_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    def set_embedding_model(self, model):
+        self.embedding_model = model.name
+        self.embedding_version = model.version
+
+    def set_summary(self, summary):
+        """Store a summary_service.build_summary result; None keeps the current one."""
+        if summary:
+            self.summary = summary['document']
+            self.section_summaries = summary['sections']
 
     def to_dict(self):
         return {
@@ -25,5 +46,9 @@ class Document(db.Model):
             'is_global': self.is_global,
             'chunk_count': self.chunk_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'summary': self.summary,
+            'embedding_model': f"{self.embedding_model}@{self.embedding_version}"
         }
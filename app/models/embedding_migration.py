@@ -0,0 +1,44 @@
+from app.extensions import db
+from datetime import datetime
+
+class EmbeddingMigration(db.Model):
+    """Progress of one run re-embedding documents to another embedding model
+    (see app.services.embedding_migration)."""
+    __tablename__ = 'embedding_migrations'
+    id = db.Column(db.Integer, primary_key=True)
+    model = db.Column(db.String(100), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    # running, done, failed, cancelled or interrupted (its process went away)
+    status = db.Column(db.String(20), nullable=False, default='running')
+    total_documents = db.Column(db.Integer, nullable=False, default=0)
+    migrated_documents = db.Column(db.Integer, nullable=False, default=0)
+    failed_documents = db.Column(db.Integer, nullable=False, default=0)
+    skipped_documents = db.Column(db.Integer, nullable=False, default=0)
+    embedded_chunks = db.Column(db.Integer, nullable=False, default=0)
+    current_document_id = db.Column(db.Integer, nullable=True)
+    max_chunks_per_second = db.Column(db.Float, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Touched after every document; a running row that stops updating was interrupted
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        done = self.migrated_documents + self.failed_documents + self.skipped_documents
+        return {
+            'id': self.id,
+            'model': f"{self.model}@{self.version}",
+            'status': self.status,
+            'total_documents': self.total_documents,
+            'migrated_documents': self.migrated_documents,
+            'failed_documents': self.failed_documents,
+            'skipped_documents': self.skipped_documents,
+            'embedded_chunks': self.embedded_chunks,
+            'progress': round(done / self.total_documents, 4) if self.total_documents else 1.0,
+            'current_document_id': self.current_document_id,
+            'max_chunks_per_second': self.max_chunks_per_second,
+            'last_error': self.last_error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
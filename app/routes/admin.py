@@ -1,9 +1,14 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, Response, current_app, send_file, abort
 from flask_login import login_required, current_user
 from functools import wraps
-from app.extensions import db
+from app.extensions import db, csrf
 from app.models.user import User
-from app.forms.admin_forms import RoleChangeForm
+from app.forms.admin_forms import RoleChangeForm, ProfileArmForm
+from app.models.document import Document
+from app.models.embedding_migration import EmbeddingMigration
+from app.services import embedding_models, embedding_migration
+from app.services.metrics import render_latest, CONTENT_TYPE_LATEST
+from app.services.profiler import profiler
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -72,3 +77,126 @@ def toggle_status(id):
     status_str = "enabled" if user.is_active else "disabled"
     flash(f"User {user.email} has been {status_str}.", "success")
     return redirect(url_for('admin.users'))
+
+@admin_bp.route('/metrics', methods=['GET'])
+@login_required
+@role_required('admin')
+def metrics():
+    return Response(render_latest(), content_type=CONTENT_TYPE_LATEST)
+
+@admin_bp.route('/embeddings', methods=['GET'])
+@login_required
+@role_required('admin')
+def embeddings():
+    """Registered embedding models, documents per model and recent migrations."""
+    counts = db.session.query(
+        Document.embedding_model, Document.embedding_version, db.func.count(Document.id)
+    ).filter(Document.is_active == True).group_by(Document.embedding_model, Document.embedding_version).all()
+    migrations = EmbeddingMigration.query.order_by(EmbeddingMigration.id.desc()).limit(10).all()
+    return {
+        'current': embedding_models.current().key,
+        'models': [{'key': m.key, 'hub_id': m.hub_id, 'dimension': m.dimension}
+                   for m in embedding_models.MODELS],
+        'documents': {f"{name}@{version}": n for name, version, n in counts},
+        'migrations': [m.to_dict() for m in migrations],
+    }
+
+def _check_api_csrf():
+    """The JSON endpoints are exempt from the global CSRF check, which wants a form
+    token; a JSON body can't be sent cross-site without a CORS preflight, anything
+    else still needs the token (X-CSRFToken works)."""
+    if not request.is_json and current_app.config.get('WTF_CSRF_ENABLED', True):
+        csrf.protect()
+
+@admin_bp.route('/embeddings/migrate', methods=['POST'])
+@csrf.exempt
+@login_required
+@role_required('admin')
+def start_embedding_migration():
+    """Start re-embedding {"model": name, "version": n, "document_ids": [...]} in the background."""
+    _check_api_csrf()
+    payload = request.get_json(silent=True)
+    if payload is None:
+        payload = {}
+    if not isinstance(payload, dict):
+        return {"error": "The request body must be a JSON object"}, 400
+    try:
+        target, document_ids, max_chunks_per_second = embedding_migration.parse_request(
+            payload, current_app.config['EMBEDDING_MIGRATION_MAX_CHUNKS_PER_SECOND']
+        )
+        migration = embedding_migration.create_migration(target, document_ids, max_chunks_per_second)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    embedding_migration.start_migration(
+        current_app._get_current_object(), migration.id,
+        current_app.config['EMBEDDING_MIGRATION_PAUSE_SECONDS'], document_ids
+    )
+    return migration.to_dict(), 202
+
+@admin_bp.route('/embeddings/<int:id>/cancel', methods=['POST'])
+@csrf.exempt
+@login_required
+@role_required('admin')
+def cancel_embedding_migration(id):
+    _check_api_csrf()
+    if not embedding_migration.cancel_migration(id):
+        return {"error": f"Migration #{id} is not running."}, 409
+    return EmbeddingMigration.query.get_or_404(id).to_dict()
+
+@admin_bp.route('/profiles', methods=['GET'])
+@login_required
+@role_required('admin')
+def profiles():
+    return render_template('admin/profiles.html',
+                            form=ProfileArmForm(),
+                            trigger=profiler.armed(),
+                            profiles=profiler.list_profiles())
+
+@admin_bp.route('/profiles/arm', methods=['POST'])
+@login_required
+@role_required('admin')
+def arm_profiler():
+    form = ProfileArmForm()
+    if not form.validate_on_submit():
+        flash("Invalid profiling request.", "danger")
+        return redirect(url_for('admin.profiles'))
+
+    user = None
+    if form.email.data:
+        user = User.query.filter_by(email=form.email.data.strip()).first()
+        if user is None:
+            flash(f"No user with email {form.email.data}.", "danger")
+            return redirect(url_for('admin.profiles'))
+    route = (form.route.data or '').strip() or None
+    if route and not route.startswith('/') and route not in current_app.view_functions:
+        flash(f"Unknown endpoint {route}.", "danger")
+        return redirect(url_for('admin.profiles'))
+
+    profiler.arm(route, user.id if user else None, user.email if user else None, form.count.data)
+    flash(f"Profiling the next {form.count.data} matching request(s).", "success")
+    return redirect(url_for('admin.profiles'))
+
+@admin_bp.route('/profiles/disarm', methods=['POST'])
+@login_required
+@role_required('admin')
+def disarm_profiler():
+    profiler.disarm()
+    flash("Profiling stopped.", "success")
+    return redirect(url_for('admin.profiles'))
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@login_required
+@role_required('admin')
+def download_profile(profile_id):
+    path = profiler.profile_path(profile_id)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=f"{profile_id}.folded")
+
+@admin_bp.route('/profiles/<profile_id>/delete', methods=['POST'])
+@login_required
+@role_required('admin')
+def delete_profile(profile_id):
+    if profiler.delete(profile_id):
+        flash("Profile deleted.", "success")
+    return redirect(url_for('admin.profiles'))
@@ -1,12 +1,98 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
-from app.extensions import db
+from app.extensions import db, csrf
 from app.models.document import Document
 from app.models.conversation import Conversation, ChatMessage
-from app.services.rag_service import query_documents
+from app.services.rag_service import query_documents, prefetch_documents
+from app.services.summary_service import is_document_level, document_summaries
+from app.services.scheduler import llm_scheduler, AdmissionRejected
+from app.services import batch_qa, retrieval_filter
+from app.services.write_behind import write_behind
+from sqlalchemy import and_, or_
+from datetime import datetime
+import base64
+import json
 
 chat_bp = Blueprint('chat', __name__)
 
+CONVERSATIONS_PAGE_SIZE = 30
+MESSAGES_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+# query_documents only puts the last few turns in the prompt
+HISTORY_MESSAGES = 6
+
+def _encode_cursor(row):
+    raw = f"{row.created_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    """Return (created_at, id) for a cursor from _encode_cursor, or None if malformed."""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeError):
+        return None
+
+def _keyset_page(query, model, cursor, limit):
+    """Newest-first page of query strictly older than cursor, seeking on (created_at, id)
+    so page cost doesn't grow with how far back the user has scrolled.
+    Returns (rows, next_cursor_or_None)."""
+    if cursor is not None:
+        created_at, row_id = cursor
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _page_args(default_limit):
+    cursor = request.args.get('before')
+    decoded = None
+    if cursor:
+        decoded = _decode_cursor(cursor)
+        if decoded is None:
+            return None, None
+    limit = min(max(request.args.get('limit', default_limit, type=int), 1), MAX_PAGE_SIZE)
+    return decoded, limit
+
+def _document_summaries(document_ids, content):
+    """Summaries for rag_service's query router, only looked up for document-level questions."""
+    if not is_document_level(content):
+        return None
+    return document_summaries(document_ids)
+
+def _retrieval_filter(payload, document_ids):
+    """retrieval_filter.parse of a request's 'pages', 'sources' and 'document_ids' filter
+    fields against the turn's documents. Raises ValueError."""
+    documents = dict(
+        db.session.query(Document.id, Document.original_filename).filter(Document.id.in_(document_ids)).all()
+    )
+    return retrieval_filter.parse(payload, documents)
+
+def _form_filter(document_ids):
+    return _retrieval_filter({
+        'pages': request.form.get('pages', ''),
+        'sources': request.form.getlist('sources'),
+        'document_ids': request.form.getlist('filter_document_ids'),
+    }, document_ids)
+
+def _recent_history(conversation_id):
+    """The last HISTORY_MESSAGES messages, oldest first, as dicts. Includes messages
+    still queued in write_behind (the previous turn's answer may not be committed yet)."""
+    rows = ChatMessage.query.filter_by(conversation_id=conversation_id).order_by(
+        ChatMessage.created_at.desc(), ChatMessage.id.desc()
+    ).limit(HISTORY_MESSAGES).all()
+    history = [msg.to_dict() for msg in reversed(rows)]
+    # A message committed between the two reads shows up in both
+    seen = {(msg['created_at'], msg['role'], msg['content']) for msg in history}
+    history += [
+        msg for msg in write_behind.pending_messages(conversation_id)
+        if (msg['created_at'], msg['role'], msg['content']) not in seen
+    ]
+    return history[-HISTORY_MESSAGES:]
+
 @chat_bp.route('/', methods=['GET'])
 @login_required
 def index():
@@ -22,14 +108,30 @@ def index():
             flash("You don't have permission to access that conversation.", "danger")
             return redirect(url_for('chat.index'))
             
-        all_conversations = Conversation.query.filter_by(user_id=current_user.id).order_by(Conversation.created_at.desc()).all()
+        # Start loading this conversation's indexes while the page renders and the user types
+        prefetch_documents(conversation.document_ids)
+        # Messages of the last turn may still be queued
+        write_behind.flush()
+
+        # Only the newest page of each list is rendered; chat.js pages in the rest on demand
+        conversations, conversations_cursor = _keyset_page(
+            Conversation.query.filter_by(user_id=current_user.id), Conversation, None, CONVERSATIONS_PAGE_SIZE
+        )
+        messages, messages_cursor = _keyset_page(
+            ChatMessage.query.filter_by(conversation_id=conversation.id), ChatMessage, None, MESSAGES_PAGE_SIZE
+        )
+        messages.reverse()  # Fetched newest-first, displayed oldest-first
+
         # To show names of queried documents
         queried_docs = Document.query.filter(Document.id.in_(conversation.document_ids)).all()
         doc_names = ", ".join([d.original_filename for d in queried_docs])
         
         return render_template('chat/index.html', 
                                active_conversation=conversation, 
-                               all_conversations=all_conversations,
+                               all_conversations=conversations,
+                               conversations_cursor=conversations_cursor,
+                               messages=messages,
+                               messages_cursor=messages_cursor,
                                doc_names=doc_names)
                                
     # If no conversation_id, show document selection
@@ -70,6 +172,8 @@ def start():
     )
     db.session.add(conversation)
     db.session.commit()
+
+    prefetch_documents(doc_ids)
     
     return redirect(url_for('chat.index', conversation_id=conversation.id))
 
@@ -90,33 +194,31 @@ def message():
         flash("Unauthorized action.", "danger")
         return redirect(url_for('chat.index'))
 
-    # Save user message
-    user_msg = ChatMessage(
-        conversation_id=conversation.id,
-        role='user',
-        content=content
-    )
-    db.session.add(user_msg)
-    db.session.commit()
-    
-    history = [msg.to_dict() for msg in conversation.messages[:-1]] # Exclude the one just added
-    
     try:
-        answer, sources = query_documents(
-            content, 
-            conversation.document_ids, 
-            history, 
-            current_user.gemini_api_key
-        )
-        
-        bot_msg = ChatMessage(
-            conversation_id=conversation.id,
-            role='assistant',
-            content=answer,
-            sources=list(sources)
-        )
-        db.session.add(bot_msg)
-        db.session.commit()
+        search_filter = _form_filter(conversation.document_ids)
+    except ValueError as e:
+        flash(str(e), "warning")
+        return redirect(url_for('chat.index', conversation_id=conversation.id))
+
+    history = _recent_history(conversation.id)
+
+    try:
+        with llm_scheduler.slot(current_user.id):
+            answer, sources = query_documents(
+                content, 
+                conversation.document_ids, 
+                history, 
+                current_user.gemini_api_key,
+                summaries=_document_summaries(conversation.document_ids, content),
+                retrieval_filter=search_filter
+            )
+
+        # Save the turn only once it is answered, so a 429 or an error leaves nothing
+        # unanswered behind (committed by the write-behind queue; chat.index flushes it)
+        write_behind.add_message(conversation.id, 'user', content)
+        write_behind.add_message(conversation.id, 'assistant', answer, list(sources))
+    except AdmissionRejected as e:
+        return render_template('errors/429.html', message=str(e)), 429, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         print(f">>>> ERROR IN CHAT MESSAGE: {str(e)}")
         import traceback
@@ -125,8 +227,8 @@ def message():
         
     return redirect(url_for('chat.index', conversation_id=conversation.id))
 
-from flask import Response
-import json
+from flask import Response, current_app
+from app.services.stream_buffer import stream_registry, sse_body
 
 @chat_bp.route('/stream', methods=['POST'])
 @login_required
@@ -141,60 +243,144 @@ def stream():
     if conversation.user_id != current_user.id:
         return {"error": "Unauthorized"}, 403
 
-    # Save user message immediately
-    user_msg = ChatMessage(
-        conversation_id=conversation.id,
-        role='user',
-        content=content
+    try:
+        search_filter = _form_filter(conversation.document_ids)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    history = _recent_history(conversation.id)
+
+    # Extract everything the generation needs up front: it runs on its own thread,
+    # outside this request, so it survives the browser connection dropping
+    api_key = current_user.gemini_api_key
+    user_id = current_user.id
+    conversation_id = conversation.id
+    document_ids = list(conversation.document_ids)
+    summaries = _document_summaries(document_ids, content)
+
+    def produce():
+        from app.services.rag_service import query_documents_stream
+        # Queue for an LLM slot on the generation thread; a rejection becomes an SSE error event
+        with llm_scheduler.slot(user_id):
+            # Saved only once admitted, so a rejected turn leaves no unanswered message.
+            # Queued rather than committed: retrieval and the first token don't wait on the database lock
+            write_behind.add_message(conversation_id, 'user', content)
+            yield from query_documents_stream(content, document_ids, history, api_key, summaries, search_filter)
+
+    def save_answer(answer, sources):
+        # Save the bot message once the generation finishes (or is abandoned part-way)
+        write_behind.add_message(conversation_id, 'assistant', answer, list(sources))
+
+    generation = stream_registry.start(
+        current_app._get_current_object(), user_id, conversation_id, produce, save_answer
     )
-    db.session.add(user_msg)
-    db.session.commit()
-    
-    history = [msg.to_dict() for msg in conversation.messages[:-1]]
+    return _sse_response(generation, 0)
+
+@chat_bp.route('/stream/<stream_id>', methods=['GET'])
+@login_required
+def resume_stream(stream_id):
+    generation = stream_registry.get(stream_id, current_user.id)
+    if generation is None:
+        return {"error": "Stream not found or expired"}, 404
+
+    # EventSource sends Last-Event-ID itself; fetch() based clients may use the query string
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', 0, type=int)
+    return _sse_response(generation, last_event_id)
+
+def _sse_response(generation, last_event_id):
+    gzip = stream_registry.compression and 'gzip' in request.accept_encodings
+    body = sse_body(generation, last_event_id, stream_registry.heartbeat_seconds, gzip=gzip)
+
+    response = Response(body, mimetype='text/event-stream')
+    response.headers['X-Stream-Id'] = generation.stream_id
+    response.headers['Cache-Control'] = 'no-cache'
+    # Ask nginx-style proxies not to buffer the stream (that would undo the flush policy)
+    response.headers['X-Accel-Buffering'] = 'no'
+    if stream_registry.compression:
+        response.headers['Vary'] = 'Accept-Encoding'
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@chat_bp.route('/api/batch', methods=['POST'])
+@csrf.exempt
+@login_required
+def api_batch():
+    """Answer {"document_ids": [...], "questions": [...], "concurrency": n} as NDJSON:
+    one line per question as it finishes, then a summary line. Nothing is saved
+    to a conversation. An optional "filters": {"pages": "10-20", "sources": [...],
+    "document_ids": [...]} restricts retrieval for every question.
+
+    The global CSRF check wants a form token, which a JSON client doesn't have.
+    A JSON body can't be sent cross-site without a CORS preflight, so it is
+    accepted as is; anything else still needs the token (X-CSRFToken works)."""
+    if not request.is_json and current_app.config.get('WTF_CSRF_ENABLED', True):
+        csrf.protect()
+    if not current_user.has_api_key():
+        return {"error": "Add your Gemini API key in Settings first."}, 400
+    payload = request.get_json(silent=True) or {}
+    try:
+        questions, document_ids, concurrency = batch_qa.parse_request(
+            payload,
+            max_questions=current_app.config['BATCH_QA_MAX_QUESTIONS'],
+            max_concurrency=current_app.config['BATCH_QA_MAX_CONCURRENCY']
+        )
+        batch_qa.check_access(current_user.id, document_ids)
+        search_filter = _retrieval_filter(payload.get('filters') or {}, document_ids)
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
-    # Extract api key before generator starts (since generator loses request context in some WSGI servers)
+    # Everything the batch needs is read here; the response body is produced after this request's context is gone
     api_key = current_user.gemini_api_key
     user_id = current_user.id
-    from flask import current_app, copy_current_request_context
-    app_context = current_app.app_context()
-    
-    @copy_current_request_context
+    summaries = batch_qa.batch_summaries(questions, document_ids)
+
     def generate():
-        with app_context:
-            full_answer = ""
-            final_sources = []
-            try:
-                from app.services.rag_service import query_documents_stream
-                
-                for chunk_content, sources in query_documents_stream(
-                    content, 
-                    conversation.document_ids, 
-                    history, 
-                    api_key
-                ):
-                    final_sources = sources
-                    if chunk_content:
-                        full_answer += chunk_content
-                        # Send SSE payload
-                        yield f"data: {json.dumps({'chunk': chunk_content})}\n\n"
-                
-                # Save the final bot message to DB once stream finishes
-                bot_msg = ChatMessage(
-                    conversation_id=conversation.id,
-                    role='assistant',
-                    content=full_answer,
-                    sources=list(final_sources)
-                )
-                db.session.add(bot_msg)
-                db.session.commit()
-                
-                yield f"data: {json.dumps({'sources': list(final_sources), 'done': True})}\n\n"
-                
-            except Exception as e:
-                print(f">>>> ERROR IN CHAT STREAM: {str(e)}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
-    return Response(generate(), mimetype='text/event-stream')
+        for item in batch_qa.run_batch(questions, document_ids, api_key, user_id, concurrency, summaries,
+                                       search_filter):
+            yield json.dumps(item) + "\n"
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@chat_bp.route('/api/conversations', methods=['GET'])
+@login_required
+def api_conversations():
+    cursor, limit = _page_args(CONVERSATIONS_PAGE_SIZE)
+    if limit is None:
+        return {"error": "Invalid cursor"}, 400
+
+    rows, next_cursor = _keyset_page(
+        Conversation.query.filter_by(user_id=current_user.id), Conversation, cursor, limit
+    )
+    items = []
+    for conv in rows:
+        item = conv.to_dict()
+        item['url'] = url_for('chat.index', conversation_id=conv.id)
+        item['delete_url'] = url_for('chat.delete', conversation_id=conv.id)
+        items.append(item)
+    return {"items": items, "next_cursor": next_cursor}
+
+@chat_bp.route('/api/conversations/<int:conversation_id>/messages', methods=['GET'])
+@login_required
+def api_messages(conversation_id):
+    conversation = Conversation.query.get_or_404(conversation_id)
+    if conversation.user_id != current_user.id:
+        return {"error": "Unauthorized"}, 403
+
+    cursor, limit = _page_args(MESSAGES_PAGE_SIZE)
+    if limit is None:
+        return {"error": "Invalid cursor"}, 400
+
+    write_behind.flush()
+    rows, next_cursor = _keyset_page(
+        ChatMessage.query.filter_by(conversation_id=conversation.id), ChatMessage, cursor, limit
+    )
+    # Newest first; the client prepends them above what it already shows
+    return {"items": [msg.to_dict() for msg in rows], "next_cursor": next_cursor}
 
 @chat_bp.route('/new', methods=['POST'])
 @login_required
@@ -210,6 +396,9 @@ def delete(conversation_id):
         return redirect(url_for('chat.index'))
     
     # Delete associated messages manually because cascade is not set up
+    # (after committing any still queued; the queue drops those that come later,
+    # like the answer of a stream still running)
+    write_behind.flush()
     ChatMessage.query.filter_by(conversation_id=conversation.id).delete()
     
     db.session.delete(conversation)
@@ -1,12 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, current_app, request
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
 import uuid
-from app.extensions import db
+from datetime import datetime
+from app.extensions import db, csrf
 from app.models.document import Document
-from app.forms.document_forms import UploadDocumentForm
-from app.services.rag_service import ingest_document, delete_document_vectors
+from app.forms.document_forms import UploadDocumentForm, BulkUploadDocumentsForm, ReplaceDocumentForm
+from app.services.rag_service import ingest_document, reingest_document, delete_document_vectors, delete_upload
+from app.services.bulk_ingest import save_uploads, start_bulk_ingest
+from app.services import embedding_models
 
 documents_bp = Blueprint('documents', __name__)
 
@@ -14,6 +17,7 @@ documents_bp = Blueprint('documents', __name__)
 @login_required
 def manage():
     form = UploadDocumentForm()
+    bulk_form = BulkUploadDocumentsForm(prefix='bulk')
     
     my_documents = Document.query.filter_by(owner_id=current_user.id, is_active=True).order_by(Document.created_at.desc()).all()
     global_documents = []
@@ -23,6 +27,7 @@ def manage():
         
     return render_template('documents/manage.html', 
                             form=form, 
+                            bulk_form=bulk_form,
                             my_documents=my_documents, 
                             global_documents=global_documents)
 
@@ -44,6 +49,7 @@ def upload():
         file.save(file_path)
 
         is_global = form.is_global.data
+        model = embedding_models.current()
         
         doc = Document(
             original_filename=original_filename,
@@ -54,16 +60,20 @@ def upload():
             is_global=is_global,
             pinecone_namespace=None
         )
+        doc.set_embedding_model(model)
         db.session.add(doc)
         db.session.commit()
         
-        doc.pinecone_namespace = str(doc.id)
+        doc.pinecone_namespace = str(embedding_models.index_key(doc.id, model))
         db.session.commit()
 
         try:
-            chunks_created = ingest_document(file_path, doc.id, ext, current_user.gemini_api_key)
+            chunks_created, summary = ingest_document(
+                file_path, doc.id, ext, current_user.gemini_api_key, with_summary=True, model=model
+            )
             doc.status = 'ready'
             doc.chunk_count = chunks_created
+            doc.set_summary(summary)
         except Exception as e:
             doc.status = 'failed'
             flash(f"Error processing document: {str(e)}", "danger")
@@ -78,6 +88,157 @@ def upload():
             
     return redirect(url_for('documents.manage'))
 
+@documents_bp.route('/upload/bulk', methods=['POST'])
+@csrf.exempt
+@login_required
+def upload_bulk():
+    # A batch is bigger than a single document; lift the request limit before the form
+    # is parsed. The global CSRF check would parse it under MAX_CONTENT_LENGTH first,
+    # so the view is exempt from it and runs the same check itself once the limit is up.
+    request.max_content_length = current_app.config['BULK_UPLOAD_MAX_CONTENT_LENGTH']
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        csrf.protect()
+    form = BulkUploadDocumentsForm(prefix='bulk')
+    if not form.validate_on_submit():
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(error, "danger")
+        return redirect(url_for('documents.manage'))
+
+    if not current_user.has_api_key():
+        flash("You need a Gemini API key to upload and process documents. Add your key in Settings.", "warning")
+        return redirect(url_for('profile.settings'))
+
+    uploaded, skipped = save_uploads(
+        form.documents.data,
+        current_app.config['UPLOAD_FOLDER'],
+        current_app.config['MAX_CONTENT_LENGTH'],
+        current_app.config['BULK_UPLOAD_MAX_FILES']
+    )
+    if skipped:
+        flash(f"Skipped {len(skipped)} file(s): {', '.join(skipped[:10])}"
+              f"{' ...' if len(skipped) > 10 else ''}", "warning")
+    if not uploaded:
+        flash("No supported documents found in the upload.", "danger")
+        return redirect(url_for('documents.manage'))
+
+    is_global = form.is_global.data
+    # start_bulk_ingest indexes with the current model too
+    model = embedding_models.current()
+
+    # One transaction for the whole batch
+    docs = []
+    for item in uploaded:
+        doc = Document(
+            original_filename=item.original_filename,
+            stored_filename=item.stored_filename,
+            file_path=item.file_path,
+            status='processing',
+            owner_id=None if is_global else current_user.id,
+            is_global=is_global,
+            pinecone_namespace=None
+        )
+        doc.set_embedding_model(model)
+        db.session.add(doc)
+        docs.append(doc)
+    db.session.flush()
+    for doc in docs:
+        doc.pinecone_namespace = str(embedding_models.index_key(doc.id, model))
+    db.session.commit()
+
+    jobs = [(doc.id, item.file_path, item.ext, item.size) for doc, item in zip(docs, uploaded)]
+    start_bulk_ingest(
+        current_app._get_current_object(),
+        jobs,
+        current_user.gemini_api_key,
+        current_app.config['INGEST_MAX_WORKERS']
+    )
+
+    flash(f"{len(docs)} document(s) uploaded and queued for processing. Refresh to see their status.", "success")
+    return redirect(url_for('documents.manage'))
+
+@documents_bp.route('/<int:id>/replace', methods=['POST'])
+@login_required
+def replace(id):
+    doc = Document.query.get_or_404(id)
+
+    if doc.owner_id != current_user.id and current_user.role != 'admin':
+        flash('You do not have permission to replace this document.', 'danger')
+        return redirect(url_for('documents.manage'))
+    if not doc.is_active or doc.status == 'processing':
+        flash('This document cannot be replaced right now.', 'warning')
+        return redirect(url_for('documents.manage'))
+
+    form = ReplaceDocumentForm()
+    if not form.validate_on_submit():
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(error, "danger")
+        return redirect(url_for('documents.manage'))
+
+    # Claim the document in one conditional UPDATE, so a concurrent replace (or a
+    # bulk ingest, which also holds 'processing') can't sync the same index at once
+    previous_status = doc.status
+    claimed = Document.query.filter(
+        Document.id == doc.id, Document.is_active.is_(True), Document.status != 'processing'
+    ).update({'status': 'processing'}, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        flash('This document cannot be replaced right now.', 'warning')
+        return redirect(url_for('documents.manage'))
+
+    file = form.document.data
+    original_filename = secure_filename(file.filename)
+    ext = original_filename.rsplit('.', 1)[1].lower()
+
+    stored_filename = f"{uuid.uuid4().hex}.{ext}"
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], stored_filename)
+    file.save(file_path)
+
+    model = embedding_models.for_document(doc)
+    old_file_path = doc.file_path
+    try:
+        # The old index keeps serving until the updated one is swapped in
+        total, added, removed, summary = reingest_document(
+            file_path, doc.id, ext, current_user.gemini_api_key, with_summary=True, model=model
+        )
+        doc.original_filename = original_filename
+        doc.stored_filename = stored_filename
+        doc.file_path = file_path
+        doc.chunk_count = total
+        doc.status = 'ready'
+        doc.set_summary(summary)
+        doc.version = (doc.version or 1) + 1
+        doc.updated_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f">>>> ERROR REPLACING DOCUMENT {id}: {str(e)}")
+        # The failure may have come after the new index was swapped in (near-duplicate
+        # or section bookkeeping); sync it back to the old file so it matches the row
+        status = previous_status
+        try:
+            reingest_document(
+                old_file_path, id, old_file_path.rsplit('.', 1)[-1].lower(),
+                current_user.gemini_api_key, model=model
+            )
+        except Exception as restore_error:
+            print(f">>>> ERROR RESTORING INDEX OF DOCUMENT {id}: {str(restore_error)}")
+            status = 'failed'
+        doc = db.session.get(Document, id)
+        doc.status = status
+        db.session.commit()
+        delete_upload(file_path)
+        flash(f"Error processing new version: {str(e)}", "danger")
+        return redirect(url_for('documents.manage'))
+
+    if old_file_path != file_path:
+        delete_upload(old_file_path)
+
+    flash(f"Updated to version {doc.version}: {added} new chunk(s) embedded, "
+          f"{removed} removed, {total - added} reused.", "success")
+    return redirect(url_for('documents.manage'))
+
 @documents_bp.route('/<int:id>/delete', methods=['POST'])
 @login_required
 def delete(id):
@@ -88,12 +249,11 @@ def delete(id):
         return redirect(url_for('documents.manage'))
         
     try:
-        delete_document_vectors(doc.id)
+        delete_document_vectors(doc.id, embedding_models.document_index_key(doc))
     except Exception as e:
         print(f"Pinecone delete failed: {e}")
         
-    if os.path.exists(doc.file_path):
-        os.remove(doc.file_path)
+    delete_upload(doc.file_path)
         
     doc.is_active = False
     db.session.commit()
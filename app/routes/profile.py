@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user
 from app.extensions import db
 from app.forms.chat_forms import ApiKeyForm
+from app.services.llm_pool import llm_pool
 
 profile_bp = Blueprint('profile', __name__)
 
@@ -10,6 +11,8 @@ profile_bp = Blueprint('profile', __name__)
 def settings():
     form = ApiKeyForm()
     if form.validate_on_submit():
+        if current_user.gemini_api_key:
+            llm_pool.discard(current_user.gemini_api_key)
         current_user.gemini_api_key = form.gemini_api_key.data.strip()
         db.session.commit()
         flash('API key saved successfully.', 'success')
@@ -20,6 +23,8 @@ def settings():
 @profile_bp.route('/settings/key/delete', methods=['POST'])
 @login_required
 def delete_key():
+    if current_user.gemini_api_key:
+        llm_pool.discard(current_user.gemini_api_key)
     current_user.gemini_api_key = None
     db.session.commit()
     flash('API key removed successfully.', 'success')
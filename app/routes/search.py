@@ -0,0 +1,38 @@
+from flask import Blueprint, render_template, request
+from flask_login import login_required, current_user
+from sqlalchemy.exc import OperationalError
+from app.extensions import db
+from app.services import search_service
+
+search_bp = Blueprint('search', __name__)
+
+def _run_search(query, limit):
+    if not search_service.is_supported(db.session):
+        return None, "Full-text search requires SQLite with FTS5."
+    try:
+        return search_service.search(db.session, current_user.id, query, limit=limit), None
+    except OperationalError as e:
+        db.session.rollback()
+        print(f">>>> SEARCH FAILED: {str(e)}")
+        return None, "Search index is not available. Run 'flask search backfill' to build it."
+
+@search_bp.route('/', methods=['GET'])
+@login_required
+def index():
+    query = request.args.get('q', '').strip()
+    results, error = (None, None)
+    if query:
+        results, error = _run_search(query, limit=20)
+    return render_template('search/results.html', query=query, results=results, error=error)
+
+@search_bp.route('/api', methods=['GET'])
+@login_required
+def api():
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    if not query:
+        return {"error": "Missing query"}, 400
+    results, error = _run_search(query, limit)
+    if error:
+        return {"error": error}, 503
+    return {"query": query, **results}
@@ -0,0 +1,153 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.services import rag_service, summary_service
+from app.services.metrics import Counter, Histogram, QUERY_STAGE_SECONDS
+from app.services.scheduler import llm_scheduler, AdmissionRejected
+
+BATCH_QA_ITEMS = Counter(
+    'rag_batch_qa_items_total',
+    'Batch questions answered, by outcome (ok, error).',
+    ['outcome']
+)
+BATCH_QA_SECONDS = Histogram(
+    'rag_batch_qa_seconds',
+    'Wall time of whole question batches.',
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+DEFAULT_CONCURRENCY = 4
+
+
+def parse_request(payload, max_questions=None, max_concurrency=8):
+    """Validate a batch request {'questions': [...], 'document_ids': [...], 'concurrency': n}.
+    Returns (questions, document_ids, concurrency); raises ValueError with a message for the caller."""
+    questions = payload.get('questions')
+    if not isinstance(questions, list) or not questions:
+        raise ValueError("'questions' must be a non-empty list of strings")
+    if not all(isinstance(q, str) and q.strip() for q in questions):
+        raise ValueError("Every question must be a non-empty string")
+    if max_questions is not None and len(questions) > max_questions:
+        raise ValueError(f"At most {max_questions} questions per batch")
+
+    document_ids = payload.get('document_ids')
+    if not isinstance(document_ids, list) or not document_ids:
+        raise ValueError("'document_ids' must be a non-empty list of document ids")
+    try:
+        document_ids = list(dict.fromkeys(int(i) for i in document_ids))
+    except (TypeError, ValueError):
+        raise ValueError("'document_ids' must be integers")
+
+    concurrency = payload.get('concurrency', DEFAULT_CONCURRENCY)
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool):
+        raise ValueError("'concurrency' must be an integer")
+    concurrency = min(max(concurrency, 1), max_concurrency)
+    return [q.strip() for q in questions], document_ids, concurrency
+
+
+def check_access(user_id, document_ids):
+    """Raise ValueError unless every document is ready, active and visible to the user."""
+    from app.models.document import Document
+    docs = {d.id: d for d in Document.query.filter(Document.id.in_(document_ids)).all()}
+    unusable = [
+        i for i in document_ids
+        if i not in docs
+        or not docs[i].is_active
+        or docs[i].status != 'ready'
+        or (not docs[i].is_global and docs[i].owner_id != user_id)
+    ]
+    if unusable:
+        raise ValueError(f"Documents not found, not ready or not accessible: {', '.join(map(str, unusable))}")
+
+
+def batch_summaries(questions, document_ids):
+    """Summaries for the query router, only looked up if some question is document-level."""
+    if not any(summary_service.is_document_level(q) for q in questions):
+        return None
+    return summary_service.document_summaries(document_ids)
+
+
+def _rounded(timings):
+    return {k: round(v, 4) for k, v in timings.items()}
+
+
+def run_batch(questions, document_ids, api_key, user_id, concurrency=DEFAULT_CONCURRENCY, summaries=None,
+              retrieval_filter=None):
+    """Answer independent questions over the same documents.
+
+    All questions are embedded together and each document's index is searched
+    once for the whole batch (rag_service.build_batch_prompts, restricted by
+    retrieval_filter if given); then at most
+    concurrency Gemini calls run at a time. Each call holds one of user_id's
+    llm_scheduler slots, like a chat turn, so concurrency is also capped at the
+    per-user limit; a call that isn't admitted within the queue-time SLO fails
+    its question only. Yields one dict per question as it
+    finishes, in completion order ('index' is its position in questions):
+        {'index', 'question', 'answer', 'sources', 'timings'} or {'index', 'question', 'error', 'timings'}
+    ('retry_after' too when the question was shed by the scheduler),
+    where timings has the batch-wide 'embed' and 'retrieval' phases and the
+    question's own 'queue' (including the wait for a slot), 'llm' and 'total'
+    (since the batch started), in seconds.
+    Ends with {'done': True, 'questions', 'ok', 'errors', 'timings'}; a batch that
+    fails before any LLM call ends with {'done': True, 'error'} instead.
+    """
+    started = time.perf_counter()
+    try:
+        prompts, phase_timings = rag_service.build_batch_prompts(
+            questions, document_ids, summaries, retrieval_filter
+        )
+        llm = rag_service.get_llm(api_key)
+    except Exception as e:
+        print(f">>>> ERROR PREPARING QUESTION BATCH: {str(e)}")
+        yield {'done': True, 'error': str(e)}
+        return
+    prepared = time.perf_counter()
+
+    def answer(index):
+        with llm_scheduler.slot(user_id):
+            picked = time.perf_counter()
+            with QUERY_STAGE_SECONDS.time(stage='llm_total', mode='batch'):
+                response = llm.invoke(prompts[index][0])
+        return response.content, picked - prepared, time.perf_counter() - picked
+
+    ok = errors = 0
+    # More threads than the user has slots would only queue in the scheduler
+    concurrency = max(1, min(concurrency, llm_scheduler.per_user_limit))
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-qa")
+    try:
+        futures = {pool.submit(answer, n): n for n in range(len(questions))}
+        for future in as_completed(futures):
+            index = futures[future]
+            item = {'index': index, 'question': questions[index]}
+            timings = dict(phase_timings)
+            try:
+                content, timings['queue'], timings['llm'] = future.result()
+                item['answer'] = content
+                item['sources'] = list(prompts[index][1])
+                ok += 1
+                BATCH_QA_ITEMS.inc(outcome='ok')
+            except AdmissionRejected as e:
+                item['error'] = str(e)
+                item['retry_after'] = e.retry_after
+                errors += 1
+                BATCH_QA_ITEMS.inc(outcome='error')
+            except Exception as e:
+                print(f">>>> ERROR ANSWERING BATCH QUESTION {index}: {str(e)}")
+                item['error'] = str(e)
+                errors += 1
+                BATCH_QA_ITEMS.inc(outcome='error')
+            timings['total'] = time.perf_counter() - started
+            item['timings'] = _rounded(timings)
+            yield item
+    finally:
+        # The client may disconnect mid-batch; don't keep calling Gemini for nobody
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    BATCH_QA_SECONDS.observe(elapsed)
+    yield {
+        'done': True,
+        'questions': len(questions),
+        'ok': ok,
+        'errors': errors,
+        'timings': _rounded({**phase_timings, 'llm': time.perf_counter() - prepared, 'total': elapsed}),
+    }
@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from werkzeug.utils import secure_filename
+from app.services.metrics import Counter, Gauge
+
+INGEST_DOCUMENTS = Counter(
+    'rag_ingest_documents_total',
+    'Documents ingested through bulk upload, by outcome.',
+    ['status']
+)
+INGEST_BYTES = Counter(
+    'rag_ingest_bytes_total',
+    'Bytes of source files ingested through bulk upload.'
+)
+BULK_INGEST_THROUGHPUT = Gauge(
+    'rag_bulk_ingest_last_throughput',
+    'Aggregate throughput of the most recent bulk ingest batch.',
+    ['unit']
+)
+
+INGESTIBLE_EXTENSIONS = {'pdf', 'txt', 'docx'}
+_COPY_BLOCK = 64 * 1024
+
+
+class UploadedFile:
+    """A file written to the upload folder, waiting for a Document row."""
+
+    def __init__(self, original_filename, stored_filename, file_path, ext, size):
+        self.original_filename = original_filename
+        self.stored_filename = stored_filename
+        self.file_path = file_path
+        self.ext = ext
+        self.size = size
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def _copy_limited(src, file_path, max_bytes):
+    """Stream src into file_path in fixed-size blocks, refusing anything over max_bytes."""
+    copied = 0
+    with open(file_path, 'wb') as dst:
+        while True:
+            block = src.read(_COPY_BLOCK)
+            if not block:
+                break
+            copied += len(block)
+            if copied > max_bytes:
+                break
+            dst.write(block)
+    if copied > max_bytes:
+        os.remove(file_path)
+        return None
+    return copied
+
+
+def _store(src, original_filename, upload_folder, max_bytes):
+    ext = _extension(original_filename)
+    stored_filename = f"{uuid.uuid4().hex}.{ext}"
+    file_path = os.path.join(upload_folder, stored_filename)
+    size = _copy_limited(src, file_path, max_bytes)
+    if size is None:
+        return None
+    return UploadedFile(original_filename, stored_filename, file_path, ext, size)
+
+
+def _extract_archive(file_storage, upload_folder, max_bytes, limit, skipped):
+    """Stream supported members of a .zip straight to disk, one block at a time."""
+    stored = []
+    try:
+        archive = zipfile.ZipFile(file_storage.stream)
+    except zipfile.BadZipFile:
+        skipped.append(f"{file_storage.filename} (not a valid zip archive)")
+        return stored
+
+    with archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            original_filename = secure_filename(name)
+            if _extension(original_filename) not in INGESTIBLE_EXTENSIONS:
+                skipped.append(f"{info.filename} (unsupported type)")
+                continue
+            if info.flag_bits & 0x1:
+                skipped.append(f"{info.filename} (encrypted)")
+                continue
+            if info.file_size > max_bytes:
+                skipped.append(f"{info.filename} (too large)")
+                continue
+            if len(stored) >= limit:
+                skipped.append(f"{info.filename} (file limit reached)")
+                continue
+            # The declared size can lie, so the copy enforces the limit as well
+            with archive.open(info) as src:
+                uploaded = _store(src, original_filename, upload_folder, max_bytes)
+            if uploaded is None:
+                skipped.append(f"{info.filename} (too large)")
+                continue
+            stored.append(uploaded)
+    return stored
+
+
+def save_uploads(file_storages, upload_folder, max_bytes, max_files):
+    """Write uploaded files (and the members of uploaded .zip archives) to upload_folder.
+    Returns (list_of_UploadedFile, list_of_skipped_descriptions)."""
+    stored = []
+    skipped = []
+    for file_storage in file_storages:
+        filename = secure_filename(file_storage.filename or '')
+        ext = _extension(filename)
+        remaining = max_files - len(stored)
+        if ext == 'zip':
+            stored.extend(_extract_archive(file_storage, upload_folder, max_bytes, remaining, skipped))
+        elif ext in INGESTIBLE_EXTENSIONS:
+            if remaining <= 0:
+                skipped.append(f"{filename} (file limit reached)")
+                continue
+            uploaded = _store(file_storage.stream, filename, upload_folder, max_bytes)
+            if uploaded is None:
+                skipped.append(f"{filename} (too large)")
+                continue
+            stored.append(uploaded)
+        else:
+            skipped.append(f"{filename} (unsupported type)")
+    return stored, skipped
+
+
+def start_bulk_ingest(app, jobs, api_key, max_workers):
+    """Ingest documents on a background thread with at most max_workers in parallel.
+    jobs: list of (document_id, file_path, ext, size_bytes)."""
+    thread = threading.Thread(
+        target=_run_bulk_ingest, args=(app, jobs, api_key, max_workers),
+        name="bulk-ingest", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _run_bulk_ingest(app, jobs, api_key, max_workers):
+    from app.services.rag_service import ingest_document
+    from app.services.write_behind import write_behind
+
+    with app.app_context():
+        started = time.perf_counter()
+        total_chunks = 0
+        total_bytes = 0
+        ready = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest") as pool:
+            futures = {
+                pool.submit(ingest_document, file_path, doc_id, ext, api_key, with_summary=True): (doc_id, size)
+                for doc_id, file_path, ext, size in jobs
+            }
+            # Status updates are queued here and committed in batches by the
+            # write-behind queue, rather than one transaction per document
+            for future in as_completed(futures):
+                doc_id, size = futures[future]
+                try:
+                    chunks_created, summary = future.result()
+                    write_behind.update_document(doc_id, summary, status='ready', chunk_count=chunks_created)
+                    total_chunks += chunks_created
+                    total_bytes += size
+                    ready += 1
+                    INGEST_DOCUMENTS.inc(status='ready')
+                    INGEST_BYTES.inc(size)
+                except Exception as e:
+                    print(f">>>> ERROR INGESTING DOCUMENT {doc_id}: {str(e)}")
+                    write_behind.update_document(doc_id, status='failed')
+                    INGEST_DOCUMENTS.inc(status='failed')
+        write_behind.flush()
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        BULK_INGEST_THROUGHPUT.set(ready / elapsed, unit='documents_per_second')
+        BULK_INGEST_THROUGHPUT.set(total_chunks / elapsed, unit='chunks_per_second')
+        BULK_INGEST_THROUGHPUT.set(total_bytes / elapsed, unit='bytes_per_second')
+        print(f">>>> BULK INGEST: {ready}/{len(jobs)} documents, {total_chunks} chunks, "
+              f"{total_bytes / 1e6:.1f} MB in {elapsed:.1f}s "
+              f"({ready / elapsed:.2f} docs/s, {total_bytes / 1e6 / elapsed:.2f} MB/s)")
@@ -0,0 +1,515 @@
+import hashlib
+import re
+import threading
+import zlib
+import numpy as np
+from sqlalchemy import create_engine, select, insert, update, delete, func, and_, or_
+from langchain_core.documents import Document as LCDocument
+from app.models.chunk import SharedChunk, ChunkReference, ChunkFingerprint, ChunkLshBand
+from app.services.metrics import Counter
+
+DEDUP_CHUNKS = Counter(
+    'rag_dedup_chunks_total',
+    'Ingested chunks by near-duplicate outcome (unique, shared, reused, internal), '
+    'and origin copies moved out of their index into the shared chunk (moved).',
+    ['outcome']
+)
+SHARED_CHUNK_HITS = Counter(
+    'rag_shared_chunk_hits_total',
+    'Shared chunks retrieved for a turn, by whether a selected document already covers '
+    'them (covered) or they were added to the context (added).',
+    ['outcome']
+)
+
+# MinHash over word 5-shingles, 128 permutations in 16 LSH bands of 8 rows: chunks
+# with Jaccard similarity 0.8 share a band ~95% of the time, and every candidate
+# is then checked against NEAR_DUPLICATE_THRESHOLD on the full signature.
+# Signatures are persisted, so the permutations (and their seed) must never change.
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+_PRIME = 4294967291  # Largest prime below 2**32, so (a * x + b) stays inside uint64
+_perm_rng = np.random.RandomState(42)
+_PERM_A = _perm_rng.randint(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _perm_rng.randint(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Band keys per candidate query (SQLite allows 32766 bound parameters)
+_LOOKUP_BATCH = 500
+
+NEAR_DUPLICATE_DEDUP = True
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_shared = SharedChunk.__table__
+_references = ChunkReference.__table__
+_fingerprints = ChunkFingerprint.__table__
+_bands = ChunkLshBand.__table__
+
+# Ingest runs on worker threads and processes without an app context, so this
+# module talks to the database through an engine of its own
+_engine = None
+_engine_url = None
+_engine_lock = threading.Lock()
+
+# Decoded shared chunks per (document ids, model_key), for search_shared_many.
+# record/adopt/forget clear it; an entry is also checked against _reference_stamp,
+# since other processes (workers, the CLI) change references too
+_SHARED_CACHE_SIZE = 64
+_shared_cache = {}
+_shared_cache_lock = threading.Lock()
+
+
+def init_app(app):
+    """Share the app's engine; returns its URL for worker processes (see configure)."""
+    global _engine, _engine_url
+    from app.extensions import db
+    with app.app_context():
+        _engine = db.engine
+        _engine_url = db.engine.url.render_as_string(hide_password=False)
+    return _engine_url
+
+
+def configure(settings):
+    """Apply the NEAR_DUPLICATE_* settings; in a worker process, also connect to
+    DEDUP_DATABASE_URL (the parent's database)."""
+    global NEAR_DUPLICATE_DEDUP, NEAR_DUPLICATE_THRESHOLD, _engine, _engine_url
+    NEAR_DUPLICATE_DEDUP = settings.get('NEAR_DUPLICATE_DEDUP', NEAR_DUPLICATE_DEDUP)
+    NEAR_DUPLICATE_THRESHOLD = settings.get('NEAR_DUPLICATE_THRESHOLD', NEAR_DUPLICATE_THRESHOLD)
+    url = settings.get('DEDUP_DATABASE_URL')
+    with _engine_lock:
+        if url and url != _engine_url:
+            _engine = create_engine(url, pool_pre_ping=True)
+            _engine_url = url
+
+
+def minhash(text):
+    """MinHash signature (NUM_PERM uint32) of text's word shingles, or None if it has no words."""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return None
+    if len(words) < SHINGLE_WORDS:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in set(shingles)), dtype=np.uint64)
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature):
+    """One signed 64-bit key per LSH band (the band number is part of the key)."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def _scopes(conn, document_id):
+    """(the document's scope, the scopes its chunks may match): a private document
+    is compared with its owner's documents and the global ones, a global document
+    only with other global documents."""
+    from app.models.document import Document
+    documents = Document.__table__
+    row = conn.execute(
+        select(documents.c.owner_id, documents.c.is_global).where(documents.c.id == document_id)
+    ).first()
+    if row is None or row.is_global or row.owner_id is None:
+        return 'global', ['global']
+    scope = f"user:{row.owner_id}"
+    return scope, [scope, 'global']
+
+
+def _candidates(conn, keys, scopes, model_key, document_id):
+    """Fingerprints in scopes (and of model_key) sharing a band with any of keys,
+    excluding the document's own. Returns (band_key -> [fingerprint_id], fingerprint_id -> row)."""
+    buckets = {}
+    rows = {}
+    keys = list(keys)
+    for start in range(0, len(keys), _LOOKUP_BATCH):
+        result = conn.execute(
+            select(
+                _bands.c.band_key, _fingerprints.c.id, _fingerprints.c.document_id,
+                _fingerprints.c.chunk_id, _fingerprints.c.shared_chunk_id, _fingerprints.c.signature
+            )
+            .join(_fingerprints, _fingerprints.c.id == _bands.c.fingerprint_id)
+            .where(
+                _bands.c.band_key.in_(keys[start:start + _LOOKUP_BATCH]),
+                _fingerprints.c.scope.in_(scopes),
+                _fingerprints.c.model_key == model_key,
+                or_(_fingerprints.c.document_id.is_(None), _fingerprints.c.document_id != document_id)
+            )
+        )
+        for row in result:
+            buckets.setdefault(row.band_key, []).append(row.id)
+            if row.id not in rows:
+                rows[row.id] = (row, np.frombuffer(row.signature, dtype=np.uint32))
+    return buckets, rows
+
+
+class DedupPlan:
+    """How an ingest splits a document's chunks (see plan_document). Values are chunk indexes."""
+
+    def __init__(self, scope, model_key):
+        self.scope = scope
+        self.model_key = model_key
+        self.keep = []        # Stored in the document's own index
+        self.existing = []    # (index, shared_chunk_id): an existing shared chunk covers it
+        self.new_shared = []  # (index, origin_document_id, origin_chunk_id): becomes a shared chunk
+        self.internal = 0     # Near-duplicates of an earlier chunk of the same document
+        self.signatures = {}  # index -> signature, for kept and new shared chunks
+
+
+def plan_document(document_id, chunks, ids, model_key):
+    """Match each chunk against the document's earlier chunks, then against the
+    fingerprints of the documents in its scope indexed with the same embedding
+    model (model_key). Returns a DedupPlan, or None when near-duplicate
+    elimination is off."""
+    if not NEAR_DUPLICATE_DEDUP or _engine is None:
+        return None
+    signatures = [minhash(chunk.page_content) for chunk in chunks]
+    keys = [band_keys(s) if s is not None else [] for s in signatures]
+    with _engine.connect() as conn:
+        scope, scopes = _scopes(conn, document_id)
+        buckets, rows = _candidates(conn, {k for ks in keys for k in ks}, scopes, model_key, document_id)
+
+    plan = DedupPlan(scope, model_key)
+    local = {}  # band key -> indexes of this document's earlier (not dropped) chunks
+    for i, (signature, chunk_keys) in enumerate(zip(signatures, keys)):
+        if signature is None:
+            plan.keep.append(i)
+            continue
+        earlier = {j for k in chunk_keys for j in local.get(k, ())}
+        if any(similarity(signature, signatures[j]) >= NEAR_DUPLICATE_THRESHOLD for j in earlier):
+            plan.internal += 1
+            continue
+
+        best_shared = best_indexed = None
+        best_shared_score = best_indexed_score = NEAR_DUPLICATE_THRESHOLD
+        for fingerprint_id in {f for k in chunk_keys for f in buckets.get(k, ())}:
+            row, candidate = rows[fingerprint_id]
+            score = similarity(signature, candidate)
+            if row.shared_chunk_id is not None and score >= best_shared_score:
+                best_shared, best_shared_score = row, score
+            elif row.shared_chunk_id is None and score >= best_indexed_score:
+                best_indexed, best_indexed_score = row, score
+        # An existing shared copy costs nothing; a match in another document's index needs one
+        if best_shared is not None:
+            plan.existing.append((i, best_shared.shared_chunk_id))
+        elif best_indexed is not None:
+            plan.new_shared.append((i, best_indexed.document_id, best_indexed.chunk_id))
+            plan.signatures[i] = signature
+        else:
+            plan.keep.append(i)
+            plan.signatures[i] = signature
+        for k in chunk_keys:
+            local.setdefault(k, []).append(i)
+
+    # A document keeps at least its first chunk, so it always has an index of its own
+    if chunks and not plan.keep:
+        plan.existing = [e for e in plan.existing if e[0] != 0]
+        plan.new_shared = [n for n in plan.new_shared if n[0] != 0]
+        plan.keep.append(0)
+        plan.signatures[0] = signatures[0]
+    return plan
+
+
+def _delete_fingerprints(conn, condition):
+    conn.execute(delete(_bands).where(
+        _bands.c.fingerprint_id.in_(select(_fingerprints.c.id).where(condition))
+    ))
+    conn.execute(delete(_fingerprints).where(condition))
+
+
+def _insert_fingerprint(conn, plan, signature, document_id=None, chunk_id=None, shared_chunk_id=None):
+    fingerprint_id = conn.execute(insert(_fingerprints).values(
+        scope=plan.scope, model_key=plan.model_key, document_id=document_id, chunk_id=chunk_id,
+        shared_chunk_id=shared_chunk_id, signature=signature.tobytes()
+    )).inserted_primary_key[0]
+    return [{'fingerprint_id': fingerprint_id, 'band_key': k} for k in set(band_keys(signature))]
+
+
+def _collect_garbage(conn, shared_chunk_ids):
+    """Delete the given shared chunks that no document references any more."""
+    if not shared_chunk_ids:
+        return
+    referenced = set(conn.execute(
+        select(_references.c.shared_chunk_id).where(_references.c.shared_chunk_id.in_(shared_chunk_ids))
+    ).scalars())
+    orphans = [s for s in set(shared_chunk_ids) if s not in referenced]
+    if orphans:
+        _delete_fingerprints(conn, _fingerprints.c.shared_chunk_id.in_(orphans))
+        conn.execute(delete(_shared).where(_shared.c.id.in_(orphans)))
+
+
+def _release(conn, document_id, model_key=None, kept_ids=()):
+    """Drop the document's fingerprints and references (only those of model_key, if
+    given), and stop treating its chunks outside kept_ids as the origin of shared chunks."""
+    reference_rows = _references.c.document_id == document_id
+    fingerprint_rows = _fingerprints.c.document_id == document_id
+    origin_rows = _shared.c.origin_document_id == document_id
+    if model_key is not None:
+        reference_rows = and_(reference_rows, _references.c.model_key == model_key)
+        fingerprint_rows = and_(fingerprint_rows, _fingerprints.c.model_key == model_key)
+        origin_rows = and_(origin_rows, _shared.c.model_key == model_key)
+    previous = conn.execute(
+        select(_references.c.shared_chunk_id).where(reference_rows)
+    ).scalars().all()
+    _delete_fingerprints(conn, fingerprint_rows)
+    conn.execute(delete(_references).where(reference_rows))
+    kept_ids = set(kept_ids)
+    stale = [
+        row.id for row in conn.execute(
+            select(_shared.c.id, _shared.c.origin_chunk_id).where(origin_rows)
+        )
+        if row.origin_chunk_id not in kept_ids
+    ]
+    if stale:
+        conn.execute(update(_shared).where(_shared.c.id.in_(stale)).values(
+            origin_document_id=None, origin_chunk_id=None
+        ))
+    return previous
+
+
+def _invalidate_shared():
+    with _shared_cache_lock:
+        _shared_cache.clear()
+
+
+def record(document_id, plan, chunks, ids, shared_vectors):
+    """Persist a plan once the document's own index has been written: fingerprints
+    for its kept chunks, new shared chunks (shared_vectors follows plan.new_shared)
+    and a reference for every chunk it doesn't store itself. Returns
+    [(shared_chunk_id, origin_document_id, origin_chunk_id)] of the new shared
+    chunks, whose origins still hold their own copy (see adopt)."""
+    created = []
+    with _engine.begin() as conn:
+        previous = _release(conn, document_id, plan.model_key, [ids[i] for i in plan.keep])
+        bands = []
+        references = []
+        for i in plan.keep:
+            if i in plan.signatures:
+                bands.extend(_insert_fingerprint(
+                    conn, plan, plan.signatures[i], document_id=document_id, chunk_id=ids[i]
+                ))
+        for (i, origin_document_id, origin_chunk_id), vector in zip(plan.new_shared, shared_vectors):
+            shared_chunk_id = conn.execute(insert(_shared).values(
+                scope=plan.scope, model_key=plan.model_key, text=chunks[i].page_content,
+                embedding=np.asarray(vector, dtype=np.float32).tobytes(),
+                origin_document_id=origin_document_id, origin_chunk_id=origin_chunk_id
+            )).inserted_primary_key[0]
+            bands.extend(_insert_fingerprint(
+                conn, plan, plan.signatures[i], shared_chunk_id=shared_chunk_id
+            ))
+            created.append((shared_chunk_id, origin_document_id, origin_chunk_id))
+            references.append({'document_id': document_id, 'shared_chunk_id': shared_chunk_id,
+                               'model_key': plan.model_key, 'chunk_metadata': chunks[i].metadata})
+        for i, shared_chunk_id in plan.existing:
+            references.append({'document_id': document_id, 'shared_chunk_id': shared_chunk_id,
+                               'model_key': plan.model_key, 'chunk_metadata': chunks[i].metadata})
+        if bands:
+            conn.execute(insert(_bands), bands)
+        if references:
+            conn.execute(insert(_references), references)
+        _collect_garbage(conn, previous)
+    _invalidate_shared()
+
+    DEDUP_CHUNKS.inc(len(plan.keep), outcome='unique')
+    DEDUP_CHUNKS.inc(len(plan.new_shared), outcome='shared')
+    DEDUP_CHUNKS.inc(len(plan.existing), outcome='reused')
+    DEDUP_CHUNKS.inc(plan.internal, outcome='internal')
+    return created
+
+
+def claim_document(document_id):
+    """Mark a document 'processing' the way the routes claim one before rewriting its
+    index, so no replace, rebuild or migration runs meanwhile. Returns the status to
+    hand back to release_document, or None if the document is busy or gone."""
+    from app.models.document import Document
+    documents = Document.__table__
+    with _engine.begin() as conn:
+        row = conn.execute(
+            select(documents.c.status).where(documents.c.id == document_id, documents.c.is_active.is_(True))
+        ).first()
+        if row is None or row.status == 'processing':
+            return None
+        claimed = conn.execute(
+            update(documents).where(documents.c.id == document_id, documents.c.status == row.status)
+            .values(status='processing')
+        ).rowcount
+    return row.status if claimed else None
+
+
+def release_document(document_id, status):
+    from app.models.document import Document
+    documents = Document.__table__
+    with _engine.begin() as conn:
+        conn.execute(
+            update(documents).where(documents.c.id == document_id, documents.c.status == 'processing')
+            .values(status=status)
+        )
+
+
+def adopt(document_id, model_key, moved):
+    """Record that an origin document gave up its own copies of new shared chunks.
+    moved: [(shared_chunk_id, chunk_id, chunk metadata)]. The document references
+    each shared chunk instead, its fingerprints of those chunks go (the shared
+    chunk's stands for them), the shared chunks stop naming it as their origin, and
+    its chunk_count drops if the index is its current one. The caller removes the
+    chunks from the index."""
+    from app.models.document import Document
+    documents = Document.__table__
+    chunk_ids = {chunk_id for _, chunk_id, _ in moved}
+    name, _, version = model_key.rpartition('@')
+    with _engine.begin() as conn:
+        _delete_fingerprints(conn, and_(
+            _fingerprints.c.document_id == document_id, _fingerprints.c.model_key == model_key,
+            _fingerprints.c.chunk_id.in_(chunk_ids)
+        ))
+        conn.execute(update(_shared).where(_shared.c.id.in_([s for s, _, _ in moved])).values(
+            origin_document_id=None, origin_chunk_id=None
+        ))
+        conn.execute(insert(_references), [
+            {'document_id': document_id, 'shared_chunk_id': shared_chunk_id,
+             'model_key': model_key, 'chunk_metadata': metadata}
+            for shared_chunk_id, _, metadata in moved
+        ])
+        conn.execute(
+            update(documents).where(
+                documents.c.id == document_id, documents.c.embedding_model == name,
+                documents.c.embedding_version == int(version)
+            ).values(chunk_count=documents.c.chunk_count - len(chunk_ids))
+        )
+    _invalidate_shared()
+    DEDUP_CHUNKS.inc(len(chunk_ids), outcome='moved')
+
+
+def forget(document_id, model_key=None):
+    """Remove a document from near-duplicate matching (deleted, or re-ingested with it
+    off), or only its rows for model_key (its index for that model is gone)."""
+    if _engine is None:
+        return
+    with _engine.begin() as conn:
+        _collect_garbage(conn, _release(conn, document_id, model_key))
+    _invalidate_shared()
+
+
+def search_shared(document_ids, query_vector, k, model_key, retrieval_filter=None):
+    """Top-k (by L2 distance, like the FAISS indexes) shared chunks referenced by any of
+    document_ids under model_key, the model query_vector comes from. Returns dicts
+    best first: 'document' (an LCDocument with the first referencing document's metadata), 'document_ids' and 'sources' of the referencing
+    documents in document_ids order, 'origin_document_id' and 'origin_digest' (the
+    content hash of the indexed chunk it was first matched to, or None). With
+    retrieval_filter, only references whose chunk passes its page filter count."""
+    return search_shared_many(document_ids, [query_vector], k, model_key, retrieval_filter)[0]
+
+
+def _reference_stamp(conn, document_ids, model_key):
+    """Changes whenever a reference of document_ids under model_key is added or
+    removed, or one of their shared chunks changes origin."""
+    return tuple(conn.execute(
+        select(
+            func.count(_references.c.id), func.coalesce(func.sum(_references.c.id), 0),
+            func.coalesce(func.sum(_shared.c.origin_document_id), 0)
+        )
+        .join(_shared, _shared.c.id == _references.c.shared_chunk_id)
+        .where(_references.c.document_id.in_(document_ids), _references.c.model_key == model_key)
+    ).one())
+
+
+def _group(rows):
+    """{shared_chunk_id: (its first row, referencing document ids, their sources)}, in row order."""
+    groups = {}
+    for row in rows:
+        group = groups.get(row.id)
+        if group is None:
+            group = groups[row.id] = (row, [], [])
+        if row.document_id not in group[1]:
+            group[1].append(row.document_id)
+            source = (row.chunk_metadata or {}).get('source')
+            if source and source not in group[2]:
+                group[2].append(source)
+    return groups
+
+
+def _shared_rows(document_ids, model_key):
+    """(reference rows of document_ids under model_key in document_ids order, the
+    rows grouped by shared chunk, {shared_chunk_id: row in matrix}, the float32
+    embedding matrix, its squared row norms), decoded once and then served from
+    _shared_cache while the stamp holds."""
+    key = (tuple(document_ids), model_key)
+    with _engine.connect() as conn:
+        stamp = _reference_stamp(conn, document_ids, model_key)
+        with _shared_cache_lock:
+            cached = _shared_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        rows = conn.execute(
+            select(
+                _references.c.document_id, _references.c.chunk_metadata, _shared.c.id, _shared.c.text,
+                _shared.c.embedding, _shared.c.origin_document_id, _shared.c.origin_chunk_id
+            )
+            .join(_shared, _shared.c.id == _references.c.shared_chunk_id)
+            .where(_references.c.document_id.in_(document_ids), _references.c.model_key == model_key)
+        ).all()
+
+    position = {doc_id: n for n, doc_id in enumerate(document_ids)}
+    rows.sort(key=lambda row: position.get(row.document_id, len(position)))
+    groups = _group(rows)
+    positions = {shared_chunk_id: n for n, shared_chunk_id in enumerate(groups)}
+    matrix = squared_norms = None
+    if groups:
+        matrix = np.stack([np.frombuffer(row.embedding, dtype=np.float32) for row, _, _ in groups.values()])
+        squared_norms = (matrix ** 2).sum(axis=1)
+    entry = (rows, groups, positions, matrix, squared_norms)
+    with _shared_cache_lock:
+        if len(_shared_cache) >= _SHARED_CACHE_SIZE:
+            _shared_cache.pop(next(iter(_shared_cache)))
+        _shared_cache[key] = (stamp, entry)
+    return entry
+
+
+def search_shared_many(document_ids, query_vectors, k, model_key, retrieval_filter=None):
+    """search_shared for several query vectors, reading the shared chunks once.
+    Hits are shared between the result lists, so treat them as read-only."""
+    if _engine is None or not document_ids:
+        return [[] for _ in query_vectors]
+    rows, groups, positions, matrix, squared_norms = _shared_rows(document_ids, model_key)
+    if retrieval_filter is not None:
+        # Before any distance is computed, like the ID selectors of the FAISS indexes
+        groups = _group([row for row in rows if retrieval_filter.matches(row.chunk_metadata or {})])
+    if not groups:
+        return [[] for _ in query_vectors]
+
+    candidates = list(groups)
+    if len(groups) < len(positions):
+        selected = [positions[shared_chunk_id] for shared_chunk_id in candidates]
+        matrix, squared_norms = matrix[selected], squared_norms[selected]
+    queries = np.asarray(query_vectors, dtype=np.float32)
+    # ||m - q||^2 = ||m||^2 - 2 m.q + ||q||^2; the last term doesn't change the order
+    distances = squared_norms[None, :] - 2 * queries @ matrix.T
+
+    hits = {}
+
+    def hit(shared_chunk_id):
+        if shared_chunk_id not in hits:
+            row, referencing, sources = groups[shared_chunk_id]
+            metadata = dict(row.chunk_metadata or {})
+            metadata['shared_sources'] = list(sources)
+            hits[shared_chunk_id] = {
+                'document': LCDocument(page_content=row.text, metadata=metadata),
+                'document_ids': list(referencing),
+                'sources': list(sources),
+                'origin_document_id': row.origin_document_id,
+                'origin_digest': row.origin_chunk_id.split(':')[0] if row.origin_chunk_id else None,
+            }
+        return hits[shared_chunk_id]
+
+    return [[hit(candidates[n]) for n in np.argsort(row)[:k]] for row in distances]
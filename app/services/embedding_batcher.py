@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from app.services.metrics import Histogram
+
+EMBED_BATCH_SIZE = Histogram(
+    'rag_embedding_batch_size',
+    'Query texts encoded together in one forward pass.',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+EMBED_BATCH_WAIT_SECONDS = Histogram(
+    'rag_embedding_batch_wait_seconds',
+    'Time a query embedding waited for its batch to start encoding.',
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+EMBED_BATCH_ENCODE_SECONDS = Histogram(
+    'rag_embedding_batch_encode_seconds',
+    'Time spent encoding one batch of query texts.'
+)
+
+
+class _Request:
+    __slots__ = ('text', 'future', 'enqueued')
+
+    def __init__(self, text):
+        self.text = text
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """Coalesces query embeddings from concurrent request threads into batched encodes.
+
+    Callers block in embed(); a single worker thread takes the first waiting
+    text, gathers whatever else arrives within max_wait_ms (up to max_batch
+    texts), runs encode(texts) once and hands each vector back to its caller.
+    A lone request pays at most max_wait_ms extra; under concurrency one
+    forward pass serves many turns. max_batch <= 1 or max_wait_ms <= 0
+    encodes inline with no batching. embedding_models creates one per model,
+    with EMBED_BATCH_MAX_SIZE and EMBED_BATCH_MAX_WAIT_MS from its init_app.
+    """
+
+    def __init__(self, encode, max_batch=32, max_wait_ms=5.0):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_batch > 1 and self.max_wait_ms > 0
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(
+                        target=self._run, name="embedding-batcher", daemon=True
+                    )
+                    self._worker.start()
+
+    def embed(self, text):
+        """Return the embedding of text, encoded together with any concurrent callers."""
+        if not self.enabled:
+            EMBED_BATCH_SIZE.observe(1)
+            with EMBED_BATCH_ENCODE_SECONDS.time():
+                return self.encode([text])[0]
+        request = _Request(text)
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Anything that queued up while the last batch was encoding is already late; take it too
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            EMBED_BATCH_SIZE.observe(len(batch))
+            for request in batch:
+                EMBED_BATCH_WAIT_SECONDS.observe(started - request.enqueued)
+            try:
+                vectors = self.encode([request.text for request in batch])
+            except BaseException as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finally:
+                EMBED_BATCH_ENCODE_SECONDS.observe(time.perf_counter() - started)
+            for request, vector in zip(batch, vectors):
+                request.future.set_result(vector)
@@ -0,0 +1,228 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from app.extensions import db
+from app.models.document import Document
+from app.models.embedding_migration import EmbeddingMigration
+from app.services import rag_service, embedding_models
+from app.services.metrics import Counter, Gauge
+
+EMBEDDING_MIGRATION_DOCUMENTS = Counter(
+    'rag_embedding_migration_documents_total',
+    'Documents handled by embedding model migrations, by outcome (migrated, failed, skipped).',
+    ['outcome']
+)
+EMBEDDING_MIGRATION_PROGRESS = Gauge(
+    'rag_embedding_migration_progress',
+    'Share of the documents of the embedding model migration running in this process handled so far.'
+)
+
+# A 'running' row that hasn't been touched for this long belongs to a process that went away
+STALE_AFTER = timedelta(minutes=10)
+
+
+def parse_request(payload, default_max_chunks_per_second=None):
+    """Validate a migration request {'model': name, 'version': n, 'document_ids': [...],
+    'max_chunks_per_second': x}. Returns (model, document_ids, max_chunks_per_second);
+    raises ValueError with a message for the caller."""
+    name = payload.get('model') or embedding_models.EMBEDDING_MODEL
+    if not isinstance(name, str):
+        raise ValueError("'model' must be a model name")
+    version = payload.get('version')
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        raise ValueError("'version' must be an integer")
+    model = embedding_models.get(name, version)
+
+    document_ids = payload.get('document_ids')
+    if document_ids is not None:
+        if not isinstance(document_ids, list):
+            raise ValueError("'document_ids' must be a list of document ids")
+        try:
+            document_ids = list(dict.fromkeys(int(i) for i in document_ids))
+        except (TypeError, ValueError):
+            raise ValueError("'document_ids' must be integers")
+
+    max_chunks_per_second = payload.get('max_chunks_per_second', default_max_chunks_per_second)
+    if max_chunks_per_second is not None:
+        if not isinstance(max_chunks_per_second, (int, float)) or isinstance(max_chunks_per_second, bool) \
+                or max_chunks_per_second < 0:
+            raise ValueError("'max_chunks_per_second' must be a non-negative number (0: no limit)")
+    return model, document_ids, max_chunks_per_second
+
+
+def pending_documents(model, document_ids=None):
+    """Active, ready documents not yet indexed with model, oldest first."""
+    query = Document.query.filter_by(is_active=True, status='ready').filter(db.or_(
+        Document.embedding_model != model.name, Document.embedding_version != model.version
+    ))
+    if document_ids:
+        query = query.filter(Document.id.in_(document_ids))
+    return query.order_by(Document.id).all()
+
+
+def active_migration():
+    """The migration running in any process, or None. Running rows nobody has updated
+    for STALE_AFTER are marked interrupted on the way."""
+    cutoff = datetime.utcnow() - STALE_AFTER
+    active = None
+    for migration in EmbeddingMigration.query.filter_by(status='running').all():
+        if migration.updated_at is not None and migration.updated_at < cutoff:
+            migration.status = 'interrupted'
+            migration.finished_at = datetime.utcnow()
+        else:
+            active = migration
+    db.session.commit()
+    return active
+
+
+def create_migration(model, document_ids=None, max_chunks_per_second=None):
+    """Record a new run moving the pending documents to model.
+    Raises ValueError if another migration is still running, or if the vector
+    store can't hold model's vectors (a Pinecone index of another dimension)."""
+    rag_service.check_model_dimension(model)
+    running = active_migration()
+    if running is not None:
+        raise ValueError(f"Migration #{running.id} to {running.model}@{running.version} is still running")
+    migration = EmbeddingMigration(
+        model=model.name,
+        version=model.version,
+        status='running',
+        total_documents=len(pending_documents(model, document_ids)),
+        max_chunks_per_second=max_chunks_per_second or None,
+    )
+    db.session.add(migration)
+    db.session.commit()
+    return migration
+
+
+def cancel_migration(migration_id):
+    """Ask a running migration (in whichever process) to stop after its current document."""
+    migration = db.session.get(EmbeddingMigration, migration_id)
+    if migration is None or migration.status != 'running':
+        return False
+    migration.status = 'cancelled'
+    migration.finished_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def _discard(document_id, model):
+    try:
+        rag_service.delete_index(document_id, model)
+    except Exception as e:
+        print(f">>>> ERROR DISCARDING {model.key} INDEX OF DOCUMENT {document_id}: {str(e)}")
+
+
+def _migrate_document(doc, target):
+    """Build the document's index for target next to the one serving, then switch the
+    Document row over and drop the old index. Returns (outcome, chunks, error)."""
+    indexed_with = (doc.embedding_model, doc.embedding_version)
+    version = doc.version
+    if not rag_service.fetch_upload(doc.file_path):
+        return 'failed', 0, 'upload missing'
+    try:
+        chunks = rag_service.ingest_document(
+            doc.file_path, doc.id, doc.file_path.rsplit('.', 1)[-1].lower(), None, model=target
+        )
+    except Exception as e:
+        _discard(doc.id, target)
+        return 'failed', 0, str(e)
+
+    db.session.refresh(doc)
+    if not doc.is_active or doc.version != version or (doc.embedding_model, doc.embedding_version) != indexed_with:
+        # Deleted, replaced or moved while it was being embedded: the new index is stale
+        _discard(doc.id, target)
+        return 'skipped', chunks, None
+
+    # The swap: queries look the model up per turn, so they move to the new index here
+    doc.set_embedding_model(target)
+    doc.chunk_count = chunks
+    doc.pinecone_namespace = str(embedding_models.index_key(doc.id, target))
+    db.session.commit()
+    try:
+        _discard(doc.id, embedding_models.get(*indexed_with))
+    except ValueError:
+        pass  # A model no longer registered; 'flask rag gc' removes its local index
+    return 'migrated', chunks, None
+
+
+def run_migration(migration_id, document_ids=None, pause_seconds=0.0, on_document=None):
+    """Re-embed the migration's pending documents to its model, one at a time.
+
+    Each document's current index keeps serving until its new one is complete.
+    Documents deleted or replaced in the meantime are skipped; the next run picks
+    up replaced ones. Embedding is throttled to the row's max_chunks_per_second on
+    average, plus pause_seconds between documents, to leave CPU for live queries.
+    The row records progress after every document, and setting its status to
+    'cancelled' (cancel_migration) stops the run after the current one.
+    on_document(doc_id, outcome, chunks, seconds, error) is called for each document.
+    """
+    migration = db.session.get(EmbeddingMigration, migration_id)
+    target = embedding_models.get(migration.model, migration.version)
+    documents = pending_documents(target, document_ids)
+    migration.total_documents = len(documents)
+    db.session.commit()
+
+    started = time.perf_counter()
+    embedded = 0
+    try:
+        for n, doc in enumerate(documents):
+            db.session.refresh(migration)
+            if migration.status != 'running':
+                break
+            migration.current_document_id = doc.id
+            migration.updated_at = datetime.utcnow()
+            db.session.commit()
+
+            doc_started = time.perf_counter()
+            outcome, chunks, error = _migrate_document(doc, target)
+            seconds = time.perf_counter() - doc_started
+            EMBEDDING_MIGRATION_DOCUMENTS.inc(outcome=outcome)
+            EMBEDDING_MIGRATION_PROGRESS.set((n + 1) / len(documents))
+            if outcome == 'migrated':
+                migration.migrated_documents += 1
+            elif outcome == 'failed':
+                print(f">>>> ERROR MIGRATING DOCUMENT {doc.id} TO {target.key}: {error}")
+                migration.failed_documents += 1
+                migration.last_error = f"#{doc.id}: {error}"
+            else:
+                migration.skipped_documents += 1
+            migration.embedded_chunks += chunks
+            migration.updated_at = datetime.utcnow()
+            db.session.commit()
+            if on_document is not None:
+                on_document(doc.id, outcome, chunks, seconds, error)
+
+            embedded += chunks
+            delay = pause_seconds
+            if migration.max_chunks_per_second:
+                delay = max(delay, embedded / migration.max_chunks_per_second - (time.perf_counter() - started))
+            if delay > 0 and n + 1 < len(documents):
+                time.sleep(delay)
+    except Exception as e:
+        db.session.rollback()
+        migration.status = 'failed'
+        migration.last_error = str(e)
+        raise
+    finally:
+        if migration.status == 'running':
+            migration.status = 'done'
+        migration.current_document_id = None
+        migration.finished_at = migration.finished_at or datetime.utcnow()
+        migration.updated_at = datetime.utcnow()
+        db.session.commit()
+    return migration
+
+
+def start_migration(app, migration_id, pause_seconds=0.0, document_ids=None):
+    """run_migration on a background thread of this process."""
+    def run():
+        with app.app_context():
+            try:
+                run_migration(migration_id, document_ids, pause_seconds=pause_seconds)
+            except Exception as e:
+                print(f">>>> EMBEDDING MIGRATION {migration_id} FAILED: {str(e)}")
+
+    thread = threading.Thread(target=run, name=f"embedding-migration-{migration_id}", daemon=True)
+    thread.start()
+    return thread
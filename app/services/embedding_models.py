@@ -0,0 +1,198 @@
+import threading
+from langchain_huggingface import HuggingFaceEmbeddings
+from sqlalchemy import select
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.metrics import CACHE_ENTRIES
+
+
+class EmbeddingModel:
+    """A registered embedding model at one version.
+
+    The version is bumped whenever the vectors the model produces change (new
+    weights, prefixes, normalization), so an index is only ever searched with
+    query vectors from exactly the model and version that built it.
+    """
+
+    def __init__(self, name, version, hub_id, dimension, query_prefix="", document_prefix="", normalize=False):
+        self.name = name
+        self.version = version
+        self.hub_id = hub_id
+        self.dimension = dimension
+        self.query_prefix = query_prefix
+        self.document_prefix = document_prefix
+        self.normalize = normalize
+
+    @property
+    def key(self):
+        return f"{self.name}@{self.version}"
+
+    def __repr__(self):
+        return f"EmbeddingModel({self.key})"
+
+
+# Every model a document may be indexed with. Documents record name and version,
+# so never edit an entry in use: add it again with the next version instead.
+MODELS = (
+    # What every index was built with before the registry existed
+    EmbeddingModel('all-MiniLM-L6-v2', 1, 'sentence-transformers/all-MiniLM-L6-v2', 384),
+    # Half the layers of MiniLM-L6: about twice as fast to encode, somewhat less accurate
+    EmbeddingModel('paraphrase-MiniLM-L3-v2', 1, 'sentence-transformers/paraphrase-MiniLM-L3-v2', 384),
+    # Same size and speed as MiniLM-L6 with better retrieval; questions get an instruction prefix
+    EmbeddingModel('bge-small-en-v1.5', 1, 'BAAI/bge-small-en-v1.5', 384,
+                   query_prefix="Represent this sentence for searching relevant passages: ", normalize=True),
+    # Better retrieval again, at several times the encode cost
+    EmbeddingModel('all-mpnet-base-v2', 1, 'sentence-transformers/all-mpnet-base-v2', 768),
+)
+_registry = {model.key: model for model in MODELS}
+LEGACY_MODEL = MODELS[0]
+
+# Model (latest registered version) that new documents are indexed with
+EMBEDDING_MODEL = LEGACY_MODEL.name
+
+_loaded = {}
+_batchers = {}
+_lock = threading.Lock()
+_batch_settings = {}
+
+# Query-time lookups of each document's model run on generation threads and in
+# streamed responses without an app context, so they use the engine directly
+_engine = None
+
+CACHE_ENTRIES.set_function(lambda: len(_loaded), cache='embeddings')
+
+
+def get(name, version=None):
+    """The registered model name at version (its latest version if None). ValueError if unknown."""
+    if version is None:
+        versions = [model for model in MODELS if model.name == name]
+        if not versions:
+            raise ValueError(f"Unknown embedding model: {name} (registered: "
+                             f"{', '.join(sorted({m.name for m in MODELS}))})")
+        return max(versions, key=lambda model: model.version)
+    model = _registry.get(f"{name}@{version}")
+    if model is None:
+        raise ValueError(f"Unknown embedding model: {name} version {version}")
+    return model
+
+
+def current():
+    """The model new documents are indexed with."""
+    return get(EMBEDDING_MODEL)
+
+
+def for_document(document):
+    """The model a Document's index was built with."""
+    return get(document.embedding_model, document.embedding_version)
+
+
+def init_app(app):
+    """Pick up the query batching settings and share the app's engine."""
+    global _engine
+    from app.extensions import db
+    _batch_settings.update(
+        max_batch=app.config.get('EMBED_BATCH_MAX_SIZE', 32),
+        max_wait_ms=app.config.get('EMBED_BATCH_MAX_WAIT_MS', 5.0),
+    )
+    with app.app_context():
+        _engine = db.engine
+
+
+def configure(settings):
+    """Apply EMBEDDING_MODEL; also called in worker processes (see rag_service.configure_store)."""
+    global EMBEDDING_MODEL
+    name = settings.get('EMBEDDING_MODEL', EMBEDDING_MODEL)
+    get(name)  # Fail at startup on a typo, not at the first upload
+    EMBEDDING_MODEL = name
+
+
+def index_key(document_id, model):
+    """Where a document's vectors for model live in the vector store (FAISS directory,
+    Pinecone namespace, shared artifact). The legacy model keeps the bare document id,
+    so indexes built before the registry are found unchanged; other models get a key
+    of their own, so a new index can be built alongside the one still serving."""
+    return _index_key(document_id, model.key)
+
+
+def document_index_key(document):
+    """index_key of a Document's current index (also for a model no longer registered)."""
+    return _index_key(document.id, f"{document.embedding_model}@{document.embedding_version}")
+
+
+def _index_key(document_id, model_key):
+    if model_key == LEGACY_MODEL.key:
+        return document_id
+    return f"{document_id}.{model_key}"
+
+
+def load(model):
+    """The model's HuggingFaceEmbeddings, loaded once per process."""
+    embeddings = _loaded.get(model.key)
+    if embeddings is None:
+        # Parallel ingest workers may race here; only one of them should load the model
+        with _lock:
+            if model.key not in _loaded:
+                _loaded[model.key] = HuggingFaceEmbeddings(
+                    model_name=model.hub_id, encode_kwargs={'normalize_embeddings': model.normalize}
+                )
+            embeddings = _loaded[model.key]
+    return embeddings
+
+
+def embed_documents(model, texts):
+    return load(model).embed_documents([model.document_prefix + text for text in texts])
+
+
+def embed_queries(model, texts):
+    """Embed questions in one pass. The query prefix is added here rather than through
+    embed_query, so questions from concurrent turns can share a forward pass."""
+    return load(model).embed_documents([model.query_prefix + text for text in texts])
+
+
+def _batcher(model):
+    batcher = _batchers.get(model.key)
+    if batcher is None:
+        with _lock:
+            if model.key not in _batchers:
+                _batchers[model.key] = EmbeddingBatcher(
+                    lambda texts: embed_queries(model, texts), **_batch_settings
+                )
+            batcher = _batchers[model.key]
+    return batcher
+
+
+def embed_query(model, text):
+    """Embed a user question, batched with questions from concurrent requests for the same model."""
+    return _batcher(model).embed(text)
+
+
+def document_models(document_ids):
+    """{document_id: EmbeddingModel} for the given documents. A document whose model is
+    no longer registered is left out (and so not searched) rather than queried with
+    vectors from the wrong model."""
+    if _engine is None:
+        model = current()
+        return {doc_id: model for doc_id in document_ids}
+    from app.models.document import Document
+    documents = Document.__table__
+    with _engine.connect() as conn:
+        rows = conn.execute(
+            select(documents.c.id, documents.c.embedding_model, documents.c.embedding_version)
+            .where(documents.c.id.in_(list(document_ids)))
+        ).all()
+    models = {}
+    for row in rows:
+        try:
+            models[row.id] = get(row.embedding_model, row.embedding_version)
+        except ValueError as e:
+            print(f">>>> ERROR: DOCUMENT {row.id} HAS AN UNREGISTERED EMBEDDING MODEL: {str(e)}")
+    return models
+
+
+def group_by_model(document_ids, models):
+    """[(model, [document_id, ...]), ...] in first-seen order, skipping ids missing from models."""
+    groups = {}
+    for doc_id in document_ids:
+        model = models.get(doc_id)
+        if model is not None:
+            groups.setdefault(model.key, (model, []))[1].append(doc_id)
+    return list(groups.values())
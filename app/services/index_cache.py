@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from app.services.metrics import Counter, Histogram, CACHE_ENTRIES
+
+INDEX_CACHE_REQUESTS = Counter(
+    'rag_index_cache_requests_total',
+    'Index lookups on the query path, by result (hit, miss, joined an in-flight load).',
+    ['result']
+)
+PREFETCH_OUTCOMES = Counter(
+    'rag_prefetch_total',
+    'Prefetched indexes, by outcome (used, joined, wasted, skipped).',
+    ['outcome']
+)
+PREFETCH_SAVED_SECONDS = Histogram(
+    'rag_prefetch_saved_seconds',
+    'Index load time taken off the critical path by a prefetch that a query then used.'
+)
+
+
+class _Entry:
+    __slots__ = ('value', 'signature', 'load_seconds', 'prefetched', 'used')
+
+    def __init__(self, value, signature, load_seconds, prefetched):
+        self.value = value
+        self.signature = signature
+        self.load_seconds = load_seconds
+        self.prefetched = prefetched
+        self.used = not prefetched
+
+
+class IndexCache:
+    """LRU cache of loaded indexes, safe to share between request threads.
+
+    signature(key) returns a cheap fingerprint of what is on disk (None if it is
+    gone), so an index rewritten or deleted behind the cache's back is reloaded
+    or dropped on the next lookup. Concurrent loads of the same key are collapsed
+    into one. Prefetched entries only take free slots or slots held by other
+    unused prefetches, and never more than prefetch_budget of them at a time,
+    so speculation can't push out indexes that queries are actually using.
+    """
+
+    def __init__(self, loader, signature, name, max_entries=32, prefetch_budget=8):
+        self.loader = loader
+        self.signature = signature
+        self.max_entries = max_entries
+        self.prefetch_budget = prefetch_budget
+        self._entries = OrderedDict()
+        self._inflight = {}  # key -> (Future, is_prefetch)
+        self._lock = threading.Lock()
+        CACHE_ENTRIES.set_function(lambda: len(self._entries), cache=name)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.prefetched and not entry.used:
+            PREFETCH_OUTCOMES.inc(outcome='wasted')
+
+    def _evict_for_query(self):
+        while len(self._entries) > self.max_entries:
+            key = next(iter(self._entries))
+            self._drop(key)
+
+    def _unused_prefetches(self):
+        return sum(1 for e in self._entries.values() if e.prefetched and not e.used)
+
+    def _load(self, key, signature, future, prefetched):
+        started = time.perf_counter()
+        try:
+            value = self.loader(key)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        load_seconds = time.perf_counter() - started
+        with self._lock:
+            self._inflight.pop(key, None)
+            if value is not None:
+                self._drop(key)
+                self._entries[key] = _Entry(value, signature, load_seconds, prefetched)
+                self._evict_for_query()
+        future.set_result(value)
+        return value
+
+    def get(self, key):
+        """Return the loaded index for key, loading it if needed (None if it doesn't exist)."""
+        signature = self.signature(key)
+        if signature is None:
+            self.invalidate(key)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(key)
+                if not entry.used:
+                    entry.used = True
+                    PREFETCH_OUTCOMES.inc(outcome='used')
+                    PREFETCH_SAVED_SECONDS.observe(entry.load_seconds)
+                INDEX_CACHE_REQUESTS.inc(result='hit')
+                return entry.value
+            if entry is not None:
+                self._drop(key)
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                future = Future()
+                self._inflight[key] = (future, False)
+            else:
+                future, was_prefetch = inflight
+
+        if inflight is not None:
+            INDEX_CACHE_REQUESTS.inc(result='joined')
+            value = future.result()
+            if was_prefetch:
+                # A prefetch started the load; the query only waited for the remainder
+                PREFETCH_OUTCOMES.inc(outcome='joined')
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        entry.used = True
+            return value
+
+        INDEX_CACHE_REQUESTS.inc(result='miss')
+        return self._load(key, signature, future, prefetched=False)
+
+    def prefetch(self, key):
+        """Load key in the calling thread if the prefetch budget allows it."""
+        signature = self.signature(key)
+        if signature is None:
+            return False
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None and entry.signature == signature) or key in self._inflight:
+                return False
+            if self._unused_prefetches() >= self.prefetch_budget:
+                PREFETCH_OUTCOMES.inc(outcome='skipped')
+                return False
+            if len(self._entries) >= self.max_entries:
+                # Only make room by replacing another speculative load, never a hot entry
+                victim = next((k for k, e in self._entries.items() if e.prefetched and not e.used), None)
+                if victim is None:
+                    PREFETCH_OUTCOMES.inc(outcome='skipped')
+                    return False
+                self._drop(victim)
+            future = Future()
+            self._inflight[key] = (future, True)
+        try:
+            self._load(key, signature, future, prefetched=True)
+        except Exception as e:
+            print(f">>>> PREFETCH OF {key} FAILED: {str(e)}")
+            return False
+        return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._drop(key)
@@ -0,0 +1,265 @@
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from app.services import rag_service, embedding_models
+from app.services.shared_storage import dir_size
+
+
+class Checkpoint:
+    """Progress file for a long-running maintenance command.
+
+    Completed item ids are appended as work finishes and the file is replaced
+    atomically, so an interrupted run can pick up where it stopped.
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.done = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+                # A checkpoint only applies to a rerun with the same parameters
+                if state.get('params') == params:
+                    self.done = state.get('done', {})
+            except (OSError, ValueError):
+                self.done = {}
+
+    def is_done(self, item_id):
+        return str(item_id) in self.done
+
+    def mark(self, item_id, result):
+        self.done[str(item_id)] = result
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'params': self.params, 'done': self.done}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _read_index_counts(index_path):
+    """(vectors in index.faiss, ids mapped, docstore entries) without loading the embedding model."""
+    import faiss
+    index = faiss.read_index(os.path.join(index_path, 'index.faiss'))
+    with open(os.path.join(index_path, 'index.pkl'), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return index.ntotal, len(index_to_docstore_id), len(docstore._dict)
+
+
+def local_store():
+    """The local FAISS backend; the file-level commands make no sense for a remote store."""
+    store = rag_service.get_vector_store()
+    if store.name != 'faiss':
+        raise ValueError(f"Only applies to the local FAISS backend (configured: {store.name})")
+    return store
+
+
+def _rebuild_one(doc_id, file_path, ext, model_name, model_version, store_settings):
+    """Runs in a worker process: re-chunk, re-embed and rewrite one document's index."""
+    started = time.perf_counter()
+    # Spawned workers never run create_app, so point them at the parent's backend
+    if rag_service.store_settings() != store_settings:
+        rag_service.configure_store(store_settings)
+    model = embedding_models.get(model_name, model_version)
+    chunks = rag_service.ingest_document(file_path, doc_id, ext, None, model=model)
+    return chunks, time.perf_counter() - started
+
+
+def rebuild(documents, checkpoint, workers, on_result, claim=None):
+    """Rebuild the given documents' indexes on a process pool.
+
+    documents: list of (doc_id, file_path, ext, model_name, model_version), the
+    model being the one the document is indexed with. Items already in the
+    checkpoint are skipped. Items are submitted as workers free up, each only
+    once claim(doc_id) (if given) has returned True, so a claim is held just
+    while its document is being rebuilt; refused items are skipped.
+    on_result(doc_id, chunks_or_None, seconds, error) runs in this process for
+    each finished item, before it is checkpointed. Failed items are not
+    checkpointed, so a rerun retries them; a failure leaves the document's
+    existing index as it was (a worker that dies takes every item still queued
+    with it, so an error says nothing about the index).
+    Returns the number of items submitted.
+    """
+    pending = iter([d for d in documents if not checkpoint.is_done(d[0])])
+    submitted = 0
+    # spawn: each worker loads its own copy of the model instead of inheriting
+    # a forked torch/OpenMP runtime
+    context = multiprocessing.get_context('spawn')
+    store_settings = rag_service.store_settings()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {}
+
+        def submit_next():
+            nonlocal submitted
+            for doc in pending:
+                if claim is None or claim(doc[0]):
+                    futures[pool.submit(_rebuild_one, *doc, store_settings)] = doc[0]
+                    submitted += 1
+                    return
+
+        for _ in range(workers):
+            submit_next()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                doc_id = futures.pop(future)
+                try:
+                    chunks, seconds = future.result()
+                    on_result(doc_id, chunks, seconds, None)
+                    checkpoint.mark(doc_id, {'chunks': chunks})
+                except Exception as e:
+                    on_result(doc_id, None, 0.0, str(e) or type(e).__name__)
+                submit_next()
+    return submitted
+
+
+def _verify_remote(store, index_key, expected):
+    try:
+        vectors = store.count(index_key)
+    except Exception as e:
+        return {'ok': False, 'problem': f"unreadable: {str(e)}"}
+    if not vectors:
+        return {'ok': False, 'problem': 'index missing'}
+    if vectors != expected:
+        return {'ok': False, 'problem': f"{vectors} vectors, expected {expected}"}
+    return {'ok': True, 'problem': None}
+
+
+def verify(documents, checkpoint, on_result):
+    """Check each ready document's index against Document.chunk_count.
+    documents: list of (doc_id, index_key, expected_chunks)."""
+    store = rag_service.get_vector_store()
+    for doc_id, index_key, expected in documents:
+        if checkpoint.is_done(doc_id):
+            continue
+        if store.name != 'faiss':
+            result = _verify_remote(store, index_key, expected)
+            on_result(doc_id, result)
+            checkpoint.mark(doc_id, result)
+            continue
+        index_path = store.index_path(index_key)
+        if not store.exists(index_key):
+            result = {'ok': False, 'problem': 'index missing'}
+        else:
+            try:
+                vectors, mapped, stored = _read_index_counts(index_path)
+                problems = []
+                if vectors != expected:
+                    problems.append(f"{vectors} vectors, expected {expected}")
+                if mapped != vectors:
+                    problems.append(f"{mapped} mapped ids for {vectors} vectors")
+                if stored != mapped:
+                    problems.append(f"{stored} docstore entries for {mapped} mapped ids")
+                result = {'ok': not problems, 'problem': '; '.join(problems) or None}
+            except Exception as e:
+                result = {'ok': False, 'problem': f"unreadable: {str(e)}"}
+        on_result(doc_id, result)
+        checkpoint.mark(doc_id, result)
+
+
+def compact(index_keys, on_result):
+    """Drop docstore entries no vector points at any more and rewrite the index.
+    index_keys: the documents' embedding_models.document_index_key values.
+    Returns the number of indexes rewritten. Safe to rerun."""
+    store = local_store()
+    rewritten = 0
+    for index_key in index_keys:
+        index_path = store.index_path(index_key)
+        pkl_path = os.path.join(index_path, 'index.pkl')
+        if not store.exists(index_key) or not os.path.exists(pkl_path):
+            continue
+        with open(pkl_path, 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        referenced = set(index_to_docstore_id.values())
+        stale = [i for i in docstore._dict if i not in referenced]
+        if not stale:
+            continue
+        docstore.delete(stale)
+        tmp_path = f"{pkl_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((docstore, index_to_docstore_id), f)
+        os.replace(tmp_path, pkl_path)
+        store.publish(index_key)
+        rewritten += 1
+        on_result(index_key, len(stale))
+    return rewritten
+
+
+def find_orphans(live_index_keys, referenced_uploads, upload_folder, min_age_seconds):
+    """Index directories and upload files nothing refers to any more.
+
+    live_index_keys: index keys (embedding_models.document_index_key) to keep, those
+    of documents ready or still processing; an index for a model the document no
+    longer uses (e.g. left by an interrupted migration) is an orphan.
+    referenced_uploads: absolute paths of files some Document still points at.
+    Anything younger than min_age_seconds is left alone, since an upload or
+    ingest may be in the middle of creating it.
+    Returns (list_of_index_dirs, list_of_upload_files).
+    """
+    storage_path = local_store().storage_path
+    now = time.time()
+    live = {str(i) for i in live_index_keys}
+    orphan_indexes = []
+    if os.path.isdir(storage_path):
+        for name in os.listdir(storage_path):
+            path = os.path.join(storage_path, name)
+            if not os.path.isdir(path) or now - os.path.getmtime(path) < min_age_seconds:
+                continue
+            # Leftovers from an interrupted LocalFaissStore._save swap are orphans too
+            if name not in live:
+                orphan_indexes.append(path)
+
+    referenced = {os.path.abspath(p) for p in referenced_uploads}
+    orphan_uploads = []
+    if os.path.isdir(upload_folder):
+        for name in os.listdir(upload_folder):
+            path = os.path.abspath(os.path.join(upload_folder, name))
+            if not os.path.isfile(path) or now - os.path.getmtime(path) < min_age_seconds:
+                continue
+            if path not in referenced:
+                orphan_uploads.append(path)
+    return orphan_indexes, orphan_uploads
+
+
+def remove_orphans(index_dirs, upload_files):
+    """Delete what find_orphans returned, along with the copies published to shared
+    storage (if configured), so another node doesn't fetch them back. Returns the
+    bytes freed on this node."""
+    store = local_store()
+    freed = 0
+    for path in index_dirs:
+        freed += dir_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+        if store.shared is not None:
+            # The directory name is the index key the artifact was published under
+            store.shared.delete(os.path.basename(path))
+    for path in upload_files:
+        if os.path.exists(path):
+            freed += os.path.getsize(path)
+        rag_service.delete_upload(path)
+    return freed
+
+
+def disk_usage(documents):
+    """Bytes used per owner. documents: list of (index_key, owner_key, file_path).
+    Returns {owner_key: {'uploads': bytes, 'indexes': bytes, 'documents': count}}."""
+    store = local_store()
+    usage = {}
+    for index_key, owner_key, file_path in documents:
+        entry = usage.setdefault(owner_key, {'uploads': 0, 'indexes': 0, 'documents': 0})
+        entry['documents'] += 1
+        if file_path and os.path.isfile(file_path):
+            entry['uploads'] += os.path.getsize(file_path)
+        index_path = store.index_path(index_key)
+        if os.path.isdir(index_path):
+            entry['indexes'] += dir_size(index_path)
+    return usage
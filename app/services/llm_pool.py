@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from app.services.metrics import Counter, Histogram, CACHE_ENTRIES
+
+LLM_CLIENT_REQUESTS = Counter(
+    'rag_llm_client_requests_total',
+    'Gemini client lookups, by whether a pooled client was reused.',
+    ['result']
+)
+LLM_CLIENT_EVICTIONS = Counter(
+    'rag_llm_client_evictions_total',
+    'Pooled Gemini clients dropped, by reason (idle or capacity).',
+    ['reason']
+)
+LLM_CLIENT_SETUP_SECONDS = Histogram(
+    'rag_llm_client_setup_seconds',
+    'Time to the first response of the first call on each new Gemini client '
+    '(constructing it opens no connection; that call pays for TCP and TLS setup).'
+)
+
+
+def _default_factory(api_key, base_url=None):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    options = {'base_url': base_url} if base_url else {}
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        google_api_key=api_key,
+        temperature=0.3,
+        max_retries=1,
+        convert_system_message_to_human=True,
+        **options
+    )
+
+
+def _first_call_timer(client):
+    """Attach a callback to a new client that observes LLM_CLIENT_SETUP_SECONDS for
+    its first call (until the first streamed token or the answer) and then detaches."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class FirstCallTimer(BaseCallbackHandler):
+        def __init__(self):
+            self.started = {}
+            self.done = False
+            self.lock = threading.Lock()
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            with self.lock:
+                if not self.done:
+                    self.started[run_id] = time.perf_counter()
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self.on_chat_model_start(serialized, prompts, run_id=run_id)
+
+        def _finish(self, run_id, ok=True):
+            with self.lock:
+                started = self.started.pop(run_id, None)
+                if self.done or started is None:
+                    return
+                if ok:
+                    self.done = True
+            if ok:
+                LLM_CLIENT_SETUP_SECONDS.observe(time.perf_counter() - started)
+                # A new list: a call in progress may be iterating the old one
+                client.callbacks = [c for c in client.callbacks if c is not self]
+
+        def on_llm_new_token(self, token, *, run_id, **kwargs):
+            self._finish(run_id)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            self._finish(run_id)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            # A failed first call says nothing about setup; the next one is timed instead
+            self._finish(run_id, ok=False)
+
+    timer = FirstCallTimer()
+    try:
+        client.callbacks = list(client.callbacks or []) + [timer]
+    except (AttributeError, TypeError, ValueError):
+        pass  # Not a LangChain model: nothing to time
+    return client
+
+
+class LLMClientPool:
+    """Bounded LRU pool of Gemini chat clients, one per API key.
+
+    A client owns its HTTP connection pool, so reusing it keeps connections
+    alive between chat turns instead of paying a fresh handshake every message.
+    Clients are safe to share between request threads; the lock only guards
+    the pool bookkeeping, never the network call.
+    """
+
+    def __init__(self, factory=None, max_clients=32, idle_seconds=600, base_url=None):
+        self.factory = factory or _default_factory  # factory(api_key, base_url)
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self.base_url = base_url
+        self._clients = OrderedDict()  # key digest -> (client, last_used)
+        self._lock = threading.Lock()
+        CACHE_ENTRIES.set_function(lambda: len(self._clients), cache='llm_clients')
+
+    def init_app(self, app):
+        self.max_clients = app.config.get('LLM_POOL_MAX_CLIENTS', self.max_clients)
+        self.idle_seconds = app.config.get('LLM_POOL_IDLE_SECONDS', self.idle_seconds)
+        self.base_url = app.config.get('GEMINI_BASE_URL', self.base_url)
+
+    @staticmethod
+    def _key(api_key):
+        # Never keep raw API keys as dictionary keys (they'd show up in debug dumps)
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+    def _evict_idle(self, now):
+        # OrderedDict is kept in last-used order, so idle entries are at the front
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._clients[key]
+            LLM_CLIENT_EVICTIONS.inc(reason='idle')
+
+    def get(self, api_key):
+        """Return a shared client for api_key, building one on a miss."""
+        key = self._key(api_key)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                self._clients[key] = (entry[0], now)
+                self._clients.move_to_end(key)
+                LLM_CLIENT_REQUESTS.inc(result='reused')
+                return entry[0]
+
+        # Build outside the lock so a slow construction doesn't block other users
+        client = _first_call_timer(self.factory(api_key, self.base_url))
+        LLM_CLIENT_REQUESTS.inc(result='created')
+
+        with self._lock:
+            existing = self._clients.get(key)
+            if existing is not None:
+                # Another thread won the race; keep its client so connections are shared
+                client = existing[0]
+            self._clients[key] = (client, time.monotonic())
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+                LLM_CLIENT_EVICTIONS.inc(reason='capacity')
+        return client
+
+    def discard(self, api_key):
+        """Drop the client for api_key (e.g. after the user changes or removes their key)."""
+        with self._lock:
+            self._clients.pop(self._key(api_key), None)
+
+
+llm_pool = LLMClientPool()
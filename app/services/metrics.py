@@ -0,0 +1,239 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets (seconds) tuned for a chat turn: sub-ms FAISS searches up to long Gemini generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with _lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        """Read the value from fn() at scrape time (used for cache sizes)."""
+        key = self._key(labels)
+        with _lock:
+            self._functions[key] = fn
+
+    def value(self, **labels):
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def _samples(self):
+        with _lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        samples = dict(items)
+        for key, fn in functions:
+            try:
+                samples[key] = fn()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in samples.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        """Return (count, sum) for a label set; handy for benchmarks and admin pages."""
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return 0, 0.0
+        return state['count'], state['sum']
+
+    def _samples(self):
+        with _lock:
+            items = [(k, {'counts': list(v['counts']), 'sum': v['sum'], 'count': v['count']})
+                     for k, v in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+def render_latest():
+    """Render every registered metric in the Prometheus text exposition format."""
+    with _lock:
+        metrics = list(_registry)
+    return "\n".join(m.render() for m in metrics) + "\n"
+
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# RAG pipeline metrics
+QUERY_STAGE_SECONDS = Histogram(
+    'rag_query_stage_seconds',
+    'Time spent in each stage of a chat turn (query_embed, retrieval, search, shared_search, context_assembly, llm_ttft, llm_total).',
+    ['stage', 'mode']
+)
+DOCUMENT_SEARCH_SECONDS = Histogram(
+    'rag_document_search_seconds',
+    'Time spent loading and searching a single document index.',
+    []
+)
+DOCUMENT_SEARCH_OUTCOMES = Counter(
+    'rag_document_search_total',
+    'Per-document searches, by outcome (ok, timeout, error, missing).',
+    ['outcome']
+)
+PREFETCH_SECONDS = Histogram(
+    'rag_prefetch_seconds',
+    'Background time spent warming the encoder and a conversation\'s indexes.'
+)
+INGEST_STAGE_SECONDS = Histogram(
+    'rag_ingest_stage_seconds',
+    'Time spent in each stage of document ingestion (load, split, dedup, embed, index_write, summarize).',
+    ['stage']
+)
+INGEST_CHUNKS = Counter(
+    'rag_ingest_chunks_total',
+    'Chunks produced by document ingestion.'
+)
+REINGEST_CHUNKS = Counter(
+    'rag_reingest_chunks_total',
+    'Chunks handled when a document is replaced in place, by action (added, removed, reused).',
+    ['action']
+)
+STREAMS_IN_FLIGHT = Gauge(
+    'rag_streams_in_flight',
+    'Chat streams currently being generated.'
+)
+SSE_EVENTS = Counter(
+    'rag_sse_events_total',
+    'Server-sent events written to chat streams, by kind (event, heartbeat).',
+    ['kind']
+)
+SSE_WRITES = Counter(
+    'rag_sse_writes_total',
+    'Response writes on chat streams (each carries one or more events), by encoding.',
+    ['encoding']
+)
+SSE_BYTES = Counter(
+    'rag_sse_bytes_total',
+    'Bytes written on chat streams after encoding, by encoding (identity, gzip).',
+    ['encoding']
+)
+CACHE_ENTRIES = Gauge(
+    'rag_cache_entries',
+    'Entries held in in-process caches.',
+    ['cache']
+)
@@ -0,0 +1,163 @@
+import threading
+from sqlalchemy import create_engine, select, insert, delete
+from langchain_core.documents import Document as LCDocument
+from app.models.chunk import ParentSection
+from app.services.metrics import Counter
+
+PARENT_EXPANSIONS = Counter(
+    'rag_parent_expansions_total',
+    'Retrieved chunks by how they reached the prompt: as their parent section (expanded), '
+    'folded into a section already there (merged), as themselves (chunk: no section, or it '
+    'didn\'t fit the budget) or not at all (dropped: over the budget).',
+    ['outcome']
+)
+
+_sections = ParentSection.__table__
+
+# Ingest runs on worker threads and processes without an app context, so this
+# module talks to the database through an engine of its own (as dedup_service)
+_engine = None
+_engine_url = None
+_engine_lock = threading.Lock()
+
+
+def init_app(app):
+    """Share the app's engine."""
+    global _engine, _engine_url
+    from app.extensions import db
+    with app.app_context():
+        _engine = db.engine
+        _engine_url = db.engine.url.render_as_string(hide_password=False)
+
+
+def configure(settings):
+    """In a worker process, connect to DEDUP_DATABASE_URL (the parent's database)."""
+    global _engine, _engine_url
+    url = settings.get('DEDUP_DATABASE_URL')
+    with _engine_lock:
+        if url and url != _engine_url:
+            _engine = create_engine(url, pool_pre_ping=True)
+            _engine_url = url
+
+
+def replace(document_id, model_key, parents):
+    """Store a document's parent sections (LCDocuments with a parent_id in their
+    metadata) for model_key's index, replacing any from a previous ingest."""
+    if _engine is None:
+        return
+    with _engine.begin() as conn:
+        conn.execute(delete(_sections).where(
+            _sections.c.document_id == document_id, _sections.c.model_key == model_key
+        ))
+        if parents:
+            conn.execute(insert(_sections), [
+                {
+                    'document_id': document_id,
+                    'model_key': model_key,
+                    'parent_id': parent.metadata['parent_id'],
+                    'text': parent.page_content,
+                    'section_metadata': parent.metadata,
+                }
+                for parent in parents
+            ])
+
+
+def forget(document_id, model_key=None):
+    """Drop a document's parent sections (for one embedding model, or all)."""
+    if _engine is None:
+        return
+    condition = _sections.c.document_id == document_id
+    if model_key is not None:
+        condition = condition & (_sections.c.model_key == model_key)
+    with _engine.begin() as conn:
+        conn.execute(delete(_sections).where(condition))
+
+
+def lookup(keys):
+    """{(document_id, model_key, parent_id): text} for the given keys that are stored."""
+    keys = set(keys)
+    if _engine is None or not keys:
+        return {}
+    with _engine.connect() as conn:
+        rows = conn.execute(
+            select(_sections.c.document_id, _sections.c.model_key, _sections.c.parent_id, _sections.c.text)
+            .where(
+                _sections.c.document_id.in_({key[0] for key in keys}),
+                _sections.c.parent_id.in_({key[2] for key in keys}),
+            )
+        ).all()
+    found = {}
+    for row in rows:
+        key = (row.document_id, row.model_key, row.parent_id)
+        if key in keys:
+            found[key] = row.text
+    return found
+
+
+def _interleave(docs):
+    """docs (each document's hits best first, one document after another, as
+    rag_service._search_documents returns them) in rank order across documents:
+    every document's best hit, then every second best, and so on."""
+    groups = {}
+    for doc in docs:
+        groups.setdefault(doc.metadata.get('document_id'), []).append(doc)
+    ranked = []
+    for rank in range(max((len(group) for group in groups.values()), default=0)):
+        ranked.extend(group[rank] for group in groups.values() if rank < len(group))
+    return ranked
+
+
+def _key(doc, model_keys):
+    parent_id = doc.metadata.get('parent_id')
+    try:
+        document_id = int(doc.metadata.get('document_id'))
+    except (TypeError, ValueError):
+        return None
+    model_key = model_keys.get(document_id)
+    if parent_id is None or model_key is None:
+        return None
+    return document_id, model_key, parent_id
+
+
+def expand(docs, model_keys, budget_chars, max_blocks=40):
+    """Small-to-big context: the parent sections of the retrieved chunks, each once,
+    best hit first, until budget_chars of text or max_blocks blocks.
+
+    A chunk without a stored section (indexed before parent sections, or with the
+    'recursive' splitter) is used as it is, and so is one whose section doesn't fit
+    what is left of the budget. model_keys: {document_id: model key} of the searched
+    documents. Returns LCDocuments, each with the metadata of its best chunk and the
+    shared_sources of all the chunks folded into it.
+    """
+    ranked = _interleave(docs)
+    keys = [_key(doc, model_keys) for doc in ranked]
+    sections = lookup(key for key in keys if key is not None)
+
+    blocks = []
+    by_key = {}
+    used = 0
+    for doc, key in zip(ranked, keys):
+        block = by_key.get(key)
+        if block is not None:
+            shared = block.metadata.setdefault('shared_sources', [])
+            shared.extend(s for s in doc.metadata.get('shared_sources', []) if s not in shared)
+            PARENT_EXPANSIONS.inc(outcome='merged')
+            continue
+        section = sections.get(key)
+        if section is not None and (used + len(section) <= budget_chars or not blocks):
+            text, outcome = section, 'expanded'
+        else:
+            text, outcome = doc.page_content, 'chunk'
+        if len(blocks) >= max_blocks or (blocks and used + len(text) > budget_chars):
+            PARENT_EXPANSIONS.inc(outcome='dropped')
+            continue
+        used += len(text)
+        metadata = dict(doc.metadata)  # Never modify a cached index's documents
+        if 'shared_sources' in metadata:
+            metadata['shared_sources'] = list(metadata['shared_sources'])
+        block = LCDocument(page_content=text, metadata=metadata)
+        blocks.append(block)
+        if outcome == 'expanded':
+            by_key[key] = block
+        PARENT_EXPANSIONS.inc(outcome=outcome)
+    return blocks
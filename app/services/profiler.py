@@ -0,0 +1,323 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import request, g
+from flask_login import current_user
+from app.services.metrics import Counter
+
+PROFILES_RECORDED = Counter(
+    'rag_profiles_recorded_total',
+    'Request profiles written by the sampling profiler.'
+)
+
+_PROFILE_ID = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{6}$')
+
+
+class ProfileTrigger:
+    """Which requests to profile next. route is an endpoint ('chat.api_chat') or a
+    path prefix ('/chat/'); user_id limits it to one user's requests. Either may be
+    None (any). Disarms itself after count requests or at expires_at."""
+
+    def __init__(self, route, user_id, user_label, count, expires_at):
+        self.route = route or None
+        self.user_id = user_id
+        self.user_label = user_label
+        self.count = count
+        self.remaining = count
+        self.expires_at = expires_at
+
+    def matches(self, request, user_id):
+        if self.user_id is not None and user_id != self.user_id:
+            return False
+        if self.route is None:
+            return True
+        if self.route.startswith('/'):
+            return request.path.startswith(self.route)
+        return request.endpoint == self.route
+
+    def to_dict(self):
+        return {
+            'route': self.route,
+            'user_id': self.user_id,
+            'user': self.user_label,
+            'count': self.count,
+            'remaining': self.remaining,
+            'expires_at': self.expires_at.isoformat(),
+        }
+
+
+class ProfileSession:
+    """Stack samples of one profiled request: its request thread and any thread
+    working on its behalf (the chat generation thread), until all have detached."""
+
+    def __init__(self, meta, deadline):
+        self.profile_id = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.meta = meta
+        self.deadline = deadline
+        self.started = time.monotonic()
+        self.threads = {}  # thread ident -> root frame name ('request', 'generation')
+        self.participants = 0
+        self.stacks = {}   # folded stack -> samples
+        self.samples = 0
+        self.truncated = False
+        self._lock = threading.Lock()
+
+    def add(self, stack):
+        with self._lock:
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def folded(self):
+        """The samples in collapsed-stack format ('root;caller;callee count' per line),
+        as read by flamegraph.pl, inferno and speedscope."""
+        with self._lock:
+            return "".join(f"{stack} {n}\n" for stack, n in sorted(self.stacks.items()))
+
+
+class SamplingProfiler:
+    """On-demand wall-clock sampling profiler for live requests.
+
+    An admin arms a trigger (see arm); the next matching requests are sampled
+    every interval by a background thread reading sys._current_frames(), so
+    time spent waiting on Gemini, the database or a lock shows up as well as
+    CPU time (FAISS, MiniLM). Each request's samples are written to the profile
+    directory as a collapsed-stack file plus a JSON sidecar.
+
+    While nothing is armed, the request hook is a single attribute check and no
+    sampler thread runs.
+    """
+
+    def __init__(self, interval_seconds=0.005, max_seconds=300, max_files=200, arm_minutes=30):
+        self.interval_seconds = interval_seconds
+        self.max_seconds = max_seconds
+        self.max_files = max_files
+        self.arm_minutes = arm_minutes
+        self.directory = None
+        self.trigger = None
+        self._sessions = []
+        self._sampler = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._labels = {}  # code object -> frame name
+
+    def init_app(self, app):
+        self.interval_seconds = app.config.get('PROFILER_INTERVAL_MS', self.interval_seconds * 1000) / 1000.0
+        self.max_seconds = app.config.get('PROFILER_MAX_SECONDS', self.max_seconds)
+        self.max_files = app.config.get('PROFILER_MAX_FILES', self.max_files)
+        self.arm_minutes = app.config.get('PROFILER_ARM_MINUTES', self.arm_minutes)
+        self.directory = os.path.join(app.instance_path, 'profiles')
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def arm(self, route=None, user_id=None, user_label=None, count=1):
+        """Profile the next count requests matching route and user_id (replacing any
+        earlier trigger). Expires after arm_minutes if not enough requests come in."""
+        trigger = ProfileTrigger(
+            route, user_id, user_label, count,
+            datetime.utcnow() + timedelta(minutes=self.arm_minutes)
+        )
+        with self._lock:
+            self.trigger = trigger
+        return trigger
+
+    def disarm(self):
+        with self._lock:
+            self.trigger = None
+
+    def armed(self):
+        """The current trigger, or None (clearing an expired one)."""
+        with self._lock:
+            if self.trigger is not None and self.trigger.expires_at < datetime.utcnow():
+                self.trigger = None
+            return self.trigger
+
+    def current(self):
+        """The session the calling thread is being profiled for, or None. Code that
+        hands a request's work to another thread passes this along to attach."""
+        return getattr(self._local, 'session', None)
+
+    def _before_request(self):
+        trigger = self.trigger
+        if trigger is None:
+            return  # All that profiling costs while disarmed
+        # Never profile the admin pages used to drive this, or static files
+        if request.blueprint == 'admin' or request.endpoint in (None, 'static'):
+            return
+        user_id = current_user.id if current_user.is_authenticated else None
+        with self._lock:
+            if self.trigger is not trigger or not trigger.matches(request, user_id):
+                return
+            if trigger.expires_at < datetime.utcnow():
+                self.trigger = None
+                return
+            trigger.remaining -= 1
+            if trigger.remaining <= 0:
+                self.trigger = None
+        session = ProfileSession({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'user_id': user_id,
+            'started_at': datetime.utcnow().isoformat(),
+            'interval_ms': self.interval_seconds * 1000,
+        }, time.monotonic() + self.max_seconds)
+        self.attach(session, 'request')
+        g._profile_session = session
+
+    def _after_request(self, response):
+        session = g.pop('_profile_session', None)
+        if session is None:
+            return response
+        session.meta['status'] = response.status_code
+        ident = threading.get_ident()
+        self._local.session = None
+        # A streamed body is produced after this returns, on the same thread, so
+        # the request thread stays sampled until the response is closed
+        response.call_on_close(lambda: self.detach(session, ident))
+        return response
+
+    def _teardown_request(self, exc):
+        # Only still set if after_request never ran (the request failed before a response)
+        session = g.pop('_profile_session', None)
+        if session is not None:
+            session.meta['status'] = 500
+            self.detach(session)
+
+    def attach(self, session, root):
+        """Start sampling the calling thread for session, under root in the profile."""
+        with self._lock:
+            session.threads[threading.get_ident()] = root
+            session.participants += 1
+            if session not in self._sessions:
+                self._sessions.append(session)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._sampler.start()
+        self._local.session = session
+
+    def detach(self, session, ident=None):
+        """Stop sampling a thread (the calling one by default). The profile is written
+        once the last thread of its session detaches."""
+        if ident is None or ident == threading.get_ident():
+            self._local.session = None
+        with self._lock:
+            session.threads.pop(ident or threading.get_ident(), None)
+            session.participants -= 1
+            if session.participants > 0:
+                return
+            self._sessions.remove(session)
+        try:
+            self._write(session)
+        except Exception as e:
+            print(f">>>> ERROR WRITING PROFILE {session.profile_id}: {str(e)}")
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._sampler = None
+                    return
+            frames = sys._current_frames()
+            now = time.monotonic()
+            for session in sessions:
+                if now > session.deadline:
+                    session.truncated = True
+                    continue
+                for ident, root in list(session.threads.items()):
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        session.add(self._fold(frame, root))
+            del frames
+            time.sleep(self.interval_seconds)
+
+    def _fold(self, frame, root):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = _frame_label(code)
+            names.append(label)
+            frame = frame.f_back
+        names.append(root)
+        return ";".join(reversed(names))
+
+    def _write(self, session):
+        os.makedirs(self.directory, exist_ok=True)
+        meta = dict(session.meta)
+        meta.update(
+            id=session.profile_id,
+            seconds=round(time.monotonic() - session.started, 3),
+            samples=session.samples,
+            truncated=session.truncated,
+        )
+        base = os.path.join(self.directory, session.profile_id)
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            f.write(session.folded())
+        # The sidecar last: list_profiles only shows profiles that have one
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        PROFILES_RECORDED.inc()
+        self._prune()
+
+    def _prune(self):
+        ids = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+        for profile_id in ids[:max(0, len(ids) - self.max_files)]:
+            self.delete(profile_id)
+
+    def list_profiles(self):
+        """Metadata of the stored profiles, newest first."""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def profile_path(self, profile_id):
+        """Path of a stored profile's collapsed-stack file, or None."""
+        if self.directory is None or not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + '.folded')
+        return path if os.path.exists(path) else None
+
+    def delete(self, profile_id):
+        if self.directory is None or not _PROFILE_ID.match(profile_id):
+            return False
+        removed = False
+        for ext in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(self.directory, profile_id + ext))
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def _frame_label(code):
+    """'function (path:line)', the path relative to site-packages or the app root."""
+    path = code.co_filename.replace('\\', '/')
+    for marker in ('/site-packages/', '/dist-packages/', '/app/'):
+        if marker in path:
+            path = ('app/' if marker == '/app/' else '') + path.rsplit(marker, 1)[1]
+            break
+    else:
+        path = os.path.basename(path)
+    # ';' separates frames and the last space the count in collapsed stacks
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(';', ':')
+
+
+profiler = SamplingProfiler()
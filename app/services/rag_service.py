@@ -1,40 +1,188 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+from app.services.llm_pool import llm_pool
+from app.services.text_splitter import LinearTokenSplitter, load_word_tokens, split_parent_child
+from app.services import (
+    vector_store, shared_storage, summary_service, dedup_service, embedding_models, parent_sections,
+    retrieval_filter as filters
+)
+from langchain_core.documents import Document as LCDocument
+from app.services.metrics import (
+    QUERY_STAGE_SECONDS, DOCUMENT_SEARCH_SECONDS, PREFETCH_SECONDS, INGEST_STAGE_SECONDS,
+    DOCUMENT_SEARCH_OUTCOMES, INGEST_CHUNKS, REINGEST_CHUNKS
+)
+import hashlib
 import os
-import shutil
-
-# To store local FAISS databases per document
-FAISS_STORAGE_PATH = "instance/faiss_indexes"
-
-# Global embeddings instance (loads into memory once, avoids reloading)
-# all-MiniLM-L6-v2 is fast and small
-_embeddings = None
-
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Where chunk vectors live (local FAISS by default); see vector_store.create_store
+_store = None
+_store_settings = {}
+_store_lock = threading.Lock()
+# Mirror of the upload folder in shared storage (None on a single node)
+_uploads = None
+
+# Per-document index loads and searches share one bounded pool across all requests;
+# a turn waits at most RETRIEVAL_DEADLINE_SECONDS for them
+RETRIEVAL_MAX_WORKERS = 8
+RETRIEVAL_DEADLINE_SECONDS = 5.0
+_retrieval_pool = None
+_retrieval_pool_lock = threading.Lock()
+
+# Opening a conversation prefetches at most this many of its indexes
+PREFETCH_MAX_DOCUMENTS = 8
+
+# Summarize documents at ingest for the query router (see summary_service)
+DOCUMENT_SUMMARIES = False
+
+# Restrict retrieval to the pages a question names ("what do pages 10-20 say...")
+QUESTION_PAGE_FILTERS = True
+
+# Chunking: 'token' (LinearTokenSplitter, sized in embedding-model tokens) or
+# 'recursive' (the original 500/50-character RecursiveCharacterTextSplitter).
+# With PARENT_CHUNK_TOKENS, chunks are cut from parent sections of that size (in
+# either mode), which the prompt gets instead of the chunks (see parent_sections);
+# 0 turns it off
+INGEST_SETTINGS = (
+    'TEXT_SPLITTER', 'CHUNK_TOKENS', 'CHUNK_OVERLAP_TOKENS', 'PARENT_CHUNK_TOKENS',
+    'NEAR_DUPLICATE_DEDUP', 'NEAR_DUPLICATE_THRESHOLD', 'EMBEDDING_MODEL',
+)
+TEXT_SPLITTER = 'token'
+CHUNK_TOKENS = 128
+CHUNK_OVERLAP_TOKENS = 12
+PARENT_CHUNK_TOKENS = 512
+
+# Characters of parent sections one prompt's context may hold
+CONTEXT_BUDGET_CHARS = 12000
+_prefetch_pool = None
+
+# Embedding models are loaded once per process by embedding_models; each document
+# is indexed and queried with the model recorded on it
 def get_embeddings():
-    """Return HuggingFaceEmbeddings using local model."""
-    global _embeddings
-    if _embeddings is None:
-        _embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    return _embeddings
+    """Return the HuggingFaceEmbeddings new documents are indexed with."""
+    return embedding_models.load(embedding_models.current())
 
-def get_llm(api_key):
-    """Return ChatGoogleGenerativeAI using the provided API key."""
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        google_api_key=api_key,
-        temperature=0.3,
-        max_retries=1,
-        convert_system_message_to_human=True
-    )
+def embed_query(text, model=None):
+    """Embed a user question with model (default: the current one), batched with
+    questions from concurrent requests."""
+    return embedding_models.embed_query(model or embedding_models.current(), text)
 
-def _get_index_path(document_id):
-    return os.path.join(FAISS_STORAGE_PATH, str(document_id))
+def get_llm(api_key):
+    """Return a pooled ChatGoogleGenerativeAI for the provided API key."""
+    return llm_pool.get(api_key)
+
+def init_app(app):
+    """Pick up retrieval and vector store settings from the Flask config."""
+    global RETRIEVAL_MAX_WORKERS, RETRIEVAL_DEADLINE_SECONDS, PREFETCH_MAX_DOCUMENTS, DOCUMENT_SUMMARIES
+    global QUESTION_PAGE_FILTERS, CONTEXT_BUDGET_CHARS
+    RETRIEVAL_MAX_WORKERS = app.config.get('RETRIEVAL_MAX_WORKERS', RETRIEVAL_MAX_WORKERS)
+    RETRIEVAL_DEADLINE_SECONDS = app.config.get('RETRIEVAL_DEADLINE_SECONDS', RETRIEVAL_DEADLINE_SECONDS)
+    PREFETCH_MAX_DOCUMENTS = app.config.get('PREFETCH_MAX_DOCUMENTS', PREFETCH_MAX_DOCUMENTS)
+    DOCUMENT_SUMMARIES = app.config.get('DOCUMENT_SUMMARIES', DOCUMENT_SUMMARIES)
+    QUESTION_PAGE_FILTERS = app.config.get('QUESTION_PAGE_FILTERS', QUESTION_PAGE_FILTERS)
+    CONTEXT_BUDGET_CHARS = app.config.get('CONTEXT_BUDGET_CHARS', CONTEXT_BUDGET_CHARS)
+    embedding_models.init_app(app)
+    parent_sections.init_app(app)
+    settings = {
+        k: app.config[k] for k in vector_store.STORE_SETTINGS + INGEST_SETTINGS if k in app.config
+    }
+    settings['DEDUP_DATABASE_URL'] = dedup_service.init_app(app)
+    configure_store(settings)
+    cache = getattr(get_vector_store(), 'cache', None)
+    if cache is not None:
+        cache.max_entries = app.config.get('INDEX_CACHE_MAX_ENTRIES', cache.max_entries)
+        cache.prefetch_budget = app.config.get('PREFETCH_BUDGET_ENTRIES', cache.prefetch_budget)
+
+def _build_store():
+    global _store, _uploads
+    artifacts = shared_storage.create_artifact_store(_store_settings)
+    _uploads = None
+    if artifacts is not None:
+        _uploads = shared_storage.SharedUploads(
+            artifacts, _store_settings.get('ARTIFACT_COMPRESSION_LEVEL', 3)
+        )
+    _store = vector_store.create_store(_store_settings, get_embeddings, artifacts)
+
+def configure_store(settings):
+    """Select the vector store backend (and shared storage, if configured) and the
+    chunking and near-duplicate settings. Worker processes call this with
+    store_settings() from the parent, since they never run init_app."""
+    global _store_settings, TEXT_SPLITTER, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, PARENT_CHUNK_TOKENS
+    with _store_lock:
+        _store_settings = dict(settings)
+        TEXT_SPLITTER = _store_settings.get('TEXT_SPLITTER', TEXT_SPLITTER)
+        CHUNK_TOKENS = _store_settings.get('CHUNK_TOKENS', CHUNK_TOKENS)
+        CHUNK_OVERLAP_TOKENS = _store_settings.get('CHUNK_OVERLAP_TOKENS', CHUNK_OVERLAP_TOKENS)
+        PARENT_CHUNK_TOKENS = _store_settings.get('PARENT_CHUNK_TOKENS', PARENT_CHUNK_TOKENS)
+        dedup_service.configure(_store_settings)
+        parent_sections.configure(_store_settings)
+        embedding_models.configure(_store_settings)
+        _build_store()
+
+def store_settings():
+    return dict(_store_settings)
+
+def get_vector_store():
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _build_store()
+    return _store
+
+def check_model_dimension(model):
+    """Raise ValueError if the vector store can't hold model's vectors. A Pinecone
+    index has one fixed dimension for all its namespaces; local FAISS indexes take any."""
+    store = get_vector_store()
+    dimension = store.dimension()
+    if dimension is not None and dimension != model.dimension:
+        raise ValueError(
+            f"{model.key} produces {model.dimension}-dimensional vectors but the {store.name} "
+            f"index holds {dimension}-dimensional ones; use a model of that dimension or an index "
+            f"created for {model.dimension}"
+        )
 
-def ingest_document(file_path, document_id, file_type, api_key):
-    """Load, chunk, embed and store document in local FAISS."""
+def fetch_upload(file_path):
+    """Make sure an uploaded source file is on this node, fetching it from shared
+    storage if another node received it. Returns whether it is available."""
+    get_vector_store()
+    if _uploads is not None:
+        return _uploads.ensure(file_path)
+    return os.path.exists(file_path)
+
+def delete_upload(file_path):
+    """Remove an uploaded source file from this node and from shared storage."""
+    get_vector_store()
+    if _uploads is not None:
+        _uploads.delete(file_path)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+def _get_retrieval_pool():
+    global _retrieval_pool
+    if _retrieval_pool is None:
+        with _retrieval_pool_lock:
+            if _retrieval_pool is None:
+                _retrieval_pool = ThreadPoolExecutor(
+                    max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval"
+                )
+    return _retrieval_pool
+
+def _get_prefetch_pool():
+    global _prefetch_pool
+    if _prefetch_pool is None:
+        with _retrieval_pool_lock:
+            if _prefetch_pool is None:
+                # Kept separate from the retrieval pool so speculation never queues ahead of real queries
+                _prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+    return _prefetch_pool
+
+def _load_and_split(file_path, document_id, file_type, model):
+    """Load a file and split it into chunks tagged with document_id (token chunks are
+    measured with model's tokenizer). Returns (chunks, parent sections); with
+    PARENT_CHUNK_TOKENS each chunk carries the parent_id of its section, otherwise
+    there are no sections."""
     loaders = {
         'pdf': PyPDFLoader,
         'txt': TextLoader,
@@ -43,66 +191,377 @@ def ingest_document(file_path, document_id, file_type, api_key):
     loader_class = loaders.get(file_type)
     if not loader_class:
         raise ValueError(f"Unsupported file type: {file_type}")
-        
-    loader = loader_class(file_path)
-    docs = loader.load()
-
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500, chunk_overlap=50
-    )
-    chunks = splitter.split_documents(docs)
 
+    # Another node may have received the upload
+    if not fetch_upload(file_path):
+        raise FileNotFoundError(file_path)
+        
+    with INGEST_STAGE_SECONDS.time(stage='load'):
+        loader = loader_class(file_path)
+        docs = loader.load()
+
+    with INGEST_STAGE_SECONDS.time(stage='split'):
+        parents = []
+        if TEXT_SPLITTER == 'recursive':
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=500, chunk_overlap=50, add_start_index=True
+            )
+            if PARENT_CHUNK_TOKENS:
+                # Sections sized like the token ones, at about four characters a token
+                parents, chunks = split_parent_child(docs, RecursiveCharacterTextSplitter(
+                    chunk_size=PARENT_CHUNK_TOKENS * 4, chunk_overlap=0, add_start_index=True
+                ), splitter)
+            else:
+                chunks = splitter.split_documents(docs)
+        else:
+            word_tokens = load_word_tokens(model.hub_id)
+            splitter = LinearTokenSplitter(word_tokens, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+            if PARENT_CHUNK_TOKENS:
+                parents, chunks = split_parent_child(
+                    docs, LinearTokenSplitter(word_tokens, PARENT_CHUNK_TOKENS, 0), splitter
+                )
+            else:
+                chunks = splitter.split_documents(docs)
+
+    for parent, parent_id in zip(parents, _chunk_ids(parents)):
+        parent.metadata['document_id'] = str(document_id)
+        parent.metadata['parent_id'] = parent_id
     for chunk in chunks:
         chunk.metadata['document_id'] = str(document_id)
+        if 'parent_index' in chunk.metadata:
+            chunk.metadata['parent_id'] = parents[chunk.metadata.pop('parent_index')].metadata['parent_id']
+    return chunks, parents
+
+def _chunk_ids(chunks):
+    """Stable docstore ids derived from chunk content.
+    Repeated chunks get an occurrence suffix so every id stays unique."""
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.page_content.encode('utf-8')).hexdigest()
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{digest}:{occurrence}")
+    return ids
+
+def _summarize(chunks, document_id, api_key):
+    """Hierarchical summary for the query router, or None. Never fails the ingest."""
+    if not DOCUMENT_SUMMARIES or not api_key:
+        return None
+    try:
+        with INGEST_STAGE_SECONDS.time(stage='summarize'):
+            return summary_service.build_summary(chunks, get_llm(api_key))
+    except Exception as e:
+        print(f">>>> ERROR SUMMARIZING DOCUMENT {document_id}: {str(e)}")
+        return None
+
+def _plan_dedup(document_id, chunks, ids, model):
+    """(dedup plan or None, indexes of the chunks the document stores itself)."""
+    with INGEST_STAGE_SECONDS.time(stage='dedup'):
+        plan = dedup_service.plan_document(document_id, chunks, ids, model.key)
+    if plan is None:
+        return None, list(range(len(chunks)))
+    return plan, plan.keep
+
+def _record_dedup(document_id, plan, chunks, ids, shared_vectors, model):
+    with INGEST_STAGE_SECONDS.time(stage='dedup'):
+        if plan is None:
+            dedup_service.forget(document_id, model.key)
+        else:
+            created = dedup_service.record(document_id, plan, chunks, ids, shared_vectors)
+            _move_origin_chunks(created, model)
+
+def _move_origin_chunks(created, model):
+    """Take each new shared chunk's origin copy out of the origin document's index;
+    the origin references the shared chunk instead, so the pair is stored once.
+    The origin is claimed like a replace claims it. One that is busy (or whose move
+    fails) keeps its copy and covers the shared chunk in its own searches, as the
+    shared chunk's origin."""
+    by_origin = {}
+    for shared_chunk_id, origin_document_id, origin_chunk_id in created:
+        by_origin.setdefault(origin_document_id, []).append((shared_chunk_id, origin_chunk_id))
+    store = get_vector_store()
+    for origin_document_id, pairs in by_origin.items():
+        previous_status = dedup_service.claim_document(origin_document_id)
+        if previous_status is None:
+            continue
+        try:
+            key = embedding_models.index_key(origin_document_id, model)
+            metadatas = store.metadata(key, sorted({chunk_id for _, chunk_id in pairs}))
+            # A document keeps at least one chunk, so it always has an index of its own
+            if metadatas and len(metadatas) >= (store.count(key) or 0):
+                metadatas.pop(min(metadatas))
+            moved = [(s, c, metadatas[c]) for s, c in pairs if c in metadatas]
+            if moved:
+                dedup_service.adopt(origin_document_id, model.key, moved)
+                store.remove(key, list(metadatas))
+        except Exception as e:
+            print(f">>>> ERROR MOVING SHARED CHUNKS OUT OF DOCUMENT {origin_document_id}: {str(e)}")
+        finally:
+            dedup_service.release_document(origin_document_id, previous_status)
+
+def ingest_document(file_path, document_id, file_type, api_key, with_summary=False, model=None):
+    """Load, chunk, embed and store a document in the configured vector store.
+    Near-duplicates of chunks already in the document's scope are stored once as
+    shared chunks (see dedup_service) rather than in the document's own index.
+    model: the EmbeddingModel to index with (default: embedding_models.current());
+    each model has its own index, so this never touches the document's index for another.
+    Returns the number of chunks in its index, or (chunk_count, summary) with
+    with_summary=True, where summary is summary_service.build_summary's dict
+    (None when DOCUMENT_SUMMARIES is off or it couldn't be built)."""
+    model = model or embedding_models.current()
+    # Before anything is embedded: the store would only reject the vectors at the end
+    check_model_dimension(model)
+    chunks, parents = _load_and_split(file_path, document_id, file_type, model)
+    ids = _chunk_ids(chunks)
+    plan, stored = _plan_dedup(document_id, chunks, ids, model)
+
+    texts = [chunks[i].page_content for i in stored]
+    shared_texts = [chunks[i].page_content for i, _, _ in plan.new_shared] if plan else []
+    with INGEST_STAGE_SECONDS.time(stage='embed'):
+        vectors = embedding_models.embed_documents(model, texts + shared_texts)
+
+    with INGEST_STAGE_SECONDS.time(stage='index_write'):
+        get_vector_store().replace(
+            embedding_models.index_key(document_id, model), [ids[i] for i in stored], texts,
+            vectors[:len(texts)], [chunks[i].metadata for i in stored]
+        )
+    _record_dedup(document_id, plan, chunks, ids, vectors[len(texts):], model)
+    parent_sections.replace(document_id, model.key, parents)
+
+    if _uploads is not None:
+        _uploads.publish(file_path)
+
+    INGEST_CHUNKS.inc(len(stored))
+    if with_summary:
+        return len(stored), _summarize(chunks, document_id, api_key)
+    return len(stored)
+
+def reingest_document(file_path, document_id, file_type, api_key, with_summary=False, model=None):
+    """Update a document's vectors in place from a revised file.
+    Only chunks whose content changed are embedded; unchanged chunks keep their
+    vectors and have their metadata refreshed. Near-duplicates are matched again
+    as in ingest_document. model: the EmbeddingModel the document is indexed with.
+    Returns (chunks_in_index, added, removed), plus the new summary with with_summary=True
+    (None when the content didn't change or no summary was built)."""
+    model = model or embedding_models.current()
+    chunks, parents = _load_and_split(file_path, document_id, file_type, model)
+    ids = _chunk_ids(chunks)
+    plan, stored = _plan_dedup(document_id, chunks, ids, model)
+
+    def embed(texts):
+        with INGEST_STAGE_SECONDS.time(stage='embed'):
+            return embedding_models.embed_documents(model, texts)
+
+    with INGEST_STAGE_SECONDS.time(stage='index_write'):
+        counts = get_vector_store().sync(
+            embedding_models.index_key(document_id, model), [ids[i] for i in stored],
+            [chunks[i].page_content for i in stored],
+            [chunks[i].metadata for i in stored],
+            embed
+        )
+    if counts is None:
+        if with_summary:
+            total, summary = ingest_document(
+                file_path, document_id, file_type, api_key, with_summary=True, model=model
+            )
+            return total, total, 0, summary
+        total = ingest_document(file_path, document_id, file_type, api_key, model=model)
+        return total, total, 0
+    added, removed, kept = counts
+    shared_texts = [chunks[i].page_content for i, _, _ in plan.new_shared] if plan else []
+    _record_dedup(document_id, plan, chunks, ids, embed(shared_texts) if shared_texts else [], model)
+    parent_sections.replace(document_id, model.key, parents)
+    if _uploads is not None:
+        _uploads.publish(file_path)
+
+    REINGEST_CHUNKS.inc(added, action='added')
+    REINGEST_CHUNKS.inc(removed, action='removed')
+    REINGEST_CHUNKS.inc(kept, action='reused')
+    if with_summary:
+        summary = _summarize(chunks, document_id, api_key) if added or removed else None
+        return len(stored), added, removed, summary
+    return len(stored), added, removed
+
+def _load_and_search(doc_id, model, query_vector, k, mode, retrieval_filter=None):
+    """Search one document's vectors for model (loading a local index through the cache),
+    restricted to the chunks retrieval_filter keeps. Runs on the retrieval pool."""
+    started = time.perf_counter()
+    with QUERY_STAGE_SECONDS.time(stage='search', mode=mode):
+        results = get_vector_store().search(
+            embedding_models.index_key(doc_id, model), query_vector, k, retrieval_filter
+        )
+    DOCUMENT_SEARCH_SECONDS.observe(time.perf_counter() - started)
+    return results
+
+def _search_shared(document_ids, model, query_vector, k, mode, retrieval_filter=None):
+    with QUERY_STAGE_SECONDS.time(stage='shared_search', mode=mode):
+        return dedup_service.search_shared(document_ids, query_vector, k, model.key, retrieval_filter)
+
+def _merge_shared(found, hits, document_ids):
+    """Fold shared-chunk hits into the per-document results. A hit whose origin chunk
+    belongs to a searched document is already covered by that search (if the chunk
+    was retrieved, the referencing documents join its sources); any other hit is
+    placed after the results of the first selected document that references it."""
+    extra = {}
+    for hit in hits:
+        origin = hit['origin_document_id']
+        if origin in found:
+            for n, doc in enumerate(found[origin]):
+                if hashlib.sha256(doc.page_content.encode('utf-8')).hexdigest() == hit['origin_digest']:
+                    metadata = dict(doc.metadata)  # Never modify a cached index's documents
+                    metadata['shared_sources'] = hit['sources']
+                    found[origin][n] = LCDocument(page_content=doc.page_content, metadata=metadata, id=doc.id)
+                    break
+            dedup_service.SHARED_CHUNK_HITS.inc(outcome='covered')
+            continue
+        extra.setdefault(hit['document_ids'][0], []).append(hit['document'])
+        dedup_service.SHARED_CHUNK_HITS.inc(outcome='added')
+    return [doc for doc_id in document_ids for doc in found.get(doc_id, []) + extra.get(doc_id, [])]
+
+def _query_vectors(user_message, document_ids, models):
+    """{model key: question vector} for each embedding model among the documents."""
+    return {
+        model.key: embed_query(user_message, model)
+        for model, _ in embedding_models.group_by_model(document_ids, models)
+    }
 
-    embeddings = get_embeddings()
-    
-    # Store directly in a document-specific FAISS index
-    index_path = _get_index_path(document_id)
-    os.makedirs(FAISS_STORAGE_PATH, exist_ok=True)
-    
-    vectorstore = FAISS.from_documents(chunks, embeddings)
-    vectorstore.save_local(index_path)
-    
-    return len(chunks)
-
-def query_documents(user_message, document_ids, conversation_history, api_key):
-    """Query one or more documents and get Gemini response.
-    document_ids: list of Document.id integers to search across.
-    Returns (answer_string, list_of_source_filenames)."""
-
-    embeddings = get_embeddings()
-    all_docs = []
-
-    # Search each document's FAISS index separately and combine results
+def _search_documents(query_vectors, models, document_ids, mode, k=20, retrieval_filter=None):
+    """Search every document concurrently with the question vector from its own
+    embedding model (query_vectors, see _query_vectors), plus the shared chunks they
+    reference, and combine the results in document order. Documents that fail, or
+    that are still loading when the request deadline passes, are skipped rather
+    than holding up the answer. retrieval_filter's page range is applied inside
+    each search (see vector_store.FilterIndex); narrowing the documents is up to
+    the caller."""
+    pool = _get_retrieval_pool()
+    futures = []
     for doc_id in document_ids:
-        index_path = _get_index_path(doc_id)
-        if not os.path.exists(index_path):
+        model = models.get(doc_id)
+        if model is None:
+            DOCUMENT_SEARCH_OUTCOMES.inc(outcome='missing')
+            continue
+        futures.append((doc_id, pool.submit(
+            _load_and_search, doc_id, model, query_vectors[model.key], k, mode, retrieval_filter
+        )))
+    shared_futures = [
+        pool.submit(_search_shared, ids, model, query_vectors[model.key], k, mode, retrieval_filter)
+        for model, ids in embedding_models.group_by_model(document_ids, models)
+    ]
+    wait([f for _, f in futures] + shared_futures, timeout=RETRIEVAL_DEADLINE_SECONDS)
+
+    found = {}
+    for doc_id, future in futures:
+        if not future.done():
+            future.cancel()
+            DOCUMENT_SEARCH_OUTCOMES.inc(outcome='timeout')
+            print(f">>>> SEARCH OF DOCUMENT {doc_id} MISSED THE {RETRIEVAL_DEADLINE_SECONDS}s DEADLINE")
+            continue
+        try:
+            results = future.result()
+        except Exception as e:
+            DOCUMENT_SEARCH_OUTCOMES.inc(outcome='error')
+            print(f">>>> ERROR SEARCHING DOCUMENT {doc_id}: {str(e)}")
+            continue
+        if results is None:
+            DOCUMENT_SEARCH_OUTCOMES.inc(outcome='missing')
+            continue
+        DOCUMENT_SEARCH_OUTCOMES.inc(outcome='ok')
+        found[doc_id] = list(results)
+
+    hits = []
+    for shared_future in shared_futures:
+        if not shared_future.done():
+            shared_future.cancel()
+            print(f">>>> SHARED CHUNK SEARCH MISSED THE {RETRIEVAL_DEADLINE_SECONDS}s DEADLINE")
             continue
-            
-        vectorstore = FAISS.load_local(
-            index_path, 
-            embeddings,
-            allow_dangerous_deserialization=True # Required when loading local files you created
+        try:
+            hits.extend(shared_future.result())
+        except Exception as e:
+            print(f">>>> ERROR SEARCHING SHARED CHUNKS: {str(e)}")
+    return _merge_shared(found, hits, document_ids)
+
+def embed_queries(texts, model=None):
+    """Embed many questions in one pass (batch jobs; chat turns use embed_query)."""
+    return embedding_models.embed_queries(model or embedding_models.current(), texts)
+
+def _search_many(doc_id, model, query_vectors, k, retrieval_filter=None):
+    started = time.perf_counter()
+    with QUERY_STAGE_SECONDS.time(stage='search', mode='batch'):
+        results = get_vector_store().search_many(
+            embedding_models.index_key(doc_id, model), query_vectors, k, retrieval_filter
         )
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 20})
-        results = retriever.invoke(user_message)
-        all_docs.extend(results)
-
-    # Gemini Flash has a very large context window, we can send many chunks
-    all_docs = all_docs[:40]
-
-    context = "\n\n".join([doc.page_content for doc in all_docs])
-    sources = list(set([
-        doc.metadata.get('source', 'Unknown') for doc in all_docs
-    ]))
-
-    history_str = ""
-    for msg in conversation_history[-6:]:
-        role = "User" if msg['role'] == 'user' else "Assistant"
-        history_str += f"{role}: {msg['content']}\n"
-
-    prompt = f"""You are a helpful assistant that answers questions
+    DOCUMENT_SEARCH_SECONDS.observe(time.perf_counter() - started)
+    return results
+
+def retrieve_many(query_vectors, models, document_ids, count, k=20, retrieval_filter=None):
+    """_search_documents for a batch of count questions (query_vectors: {model key:
+    one vector per question}): each document's index is loaded once and searched
+    with every vector in one call, and the shared chunks are read once per model.
+    There is no deadline, since nobody is waiting on a single answer.
+    Returns one result list per question."""
+    pool = _get_retrieval_pool()
+    futures = []
+    for doc_id in document_ids:
+        model = models.get(doc_id)
+        if model is None:
+            DOCUMENT_SEARCH_OUTCOMES.inc(outcome='missing')
+            continue
+        futures.append((doc_id, pool.submit(
+            _search_many, doc_id, model, query_vectors[model.key], k, retrieval_filter
+        )))
+    shared_futures = [
+        pool.submit(dedup_service.search_shared_many, ids, query_vectors[model.key], k, model.key, retrieval_filter)
+        for model, ids in embedding_models.group_by_model(document_ids, models)
+    ]
+
+    found = [{} for _ in range(count)]
+    for doc_id, future in futures:
+        try:
+            results = future.result()
+        except Exception as e:
+            DOCUMENT_SEARCH_OUTCOMES.inc(outcome='error')
+            print(f">>>> ERROR SEARCHING DOCUMENT {doc_id}: {str(e)}")
+            continue
+        if results is None:
+            DOCUMENT_SEARCH_OUTCOMES.inc(outcome='missing')
+            continue
+        DOCUMENT_SEARCH_OUTCOMES.inc(outcome='ok')
+        for per_question, docs in zip(found, results):
+            per_question[doc_id] = list(docs)
+
+    hits = [[] for _ in range(count)]
+    for shared_future in shared_futures:
+        try:
+            for per_question, model_hits in zip(hits, shared_future.result()):
+                per_question.extend(model_hits)
+        except Exception as e:
+            print(f">>>> ERROR SEARCHING SHARED CHUNKS: {str(e)}")
+    return [_merge_shared(f, h, document_ids) for f, h in zip(found, hits)]
+
+def _prefetch(document_ids):
+    started = time.perf_counter()
+    document_ids = document_ids[:PREFETCH_MAX_DOCUMENTS]
+    models = embedding_models.document_models(document_ids)
+    # Loading the encoders is the slowest cold-start step, warm them first
+    for model, _ in embedding_models.group_by_model(document_ids, models):
+        embedding_models.embed_queries(model, ["warm up"])
+    store = get_vector_store()
+    for doc_id in document_ids:
+        if doc_id in models:
+            store.prefetch(embedding_models.index_key(doc_id, models[doc_id]))
+    PREFETCH_SECONDS.observe(time.perf_counter() - started)
+
+def prefetch_documents(document_ids):
+    """Warm the encoder and the given documents' indexes in the background.
+    Returns immediately; the first query for these documents then skips the loads."""
+    pool = _get_prefetch_pool()
+    try:
+        pool.submit(_prefetch, list(document_ids))
+    except RuntimeError:
+        pass  # Interpreter shutting down
+
+_ANSWER_PROMPT = """You are a helpful assistant that answers questions
 based on the provided document context.
 Answer questions ONLY using the document context below.
 If the answer is not found in the context, say:
@@ -113,79 +572,194 @@ DOCUMENT CONTEXT:
 {context}
 
 CONVERSATION HISTORY:
-{history_str}
+{history}
 
 User: {user_message}
 Assistant:"""
 
-    llm = get_llm(api_key)
-    response = llm.invoke(prompt)
-    return response.content, sources
-
-
-def query_documents_stream(user_message, document_ids, conversation_history, api_key):
-    """Query one or more documents and yield Gemini response chunks.
-    document_ids: list of Document.id integers to search across.
-    Yields (chunk_str, list_of_source_filenames) as a tuple for each chunk."""
-
-    embeddings = get_embeddings()
-    all_docs = []
+def _history_text(conversation_history):
+    history_str = ""
+    for msg in conversation_history[-6:]:
+        role = "User" if msg['role'] == 'user' else "Assistant"
+        history_str += f"{role}: {msg['content']}\n"
+    return history_str
+
+def _summary_route(user_message, document_ids, summaries):
+    """The precomputed summaries to answer from, or None to use vector search.
+    Only document-level questions qualify, and only if every selected document has a summary."""
+    if not summaries or not summary_service.is_document_level(user_message):
+        return None
+    selected = [summaries.get(doc_id) for doc_id in document_ids]
+    if not selected or not all(selected):
+        return None
+    return selected
+
+def _retrieve(user_message, document_ids, mode, retrieval_filter):
+    """Embed the question once per embedding model in use and search the documents,
+    reusing each vector for every document index built with that model."""
+    models = embedding_models.document_models(document_ids)
+    with QUERY_STAGE_SECONDS.time(stage='query_embed', mode=mode):
+        query_vectors = _query_vectors(user_message, document_ids, models)
+    with QUERY_STAGE_SECONDS.time(stage='retrieval', mode=mode):
+        return _search_documents(query_vectors, models, document_ids, mode, retrieval_filter=retrieval_filter)
+
+def _context_blocks(docs):
+    """What goes in the prompt for the retrieved chunks: their parent sections within
+    CONTEXT_BUDGET_CHARS (see parent_sections.expand), or for indexes built without
+    sections, the first 40 chunks as they are."""
+    if not any('parent_id' in doc.metadata for doc in docs):
+        return docs[:40]
+    document_ids = {int(doc.metadata['document_id']) for doc in docs if doc.metadata.get('document_id')}
+    models = embedding_models.document_models(document_ids)
+    return parent_sections.expand(
+        docs, {doc_id: model.key for doc_id, model in models.items()}, CONTEXT_BUDGET_CHARS
+    )
 
-    # Search each document's FAISS index separately and combine results
-    for doc_id in document_ids:
-        index_path = _get_index_path(doc_id)
-        if not os.path.exists(index_path):
-            continue
-            
-        vectorstore = FAISS.load_local(
-            index_path, 
-            embeddings,
-            allow_dangerous_deserialization=True 
+def _build_prompt(user_message, document_ids, conversation_history, mode, summaries=None, retrieved=None,
+                  retrieval_filter=None):
+    """Retrieve context for user_message and build the Gemini prompt.
+    retrieved: chunks already found for it (see retrieve_many), skipping the search.
+    retrieval_filter: a retrieval_filter.RetrievalFilter restricting the search; if
+    None, pages named in the question are used (QUESTION_PAGE_FILTERS).
+    Returns (prompt, list_of_source_filenames)."""
+
+    if retrieval_filter is None and retrieved is None and QUESTION_PAGE_FILTERS:
+        retrieval_filter = filters.from_question(user_message)
+    searched = retrieval_filter.narrow(document_ids) if retrieval_filter is not None else document_ids
+
+    # Summaries cover whole documents, so they can't answer for a page range
+    page_filtered = retrieval_filter is not None and retrieval_filter.pages is not None
+    selected = None if page_filtered else _summary_route(user_message, searched, summaries)
+    if selected is not None:
+        summary_service.QUERY_ROUTES.inc(route='summary')
+        with QUERY_STAGE_SECONDS.time(stage='context_assembly', mode=mode):
+            context = summary_service.summary_context(selected)
+            sources = list(set(entry['source'] for entry in selected))
+            prompt = _ANSWER_PROMPT.format(
+                context=context, history=_history_text(conversation_history), user_message=user_message
+            )
+        return prompt, sources
+    summary_service.QUERY_ROUTES.inc(route='retrieval')
+
+    if retrieved is not None:
+        all_docs = retrieved
+    else:
+        if retrieval_filter is not None:
+            filters.FILTERED_SEARCHES.inc(origin='question' if retrieval_filter.inferred else 'request')
+        all_docs = _retrieve(user_message, searched, mode, retrieval_filter)
+        if not all_docs and retrieval_filter is not None and retrieval_filter.inferred:
+            # "page" in the question didn't mean these documents' pages after all
+            filters.FILTERED_SEARCHES.inc(origin='fallback')
+            all_docs = _retrieve(user_message, document_ids, mode, None)
+
+    with QUERY_STAGE_SECONDS.time(stage='context_assembly', mode=mode):
+        # Small chunks matched the question; the prompt gets the sections around them
+        all_docs = _context_blocks(all_docs)
+
+        context = "\n\n".join([doc.page_content for doc in all_docs])
+        sources = list(set([
+            doc.metadata.get('source', 'Unknown') for doc in all_docs
+        ] + [
+            source for doc in all_docs for source in doc.metadata.get('shared_sources', [])
+        ]))
+
+        prompt = _ANSWER_PROMPT.format(
+            context=context, history=_history_text(conversation_history), user_message=user_message
         )
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 20})
-        results = retriever.invoke(user_message)
-        all_docs.extend(results)
 
-    # Gemini Flash has a very large context window, we can send many chunks
-    all_docs = all_docs[:40]
+    return prompt, sources
 
-    context = "\n\n".join([doc.page_content for doc in all_docs])
-    sources = list(set([
-        doc.metadata.get('source', 'Unknown') for doc in all_docs
-    ]))
+def query_documents(user_message, document_ids, conversation_history, api_key, summaries=None,
+                    retrieval_filter=None):
+    """Query one or more documents and get Gemini response.
+    document_ids: list of Document.id integers to search across.
+    summaries: optional {document_id: {'filename', 'source', 'summary', 'sections'}};
+    document-level questions are answered from these instead of vector search.
+    retrieval_filter: optional RetrievalFilter (pages, document subset) for the search.
+    Returns (answer_string, list_of_source_filenames)."""
 
-    history_str = ""
-    for msg in conversation_history[-6:]:
-        role = "User" if msg['role'] == 'user' else "Assistant"
-        history_str += f"{role}: {msg['content']}\n"
+    prompt, sources = _build_prompt(
+        user_message, document_ids, conversation_history, 'sync', summaries, retrieval_filter=retrieval_filter
+    )
 
-    prompt = f"""You are a helpful assistant that answers questions
-based on the provided document context.
-Answer questions ONLY using the document context below.
-If the answer is not found in the context, say:
-"I could not find an answer to that in the provided documents."
-Be clear, concise, and helpful.
+    llm = get_llm(api_key)
+    with QUERY_STAGE_SECONDS.time(stage='llm_total', mode='sync'):
+        response = llm.invoke(prompt)
+    return response.content, sources
 
-DOCUMENT CONTEXT:
-{context}
 
-CONVERSATION HISTORY:
-{history_str}
+def build_batch_prompts(questions, document_ids, summaries=None, retrieval_filter=None):
+    """Prompts for many independent questions over the same documents: the
+    questions are embedded in one batch and retrieved with retrieve_many
+    (restricted by retrieval_filter, if given, for every question).
+    Returns ([(prompt, sources), ...], {'embed': seconds, 'retrieval': seconds})."""
+    timings = {}
+    started = time.perf_counter()
+    if retrieval_filter is not None:
+        document_ids = retrieval_filter.narrow(document_ids)
+        if retrieval_filter.pages is not None:
+            summaries = None
+    models = embedding_models.document_models(document_ids)
+    with QUERY_STAGE_SECONDS.time(stage='query_embed', mode='batch'):
+        vectors = {
+            model.key: embed_queries(questions, model)
+            for model, _ in embedding_models.group_by_model(document_ids, models)
+        }
+    timings['embed'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with QUERY_STAGE_SECONDS.time(stage='retrieval', mode='batch'):
+        retrieved = retrieve_many(vectors, models, document_ids, len(questions), retrieval_filter=retrieval_filter)
+    timings['retrieval'] = time.perf_counter() - started
+
+    prompts = [
+        _build_prompt(question, document_ids, [], 'batch', summaries, retrieved=docs)
+        for question, docs in zip(questions, retrieved)
+    ]
+    return prompts, timings
+
+
+def query_documents_stream(user_message, document_ids, conversation_history, api_key, summaries=None,
+                           retrieval_filter=None):
+    """Query one or more documents and yield Gemini response chunks.
+    document_ids: list of Document.id integers to search across.
+    summaries, retrieval_filter: as for query_documents.
+    Yields (chunk_str, list_of_source_filenames) as a tuple for each chunk."""
 
-User: {user_message}
-Assistant:"""
+    prompt, sources = _build_prompt(
+        user_message, document_ids, conversation_history, 'stream', summaries, retrieval_filter=retrieval_filter
+    )
 
     llm = get_llm(api_key)
     
     # Send an initial chunk containing just the sources so the frontend can display them immediately
     yield ("", sources)
     
-    for chunk in llm.stream(prompt):
-        if chunk.content:
-            yield (chunk.content, sources)
-
-def delete_document_vectors(document_id):
-    """Delete all local FAISS vectors for a document."""
-    index_path = _get_index_path(document_id)
-    if os.path.exists(index_path):
-        shutil.rmtree(index_path)
+    started = time.perf_counter()
+    first_token = True
+    try:
+        for chunk in llm.stream(prompt):
+            if chunk.content:
+                if first_token:
+                    QUERY_STAGE_SECONDS.observe(time.perf_counter() - started, stage='llm_ttft', mode='stream')
+                    first_token = False
+                yield (chunk.content, sources)
+    finally:
+        QUERY_STAGE_SECONDS.observe(time.perf_counter() - started, stage='llm_total', mode='stream')
+
+def delete_document_vectors(document_id, index_key=None):
+    """Delete the vectors stored for a document and all its shared-chunk references
+    and parent sections. index_key: where its index is
+    (embedding_models.document_index_key), if not under the current model."""
+    dedup_service.forget(document_id)
+    parent_sections.forget(document_id)
+    if index_key is None:
+        index_key = embedding_models.index_key(document_id, embedding_models.current())
+    get_vector_store().delete(index_key)
+
+def delete_index(document_id, model):
+    """Delete a document's index, shared-chunk references and parent sections for one
+    embedding model only, e.g. the old one after the document moved to another model."""
+    dedup_service.forget(document_id, model.key)
+    parent_sections.forget(document_id, model.key)
+    get_vector_store().delete(embedding_models.index_key(document_id, model))
@@ -0,0 +1,146 @@
+import re
+from app.services.metrics import Counter
+
+FILTERED_SEARCHES = Counter(
+    'rag_filtered_searches_total',
+    'Chat turns retrieved with a filter, by where it came from (request, question) and '
+    'whether an inferred filter found nothing and was dropped (fallback).',
+    ['origin']
+)
+
+# Page references in a question: "page 12", "pages 10-20", "pp. 10 to 20", "p.5"
+_PAGES_RE = re.compile(
+    r'\b(?:pages?|pp?\.)\s*(\d{1,5})(?:\s*(?:-|–|—|to|through)\s*(\d{1,5}))?\b',
+    re.IGNORECASE
+)
+
+
+class RetrievalFilter:
+    """Restricts a turn's retrieval to part of its documents.
+
+    pages: (first, last), 1-based and inclusive as printed on the document;
+    only chunks with a page in that range are searched (PDF chunks carry one,
+    TXT/DOCX chunks don't, so a page filter leaves those documents out).
+    document_ids: only these of the selected documents are searched.
+    inferred: the filter was read from the question rather than asked for, so
+    retrieval drops it again if nothing matches (see rag_service._build_prompt).
+    """
+
+    def __init__(self, pages=None, document_ids=None, inferred=False):
+        self.pages = pages
+        self.document_ids = None if document_ids is None else set(document_ids)
+        self.inferred = inferred
+
+    @property
+    def page_bounds(self):
+        """pages as the 0-based (low, high) that PyPDFLoader stores in chunk metadata, or None."""
+        if self.pages is None:
+            return None
+        return self.pages[0] - 1, self.pages[1] - 1
+
+    def narrow(self, document_ids):
+        """The selected document_ids this filter keeps, in their original order."""
+        if self.document_ids is None:
+            return list(document_ids)
+        return [doc_id for doc_id in document_ids if doc_id in self.document_ids]
+
+    def matches(self, metadata):
+        """Whether a chunk with this metadata passes the page filter."""
+        if self.pages is None:
+            return True
+        page = metadata.get('page')
+        low, high = self.page_bounds
+        return isinstance(page, int) and low <= page <= high
+
+    def pinecone_filter(self):
+        """The page filter as a Pinecone metadata filter, or None."""
+        if self.pages is None:
+            return None
+        low, high = self.page_bounds
+        return {'page': {'$gte': low, '$lte': high}}
+
+    def to_dict(self):
+        return {
+            'pages': list(self.pages) if self.pages else None,
+            'document_ids': sorted(self.document_ids) if self.document_ids is not None else None,
+            'inferred': self.inferred,
+        }
+
+    def __repr__(self):
+        return f"RetrievalFilter({self.to_dict()})"
+
+
+def _page_range(first, last):
+    first, last = int(first), int(last if last is not None else first)
+    if first < 1 or last < 1:
+        raise ValueError("Page numbers start at 1")
+    return (min(first, last), max(first, last))
+
+
+def parse(payload, documents):
+    """A RetrievalFilter from a request's filter fields, or None if it sets none.
+
+    payload: {'pages': "10-20" | [10, 20] | 12, 'sources': [filename, ...],
+    'document_ids': [...]} (any may be missing).
+    documents: {document_id: original_filename} of the turn's selected documents;
+    sources and document_ids must name some of these, and together select the
+    documents to search. Raises ValueError for anything malformed or unknown.
+    """
+    pages = payload.get('pages')
+    if isinstance(pages, str):
+        pages = pages.strip()
+        match = re.fullmatch(r'(\d+)\s*(?:-|–|to)?\s*(\d+)?', pages) if pages else None
+        if pages and match is None:
+            raise ValueError(f"Invalid page range: {pages}")
+        pages = _page_range(*match.groups()) if match else None
+    elif isinstance(pages, int):
+        pages = _page_range(pages, pages)
+    elif isinstance(pages, (list, tuple)) and len(pages) in (1, 2):
+        try:
+            pages = _page_range(pages[0], pages[-1])
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid page range: {pages}")
+    elif pages is not None:
+        raise ValueError(f"Invalid page range: {pages}")
+
+    document_ids = None
+    sources = payload.get('sources') or []
+    ids = payload.get('document_ids') or []
+    if sources or ids:
+        if isinstance(sources, str):
+            sources = [sources]
+        by_name = {}
+        for doc_id, filename in documents.items():
+            by_name.setdefault(filename.lower(), []).append(doc_id)
+        document_ids = set()
+        for source in sources:
+            matched = by_name.get(str(source).strip().lower())
+            if not matched:
+                raise ValueError(f"No selected document is named {source}")
+            document_ids.update(matched)
+        for doc_id in ids:
+            try:
+                doc_id = int(doc_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid document id: {doc_id}")
+            if doc_id not in documents:
+                raise ValueError(f"Document {doc_id} is not selected")
+            document_ids.add(doc_id)
+
+    if pages is None and document_ids is None:
+        return None
+    return RetrievalFilter(pages=pages, document_ids=document_ids)
+
+
+def from_question(question):
+    """A page filter for a question that names pages ("what do pages 10-20 say about
+    refunds?"), or None. Only an unambiguous single reference is used."""
+    matches = _PAGES_RE.findall(question or '')
+    if len(matches) != 1:
+        return None
+    first, last = matches[0]
+    try:
+        pages = _page_range(first, last or None)
+    except ValueError:
+        return None
+    return RetrievalFilter(pages=pages, inferred=True)
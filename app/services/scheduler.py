@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from app.services.metrics import Counter, Gauge, Histogram
+
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    'rag_scheduler_queue_depth',
+    'Chat turns waiting for an LLM slot.'
+)
+SCHEDULER_ACTIVE = Gauge(
+    'rag_scheduler_active',
+    'Chat turns currently holding an LLM slot.'
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    'rag_scheduler_wait_seconds',
+    'Time a chat turn spent queued before being admitted.',
+    ['outcome']
+)
+SCHEDULER_REJECTED = Counter(
+    'rag_scheduler_rejected_total',
+    'Chat turns shed because they waited longer than the queue-time SLO.'
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request waited longer than the queue-time SLO for an LLM slot."""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(
+            f"The assistant is busy right now. Please try again in about {retry_after} seconds."
+        )
+
+
+class _Waiter:
+    __slots__ = ('user_id', 'event', 'granted')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.event = threading.Event()
+        self.granted = False
+
+
+class FairScheduler:
+    """Admission control for retrieval + LLM calls.
+
+    At most global_limit turns run at once and at most per_user_limit per user.
+    Waiting turns are queued per user and slots are handed out round-robin across
+    users, so one user firing many requests can't starve everybody else.
+    """
+
+    def __init__(self, global_limit=8, per_user_limit=2, max_queue_seconds=20):
+        self.global_limit = global_limit
+        self.per_user_limit = per_user_limit
+        self.max_queue_seconds = max_queue_seconds
+        self._lock = threading.Lock()
+        self._active = 0
+        self._active_by_user = {}
+        self._queues = {}        # user_id -> deque of _Waiter
+        self._rotation = deque()  # user_ids with queued waiters, in round-robin order
+        SCHEDULER_QUEUE_DEPTH.set_function(lambda: sum(len(q) for q in self._queues.values()))
+        SCHEDULER_ACTIVE.set_function(lambda: self._active)
+
+    def init_app(self, app):
+        self.global_limit = app.config.get('SCHEDULER_GLOBAL_CONCURRENCY', self.global_limit)
+        self.per_user_limit = app.config.get('SCHEDULER_PER_USER_CONCURRENCY', self.per_user_limit)
+        self.max_queue_seconds = app.config.get('SCHEDULER_MAX_QUEUE_SECONDS', self.max_queue_seconds)
+
+    def _can_run(self, user_id):
+        return (self._active < self.global_limit
+                and self._active_by_user.get(user_id, 0) < self.per_user_limit)
+
+    def _grant(self, user_id):
+        self._active += 1
+        self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+
+    def _dispatch(self):
+        # Walk the rotation once per grant; users at their own limit are skipped, not dropped
+        while self._active < self.global_limit and self._rotation:
+            for _ in range(len(self._rotation)):
+                user_id = self._rotation[0]
+                self._rotation.rotate(-1)
+                if self._active_by_user.get(user_id, 0) < self.per_user_limit:
+                    queue = self._queues[user_id]
+                    waiter = queue.popleft()
+                    if not queue:
+                        del self._queues[user_id]
+                        self._rotation.remove(user_id)
+                    waiter.granted = True
+                    self._grant(user_id)
+                    waiter.event.set()
+                    break
+            else:
+                return
+
+    def acquire(self, user_id):
+        start = time.monotonic()
+        with self._lock:
+            if not self._queues and self._can_run(user_id):
+                self._grant(user_id)
+                SCHEDULER_WAIT_SECONDS.observe(0.0, outcome='admitted')
+                return
+            waiter = _Waiter(user_id)
+            if user_id not in self._queues:
+                self._queues[user_id] = deque()
+                self._rotation.append(user_id)
+            self._queues[user_id].append(waiter)
+            self._dispatch()
+
+        waiter.event.wait(timeout=self.max_queue_seconds)
+        with self._lock:
+            if not waiter.granted:
+                queue = self._queues.get(user_id)
+                if queue is not None:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[user_id]
+                        self._rotation.remove(user_id)
+                waited = time.monotonic() - start
+                SCHEDULER_WAIT_SECONDS.observe(waited, outcome='rejected')
+                SCHEDULER_REJECTED.inc()
+                raise AdmissionRejected(retry_after=max(1, int(self.max_queue_seconds // 2)))
+        SCHEDULER_WAIT_SECONDS.observe(time.monotonic() - start, outcome='admitted')
+
+    def release(self, user_id):
+        with self._lock:
+            self._active -= 1
+            remaining = self._active_by_user.get(user_id, 1) - 1
+            if remaining:
+                self._active_by_user[user_id] = remaining
+            else:
+                self._active_by_user.pop(user_id, None)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, user_id):
+        """Hold an LLM slot for the duration of the block (raises AdmissionRejected)."""
+        self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+
+llm_scheduler = FairScheduler()
@@ -0,0 +1,139 @@
+import html
+import re
+from sqlalchemy import text
+
+# (table, column) pairs mirrored into external-content FTS5 tables named <table>_fts.
+# SQLite keeps them in sync through triggers, so every write path (ORM, raw SQL,
+# migrations) is covered without application code.
+FTS_TABLES = [
+    ('chat_messages', 'content'),
+    ('conversations', 'title'),
+    ('documents', 'original_filename'),
+]
+
+# Private-use characters mark snippet matches so they survive HTML escaping
+_MARK_START = '\ue000'
+_MARK_END = '\ue001'
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_ddl(table, column):
+    """CREATE statements for one FTS5 table and the triggers that keep it in sync."""
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{column}, content='{table}', content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+    ]
+
+
+def is_supported(session):
+    return session.get_bind().dialect.name == 'sqlite'
+
+
+def ensure_fts(session):
+    """Create any missing FTS tables and triggers."""
+    for table, column in FTS_TABLES:
+        for statement in fts_ddl(table, column):
+            session.execute(text(statement))
+    session.commit()
+
+
+def rebuild_fts(session):
+    """Re-read every row of the content tables into the FTS indexes (backfill).
+    Returns {table: row_count}."""
+    ensure_fts(session)
+    counts = {}
+    for table, _ in FTS_TABLES:
+        fts = f"{table}_fts"
+        session.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+        counts[table] = session.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    session.execute(text(
+        "INSERT INTO chat_messages_fts(chat_messages_fts) VALUES ('optimize')"
+    ))
+    session.commit()
+    return counts
+
+
+def build_match_query(raw_query):
+    """Turn free text into a safe FTS5 query: every word quoted and prefix-matched.
+    Returns None if there is nothing searchable."""
+    tokens = _TOKEN_RE.findall(raw_query or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens[:16])
+
+
+def _snippet_html(snippet):
+    escaped = html.escape(snippet or '')
+    return escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search(session, user_id, raw_query, limit=20):
+    """Ranked (bm25) search over the user's messages, conversation titles and
+    the documents they can see. Returns a dict of result lists with HTML snippets."""
+    match = build_match_query(raw_query)
+    results = {'messages': [], 'conversations': [], 'documents': []}
+    if match is None:
+        return results
+
+    params = {'q': match, 'uid': user_id, 'limit': limit, 's': _MARK_START, 'e': _MARK_END}
+
+    rows = session.execute(text(
+        "SELECT m.id, m.conversation_id, m.role, m.created_at, c.title, "
+        "snippet(chat_messages_fts, 0, :s, :e, '…', 16) AS snippet "
+        "FROM chat_messages_fts "
+        "JOIN chat_messages m ON m.id = chat_messages_fts.rowid "
+        "JOIN conversations c ON c.id = m.conversation_id "
+        "WHERE chat_messages_fts MATCH :q AND c.user_id = :uid "
+        "ORDER BY chat_messages_fts.rank LIMIT :limit"
+    ), params).mappings()
+    for row in rows:
+        results['messages'].append({
+            'id': row['id'],
+            'conversation_id': row['conversation_id'],
+            'conversation_title': row['title'],
+            'role': row['role'],
+            'created_at': str(row['created_at']) if row['created_at'] else None,
+            'snippet': _snippet_html(row['snippet']),
+        })
+
+    rows = session.execute(text(
+        "SELECT c.id, c.created_at, "
+        "highlight(conversations_fts, 0, :s, :e) AS snippet "
+        "FROM conversations_fts "
+        "JOIN conversations c ON c.id = conversations_fts.rowid "
+        "WHERE conversations_fts MATCH :q AND c.user_id = :uid "
+        "ORDER BY conversations_fts.rank LIMIT :limit"
+    ), params).mappings()
+    for row in rows:
+        results['conversations'].append({
+            'id': row['id'],
+            'created_at': str(row['created_at']) if row['created_at'] else None,
+            'snippet': _snippet_html(row['snippet']),
+        })
+
+    rows = session.execute(text(
+        "SELECT d.id, d.is_global, d.status, "
+        "highlight(documents_fts, 0, :s, :e) AS snippet "
+        "FROM documents_fts "
+        "JOIN documents d ON d.id = documents_fts.rowid "
+        "WHERE documents_fts MATCH :q AND d.is_active = 1 "
+        "AND (d.owner_id = :uid OR d.is_global = 1) "
+        "ORDER BY documents_fts.rank LIMIT :limit"
+    ), params).mappings()
+    for row in rows:
+        results['documents'].append({
+            'id': row['id'],
+            'is_global': bool(row['is_global']),
+            'status': row['status'],
+            'snippet': _snippet_html(row['snippet']),
+        })
+
+    return results
@@ -0,0 +1,403 @@
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import zstandard
+from app.services.metrics import Counter, Gauge, Histogram
+
+ARTIFACT_TRANSFERS = Counter(
+    'rag_artifact_transfers_total',
+    'Artifacts moved to or from the shared store, by direction (publish, fetch) and kind (index, upload).',
+    ['direction', 'kind']
+)
+ARTIFACT_BYTES = Counter(
+    'rag_artifact_bytes_total',
+    'Compressed artifact bytes moved to or from the shared store, by direction.',
+    ['direction']
+)
+ARTIFACT_SECONDS = Histogram(
+    'rag_artifact_seconds',
+    'Time to pack and publish, or fetch and unpack, one artifact, by direction.',
+    ['direction']
+)
+ARTIFACT_CHECKSUM_FAILURES = Counter(
+    'rag_artifact_checksum_failures_total',
+    'Fetched artifacts rejected because their sha256 did not match the manifest.'
+)
+NODE_CACHE_BYTES = Gauge(
+    'rag_node_cache_bytes',
+    'Bytes of index directories held in this node\'s local cache.'
+)
+NODE_CACHE_EVICTIONS = Counter(
+    'rag_node_cache_evictions_total',
+    'Index directories removed from the local node cache to stay under its size limit.'
+)
+
+_BLOCK = 1024 * 1024
+
+
+class ArtifactChecksumError(Exception):
+    """A fetched artifact doesn't match the checksum in its manifest."""
+
+
+def swap_in_directory(tmp_path, final_path):
+    """Replace final_path with the fully written tmp_path, so readers never see
+    a half-written directory."""
+    old_path = None
+    if os.path.exists(final_path):
+        old_path = f"{final_path}.old-{uuid.uuid4().hex[:8]}"
+        os.rename(final_path, old_path)
+    os.rename(tmp_path, final_path)
+    if old_path:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dir_size(path):
+    """Bytes in the files under path (0 if it doesn't exist)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def pack_directory(src_dir, dest_file, level=3, exclude=()):
+    """Write the regular files directly inside src_dir to dest_file as a zstd-compressed tar."""
+    compressor = zstandard.ZstdCompressor(level=level)
+    with open(dest_file, 'wb') as raw, compressor.stream_writer(raw) as writer:
+        with tarfile.open(fileobj=writer, mode='w|') as tar:
+            for name in sorted(os.listdir(src_dir)):
+                path = os.path.join(src_dir, name)
+                if name in exclude or not os.path.isfile(path):
+                    continue
+                tar.add(path, arcname=name, recursive=False)
+
+
+def unpack_directory(src_file, dest_dir):
+    """Extract an archive made by pack_directory into dest_dir (which must not exist)."""
+    os.makedirs(dest_dir)
+    decompressor = zstandard.ZstdDecompressor()
+    with open(src_file, 'rb') as raw, decompressor.stream_reader(raw) as reader:
+        with tarfile.open(fileobj=reader, mode='r|') as tar:
+            for member in tar:
+                # Only flat regular files are ever packed; refuse anything else
+                if not member.isfile() or os.path.basename(member.name) != member.name or member.name.startswith('.'):
+                    raise ValueError(f"Unexpected archive member: {member.name}")
+                with tar.extractfile(member) as src, open(os.path.join(dest_dir, member.name), 'wb') as dst:
+                    shutil.copyfileobj(src, dst, _BLOCK)
+
+
+def compress_file(src_file, dest_file, level=3):
+    compressor = zstandard.ZstdCompressor(level=level)
+    with open(src_file, 'rb') as src, open(dest_file, 'wb') as dst:
+        compressor.copy_stream(src, dst)
+
+
+def decompress_file(src_file, dest_file):
+    decompressor = zstandard.ZstdDecompressor()
+    with open(src_file, 'rb') as src, open(dest_file, 'wb') as dst:
+        decompressor.copy_stream(src, dst)
+
+
+class FilesystemArtifactStore:
+    """Shared artifact store on a directory every node mounts (NFS, EFS, SMB).
+
+    Each key holds immutable <version>.zst blobs and a manifest.json naming the
+    current version, its sha256 and size. The manifest is replaced atomically
+    after the blob is complete, so it is the commit point: readers either see
+    the old version or the new one, never a partial upload. The same
+    put/get/manifest/delete surface maps directly onto an object store.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _key_dir(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def manifest(self, key):
+        """The current manifest for key, or None if nothing is published."""
+        try:
+            with open(os.path.join(self._key_dir(key), 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, artifact_path, kind):
+        """Publish a compressed artifact as the new version of key. Returns its manifest."""
+        key_dir = self._key_dir(key)
+        os.makedirs(key_dir, exist_ok=True)
+        previous = self.manifest(key)
+        version = f"{time.time_ns():x}-{uuid.uuid4().hex[:8]}"
+        manifest = {
+            'version': version,
+            'kind': kind,
+            'sha256': _sha256_file(artifact_path),
+            'size': os.path.getsize(artifact_path),
+            'published_at': time.time(),
+        }
+        blob_tmp = os.path.join(key_dir, f".{version}.zst.tmp")
+        shutil.copyfile(artifact_path, blob_tmp)
+        os.replace(blob_tmp, os.path.join(key_dir, f"{version}.zst"))
+        manifest_tmp = os.path.join(key_dir, f".manifest.{version}.tmp")
+        with open(manifest_tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_tmp, os.path.join(key_dir, 'manifest.json'))
+        # The previous blob stays so a node that read the old manifest can finish fetching it
+        keep = {f"{version}.zst"}
+        if previous:
+            keep.add(f"{previous['version']}.zst")
+        for name in os.listdir(key_dir):
+            if name.endswith('.zst') and name not in keep:
+                try:
+                    os.remove(os.path.join(key_dir, name))
+                except OSError:
+                    continue
+        return manifest
+
+    def get(self, key, manifest, dest_path):
+        """Copy the artifact for manifest['version'] to dest_path and verify its checksum."""
+        blob = os.path.join(self._key_dir(key), f"{manifest['version']}.zst")
+        shutil.copyfile(blob, dest_path)
+        if _sha256_file(dest_path) != manifest['sha256']:
+            os.remove(dest_path)
+            ARTIFACT_CHECKSUM_FAILURES.inc()
+            raise ArtifactChecksumError(f"Checksum mismatch for {key} version {manifest['version']}")
+
+    def delete(self, key):
+        shutil.rmtree(self._key_dir(key), ignore_errors=True)
+
+
+def create_artifact_store(settings):
+    """The shared store named by settings['SHARED_STORAGE_PATH'], or None on a single node."""
+    root = settings.get('SHARED_STORAGE_PATH')
+    if not root:
+        return None
+    return FilesystemArtifactStore(root)
+
+
+class SharedIndexes:
+    """Keeps a node's local FAISS index directories in step with the shared store.
+
+    The node that builds an index publishes it before swapping it in locally.
+    Any node then refreshes its copy on use: the manifest is checked at most
+    every check_seconds per document, and a newer version is fetched, verified
+    and swapped in. Local copies are evicted least-recently-used once they
+    exceed max_bytes; the shared store keeps them, so an evicted index is just
+    fetched again. A published copy whose manifest has gone was deleted on
+    another node, and is removed here as well.
+    """
+
+    VERSION_FILE = 'ARTIFACT_VERSION'
+
+    def __init__(self, artifacts, storage_path, max_bytes=2 * 1024 ** 3, check_seconds=5.0, level=3):
+        self.artifacts = artifacts
+        self.storage_path = storage_path
+        self.max_bytes = max_bytes
+        self.check_seconds = check_seconds
+        self.level = level
+        self._checked = {}  # doc key -> monotonic time of the last manifest check
+        self._sizes = OrderedDict()  # doc key -> bytes on disk, least recently used first
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._scan()
+        NODE_CACHE_BYTES.set_function(lambda: sum(self._sizes.values()))
+
+    @staticmethod
+    def _key(document_id):
+        return f"indexes/{document_id}"
+
+    def _scan(self):
+        # Pick up copies left by a previous run; their versions are re-checked on first use
+        if not os.path.isdir(self.storage_path):
+            return
+        entries = []
+        for name in os.listdir(self.storage_path):
+            path = os.path.join(self.storage_path, name)
+            if os.path.isdir(path) and os.path.exists(os.path.join(path, self.VERSION_FILE)):
+                entries.append((os.path.getmtime(path), name, dir_size(path)))
+        for _, name, size in sorted(entries):
+            self._sizes[name] = size
+
+    def _doc_lock(self, name):
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def local_version(self, index_path):
+        try:
+            with open(os.path.join(index_path, self.VERSION_FILE)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def publish(self, document_id, index_dir):
+        """Upload a freshly written index directory and stamp it with the published version.
+        Called before the directory is swapped into place."""
+        name = str(document_id)
+        started = time.perf_counter()
+        artifact = f"{index_dir}.zst"
+        try:
+            pack_directory(index_dir, artifact, self.level, exclude=(self.VERSION_FILE,))
+            manifest = self.artifacts.put(self._key(name), artifact, 'index')
+        finally:
+            if os.path.exists(artifact):
+                os.remove(artifact)
+        with open(os.path.join(index_dir, self.VERSION_FILE), 'w') as f:
+            f.write(manifest['version'])
+        ARTIFACT_TRANSFERS.inc(direction='publish', kind='index')
+        ARTIFACT_BYTES.inc(manifest['size'], direction='publish')
+        ARTIFACT_SECONDS.observe(time.perf_counter() - started, direction='publish')
+        with self._lock:
+            self._checked[name] = time.monotonic()
+        return manifest['version']
+
+    def stored(self, document_id, index_path):
+        """Record a directory just swapped into place, then trim the cache to size."""
+        name = str(document_id)
+        size = dir_size(index_path)
+        with self._lock:
+            self._sizes.pop(name, None)
+            self._sizes[name] = size
+        self._evict(keep=name)
+
+    def refresh(self, document_id, index_path):
+        """Make sure index_path holds the current published version, fetching it if needed.
+        Returns False if the document has no published index."""
+        name = str(document_id)
+        with self._lock:
+            last = self._checked.get(name)
+            if name in self._sizes:
+                self._sizes.move_to_end(name)
+        if last is not None and time.monotonic() - last < self.check_seconds and os.path.exists(index_path):
+            return True
+
+        with self._doc_lock(name):
+            manifest = self.artifacts.manifest(self._key(name))
+            with self._lock:
+                self._checked[name] = time.monotonic()
+            if manifest is None:
+                if self.local_version(index_path) is None:
+                    # Never published (written before shared storage was on): keep serving it
+                    return os.path.exists(index_path)
+                # Deleted on another node: drop this copy too, so it stops being served
+                shutil.rmtree(index_path, ignore_errors=True)
+                with self._lock:
+                    self._sizes.pop(name, None)
+                    self._checked.pop(name, None)
+                return False
+            if self.local_version(index_path) == manifest['version']:
+                return True
+            self._fetch(name, manifest, index_path)
+        self.stored(name, index_path)
+        return True
+
+    def _fetch(self, name, manifest, index_path):
+        started = time.perf_counter()
+        os.makedirs(self.storage_path, exist_ok=True)
+        tmp_path = f"{index_path}.tmp-{uuid.uuid4().hex[:8]}"
+        artifact = f"{tmp_path}.zst"
+        try:
+            self.artifacts.get(self._key(name), manifest, artifact)
+            unpack_directory(artifact, tmp_path)
+            with open(os.path.join(tmp_path, self.VERSION_FILE), 'w') as f:
+                f.write(manifest['version'])
+            swap_in_directory(tmp_path, index_path)
+        finally:
+            if os.path.exists(artifact):
+                os.remove(artifact)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        ARTIFACT_TRANSFERS.inc(direction='fetch', kind='index')
+        ARTIFACT_BYTES.inc(manifest['size'], direction='fetch')
+        ARTIFACT_SECONDS.observe(time.perf_counter() - started, direction='fetch')
+
+    def _evict(self, keep):
+        while True:
+            with self._lock:
+                if sum(self._sizes.values()) <= self.max_bytes:
+                    return
+                victim = next((n for n in self._sizes if n != keep), None)
+                if victim is None:
+                    return
+                self._sizes.pop(victim)
+                self._checked.pop(victim, None)
+            shutil.rmtree(os.path.join(self.storage_path, victim), ignore_errors=True)
+            NODE_CACHE_EVICTIONS.inc()
+
+    def delete(self, document_id):
+        name = str(document_id)
+        self.artifacts.delete(self._key(name))
+        with self._lock:
+            self._sizes.pop(name, None)
+            self._checked.pop(name, None)
+
+
+class SharedUploads:
+    """Uploaded source files mirrored to the shared store as compressed artifacts,
+    so a rebuild or replace on any node can find the original file."""
+
+    def __init__(self, artifacts, level=3):
+        self.artifacts = artifacts
+        self.level = level
+
+    @staticmethod
+    def _key(file_path):
+        return f"uploads/{os.path.basename(file_path)}"
+
+    def publish(self, file_path):
+        # Stored filenames are unique and never rewritten, so one copy is enough
+        if self.artifacts.manifest(self._key(file_path)) is not None:
+            return
+        started = time.perf_counter()
+        artifact = f"{file_path}.{uuid.uuid4().hex[:8]}.zst"
+        try:
+            compress_file(file_path, artifact, self.level)
+            manifest = self.artifacts.put(self._key(file_path), artifact, 'upload')
+        finally:
+            if os.path.exists(artifact):
+                os.remove(artifact)
+        ARTIFACT_TRANSFERS.inc(direction='publish', kind='upload')
+        ARTIFACT_BYTES.inc(manifest['size'], direction='publish')
+        ARTIFACT_SECONDS.observe(time.perf_counter() - started, direction='publish')
+
+    def ensure(self, file_path):
+        """Fetch file_path from the shared store if this node doesn't have it. Returns whether it exists."""
+        if os.path.exists(file_path):
+            return True
+        manifest = self.artifacts.manifest(self._key(file_path))
+        if manifest is None:
+            return False
+        started = time.perf_counter()
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        artifact = f"{file_path}.{uuid.uuid4().hex[:8]}.zst"
+        tmp_path = f"{file_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            self.artifacts.get(self._key(file_path), manifest, artifact)
+            decompress_file(artifact, tmp_path)
+            os.replace(tmp_path, file_path)
+        finally:
+            for path in (artifact, tmp_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        ARTIFACT_TRANSFERS.inc(direction='fetch', kind='upload')
+        ARTIFACT_BYTES.inc(manifest['size'], direction='fetch')
+        ARTIFACT_SECONDS.observe(time.perf_counter() - started, direction='fetch')
+        return True
+
+    def delete(self, file_path):
+        self.artifacts.delete(self._key(file_path))
@@ -0,0 +1,294 @@
+import json
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from app.services.metrics import STREAMS_IN_FLIGHT, CACHE_ENTRIES, SSE_EVENTS, SSE_WRITES, SSE_BYTES
+from app.services.profiler import profiler
+
+
+class GenerationStream:
+    """One upstream LLM generation, buffered so clients can disconnect and resume.
+
+    Events are numbered from 1 and kept in a bounded ring buffer. The full answer
+    is accumulated alongside, so a client that fell behind the ring buffer can be
+    sent a snapshot instead of the individual events it missed.
+
+    Chunks are coalesced before they become events: text is held back until
+    flush_chars have built up or the oldest held text is flush_seconds old
+    (whichever comes first; a waiting follower flushes on the timer if the
+    producer is stalled). The first chunk of an answer is never held. 0/0 gives
+    one event per upstream chunk.
+    """
+
+    def __init__(self, stream_id, user_id, conversation_id, max_events, flush_chars=0, flush_seconds=0.0):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.events = deque(maxlen=max_events)
+        self.next_id = 1
+        self.full_answer = ""
+        self.sources = []
+        self.done = False
+        self.finished_at = None
+        self.consumers = 0
+        self.last_seen = time.monotonic()
+        self.flush_chars = flush_chars
+        self.flush_seconds = flush_seconds
+        self._pending = []
+        self._pending_chars = 0
+        self._pending_since = None
+        self._flushed_chunk = False
+        self._cond = threading.Condition()
+
+    def _append(self, payload):
+        event_id = self.next_id
+        self.next_id += 1
+        self.events.append((event_id, json.dumps(payload)))
+        self._cond.notify_all()
+
+    def _flush(self):
+        if self._pending:
+            self._append({'chunk': "".join(self._pending)})
+            self._pending = []
+            self._pending_chars = 0
+            self._pending_since = None
+            self._flushed_chunk = True
+
+    def _flush_due(self, now):
+        return self._pending_since is not None and now - self._pending_since >= self.flush_seconds
+
+    def publish(self, payload, final=False):
+        with self._cond:
+            # Held-back text goes out before whatever follows it (sources, done, error)
+            self._flush()
+            self._append(payload)
+            if final:
+                self.done = True
+                self.finished_at = time.monotonic()
+
+    def publish_chunk(self, text):
+        # The answer and its pending text are updated under one lock so snapshots stay consistent
+        with self._cond:
+            now = time.monotonic()
+            self.full_answer += text
+            self._pending.append(text)
+            self._pending_chars += len(text)
+            if self._pending_since is None:
+                self._pending_since = now
+                # Wake followers so they wait on the flush timer rather than the poll interval
+                self._cond.notify_all()
+            if (not self._flushed_chunk or self._pending_chars >= self.flush_chars
+                    or self._flush_due(now)):
+                self._flush()
+
+    def is_abandoned(self, abandon_seconds):
+        with self._cond:
+            return self.consumers == 0 and time.monotonic() - self.last_seen > abandon_seconds
+
+    def follow(self, last_event_id=0, poll_seconds=1.0):
+        """Yield (event_id, data_json) for every event after last_event_id until the stream ends."""
+        for batch in self.follow_batches(last_event_id, poll_seconds):
+            yield from batch
+
+    def follow_batches(self, last_event_id=0, poll_seconds=1.0, heartbeat_seconds=None):
+        """Yield lists of (event_id, data_json) after last_event_id until the stream ends,
+        each list holding every event ready at that moment. With heartbeat_seconds, an
+        empty list is yielded whenever that long passes without any events."""
+        cursor = last_event_id
+        with self._cond:
+            self.consumers += 1
+            self.last_seen = time.monotonic()
+        last_sent = time.monotonic()
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    if self._flush_due(now):
+                        self._flush()
+                    oldest = self.events[0][0] if self.events else self.next_id
+                    if cursor < oldest - 1:
+                        # The events this client missed have left the ring buffer;
+                        # text still held back arrives later as a normal chunk event
+                        cursor = self.next_id - 1
+                        sent = len(self.full_answer) - self._pending_chars
+                        snapshot = {'snapshot': self.full_answer[:sent]}
+                        if self.done:
+                            snapshot.update({'sources': list(self.sources), 'done': True})
+                        pending = [(cursor, json.dumps(snapshot))]
+                    else:
+                        pending = [event for event in self.events if event[0] > cursor]
+                    if not pending:
+                        if self.done:
+                            return
+                        timeout = poll_seconds
+                        if self._pending_since is not None:
+                            timeout = min(timeout, self._pending_since + self.flush_seconds - now)
+                        if heartbeat_seconds:
+                            timeout = min(timeout, last_sent + heartbeat_seconds - now)
+                        self._cond.wait(timeout=max(timeout, 0.0))
+                    self.last_seen = time.monotonic()
+                if pending:
+                    yield pending
+                    cursor = pending[-1][0]
+                    last_sent = time.monotonic()
+                elif heartbeat_seconds and time.monotonic() - last_sent >= heartbeat_seconds:
+                    yield []
+                    last_sent = time.monotonic()
+        finally:
+            with self._cond:
+                self.consumers -= 1
+                self.last_seen = time.monotonic()
+
+
+class StreamRegistry:
+    """Tracks in-flight and recently finished generations for this process."""
+
+    def __init__(self, max_events=512, abandon_seconds=30, retain_seconds=120):
+        self.max_events = max_events
+        self.abandon_seconds = abandon_seconds
+        self.retain_seconds = retain_seconds
+        self.flush_chars = 0
+        self.flush_seconds = 0.0
+        self.heartbeat_seconds = None
+        self.compression = False
+        self._streams = {}
+        self._lock = threading.Lock()
+        CACHE_ENTRIES.set_function(lambda: len(self._streams), cache='sse_streams')
+
+    def init_app(self, app):
+        self.max_events = app.config.get('STREAM_BUFFER_EVENTS', self.max_events)
+        self.abandon_seconds = app.config.get('STREAM_ABANDON_SECONDS', self.abandon_seconds)
+        self.retain_seconds = app.config.get('STREAM_RETAIN_SECONDS', self.retain_seconds)
+        self.flush_chars = app.config.get('STREAM_FLUSH_CHARS', self.flush_chars)
+        self.flush_seconds = app.config.get('STREAM_FLUSH_MS', self.flush_seconds * 1000) / 1000.0
+        self.heartbeat_seconds = app.config.get('STREAM_HEARTBEAT_SECONDS', self.heartbeat_seconds)
+        self.compression = app.config.get('STREAM_COMPRESSION', self.compression)
+
+    def _reap(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, s in self._streams.items()
+                       if s.finished_at is not None and now - s.finished_at > self.retain_seconds]
+            for sid in expired:
+                del self._streams[sid]
+
+    def start(self, app, user_id, conversation_id, produce, on_finish):
+        """Run produce() on a background thread and buffer what it yields.
+
+        produce: callable returning an iterator of (chunk_str, sources) tuples.
+        on_finish: callable(answer, sources) run inside an app context once the
+        generation completes, fails or is abandoned, so the answer is persisted
+        even if no client is left listening.
+        """
+        self._reap()
+        stream = GenerationStream(
+            uuid.uuid4().hex, user_id, conversation_id, self.max_events,
+            flush_chars=self.flush_chars, flush_seconds=self.flush_seconds
+        )
+        stream.publish({'stream_id': stream.stream_id})
+        with self._lock:
+            self._streams[stream.stream_id] = stream
+
+        thread = threading.Thread(
+            target=self._run, args=(app, stream, produce, on_finish, profiler.current()),
+            name=f"generation-{stream.stream_id[:8]}", daemon=True
+        )
+        thread.start()
+        return stream
+
+    def get(self, stream_id, user_id):
+        self._reap()
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        if stream is None or stream.user_id != user_id:
+            return None
+        return stream
+
+    def _run(self, app, stream, produce, on_finish, profile=None):
+        with app.app_context():
+            STREAMS_IN_FLIGHT.inc()
+            if profile is not None:
+                # The answer is generated here, so a profiled chat turn is sampled here too
+                profiler.attach(profile, 'generation')
+            saved = False
+            upstream = produce()
+            try:
+                for chunk_content, sources in upstream:
+                    stream.sources = sources
+                    if chunk_content:
+                        stream.publish_chunk(chunk_content)
+                    if stream.is_abandoned(self.abandon_seconds):
+                        print(f">>>> STREAM {stream.stream_id} ABANDONED, keeping partial answer")
+                        break
+
+                if stream.full_answer:
+                    saved = True
+                    on_finish(stream.full_answer, list(stream.sources))
+                stream.publish({'sources': list(stream.sources), 'done': True}, final=True)
+
+            except Exception as e:
+                print(f">>>> ERROR IN CHAT STREAM: {str(e)}")
+                if stream.full_answer and not saved:
+                    try:
+                        on_finish(stream.full_answer, list(stream.sources))
+                    except Exception as save_error:
+                        print(f">>>> FAILED TO SAVE PARTIAL ANSWER: {str(save_error)}")
+                stream.publish({'error': str(e)}, final=True)
+            finally:
+                # Close now rather than at garbage collection, so the LLM slot and connection are released
+                if hasattr(upstream, 'close'):
+                    upstream.close()
+                STREAMS_IN_FLIGHT.dec()
+                if profile is not None:
+                    profiler.detach(profile)
+
+
+def format_sse(event_id, data):
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+
+# An SSE comment line: ignored by clients, but keeps proxies from timing out an idle response
+HEARTBEAT = ": keep-alive\n\n"
+
+
+class GzipWriter:
+    """Incremental gzip for a streamed response. Every write is sync-flushed, so
+    the client can decode each write as soon as it arrives."""
+
+    def __init__(self, level=6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def write(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def close(self):
+        return self._compressor.flush()
+
+
+def sse_body(stream, last_event_id=0, heartbeat_seconds=None, gzip=False):
+    """Response body for following stream: one write per batch of ready events,
+    a heartbeat comment after heartbeat_seconds idle, optionally gzip-encoded."""
+    writer = GzipWriter() if gzip else None
+    encoding = 'gzip' if gzip else 'identity'
+    for batch in stream.follow_batches(last_event_id, heartbeat_seconds=heartbeat_seconds):
+        if batch:
+            text = "".join(format_sse(event_id, data) for event_id, data in batch)
+            SSE_EVENTS.inc(len(batch), kind='event')
+        else:
+            text = HEARTBEAT
+            SSE_EVENTS.inc(kind='heartbeat')
+        data = text.encode('utf-8')
+        if writer is not None:
+            data = writer.write(data)
+        SSE_WRITES.inc(encoding=encoding)
+        SSE_BYTES.inc(len(data), encoding=encoding)
+        yield data
+    if writer is not None:
+        tail = writer.close()
+        SSE_BYTES.inc(len(tail), encoding=encoding)
+        yield tail
+
+
+stream_registry = StreamRegistry()
@@ -0,0 +1,135 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from app.services.metrics import Counter
+
+QUERY_ROUTES = Counter(
+    'rag_query_routes_total',
+    'Chat turns by how their context was built (retrieval, summary).',
+    ['route']
+)
+
+# A document is summarised in at most this many sections, each at least SECTION_MIN_CHARS long
+MAX_SECTIONS = 16
+SECTION_MIN_CHARS = 4000
+SUMMARY_WORKERS = 4
+# Section summaries added to a summary-routed prompt, in characters across all selected documents
+SECTION_CONTEXT_CHARS = 8000
+
+# Questions about a document as a whole rather than a fact inside it
+_DOCUMENT_LEVEL_PATTERNS = [
+    r'\bsummar(y|ise|ize|ies|ization|isation)\b',
+    r'\b(overview|tl;?dr|gist|synopsis)\b',
+    r'\bwhat(\'s| is| are)\b.*\b(document|documents|file|files|pdf|paper|report|book|article)s?\b.*\babout\b',
+    r'\b(main|key|central) (points?|ideas?|themes?|topics?|takeaways?|arguments?|findings?)\b',
+    r'\b(outline|table of contents|structure) of\b',
+    r'\bwhat (does|do) (this|the|these) (document|file|pdf|paper|report|book|article)s? (cover|discuss|say)\b',
+]
+_DOCUMENT_LEVEL_RE = re.compile('|'.join(_DOCUMENT_LEVEL_PATTERNS), re.IGNORECASE)
+
+_SECTION_PROMPT = """Summarize the following section of a document in 3-5 sentences.
+Keep names, numbers and conclusions; do not add anything that is not in the text.
+
+SECTION ({title}):
+{text}
+
+Summary:"""
+
+_DOCUMENT_PROMPT = """Below are summaries of the consecutive sections of one document.
+Write a summary of the whole document in one or two paragraphs: what it is,
+what it covers and its main conclusions.
+
+{sections}
+
+Document summary:"""
+
+
+def is_document_level(question):
+    """True for questions about a whole document ("summarize this", "what is this file about")."""
+    return bool(_DOCUMENT_LEVEL_RE.search(question or ''))
+
+
+def _section_title(chunks, number):
+    pages = [c.metadata.get('page') for c in chunks if isinstance(c.metadata.get('page'), int)]
+    if pages:
+        first, last = min(pages) + 1, max(pages) + 1  # PyPDFLoader pages are 0-based
+        return f"Page {first}" if first == last else f"Pages {first}-{last}"
+    return f"Part {number}"
+
+
+def split_sections(chunks):
+    """Group consecutive chunks into at most MAX_SECTIONS sections of similar size.
+    Returns a list of (title, text)."""
+    total = sum(len(c.page_content) for c in chunks)
+    target = max(SECTION_MIN_CHARS, total // MAX_SECTIONS + 1)
+    sections = []
+    current = []
+    size = 0
+    for chunk in chunks:
+        current.append(chunk)
+        size += len(chunk.page_content)
+        if size >= target:
+            sections.append(current)
+            current, size = [], 0
+    if current:
+        sections.append(current)
+    return [
+        (_section_title(group, n), "\n".join(c.page_content for c in group))
+        for n, group in enumerate(sections, start=1)
+    ]
+
+
+def build_summary(chunks, llm):
+    """Summarize each section, then the document from its section summaries.
+    Returns {'document': str, 'sections': [{'title': str, 'summary': str}, ...]}."""
+    sections = split_sections(chunks)
+    if not sections:
+        return None
+
+    def summarize(section):
+        title, text = section
+        response = llm.invoke(_SECTION_PROMPT.format(title=title, text=text))
+        return {'title': title, 'summary': response.content.strip()}
+
+    with ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary") as pool:
+        section_summaries = list(pool.map(summarize, sections))
+
+    if len(section_summaries) == 1:
+        document_summary = section_summaries[0]['summary']
+    else:
+        joined = "\n\n".join(f"[{s['title']}]\n{s['summary']}" for s in section_summaries)
+        document_summary = llm.invoke(_DOCUMENT_PROMPT.format(sections=joined)).content.strip()
+    return {'document': document_summary, 'sections': section_summaries}
+
+
+def document_summaries(document_ids):
+    """{document_id: {'filename', 'source', 'summary', 'sections'}} for the given
+    documents that have a summary, as rag_service's query router expects."""
+    from app.models.document import Document
+    docs = Document.query.filter(Document.id.in_(document_ids), Document.summary.isnot(None)).all()
+    return {
+        d.id: {
+            'filename': d.original_filename,
+            'source': d.file_path,
+            'summary': d.summary,
+            'sections': d.section_summaries or [],
+        }
+        for d in docs
+    }
+
+
+def summary_context(summaries):
+    """Prompt context from precomputed summaries.
+    summaries: list of dicts with 'filename', 'summary' and 'sections'."""
+    parts = []
+    for entry in summaries:
+        lines = [f"DOCUMENT: {entry['filename']}", f"Summary: {entry['summary']}"]
+        # Section detail shares a fixed budget across the selected documents
+        budget = SECTION_CONTEXT_CHARS // len(summaries)
+        for section in entry.get('sections') or []:
+            line = f"- {section['title']}: {section['summary']}"
+            if len(line) > budget:
+                break
+            budget -= len(line)
+            lines.append(line)
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
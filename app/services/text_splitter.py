@@ -0,0 +1,251 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right
+import numpy as np
+from langchain_core.documents import Document as LCDocument
+
+# Same split preference as RecursiveCharacterTextSplitter's defaults
+# (paragraph, then line, then word; a hard token cut as the last resort)
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ")
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# str.isspace() by code point; nothing past U+3000 is whitespace (the last entry stands for all of them)
+_SPACE = np.array([chr(c).isspace() for c in range(0x3002)])
+
+_tokenizers = {}
+_word_tokens = {}
+_tokenizers_lock = threading.Lock()
+
+
+def regex_token_offsets(text):
+    """Approximate tokenizer (words and punctuation) used when the model tokenizer isn't available."""
+    return [m.span() for m in _WORD_RE.finditer(text)]
+
+
+def _load_tokenizer(model_name):
+    """The embedding model's fast (Rust) tokenizer, or None if it can't be loaded. Call with the lock held."""
+    if model_name not in _tokenizers:
+        try:
+            from tokenizers import Tokenizer
+            tokenizer = Tokenizer.from_pretrained(model_name)
+            tokenizer.no_truncation()
+            tokenizer.no_padding()
+        except Exception as e:
+            print(f">>>> ERROR LOADING TOKENIZER {model_name}, COUNTING WORDS INSTEAD: {str(e)}")
+            tokenizer = None
+        _tokenizers[model_name] = tokenizer
+    return _tokenizers[model_name]
+
+
+def load_token_offsets(model_name="sentence-transformers/all-MiniLM-L6-v2"):
+    """Return token_offsets(text) -> [(start, end), ...] using the embedding model's
+    tokenizer, falling back to regex_token_offsets if it can't be loaded."""
+    with _tokenizers_lock:
+        tokenizer = _load_tokenizer(model_name)
+    if tokenizer is None:
+        return regex_token_offsets
+    return lambda text: tokenizer.encode(text, add_special_tokens=False).offsets
+
+
+def load_word_tokens(model_name="sentence-transformers/all-MiniLM-L6-v2"):
+    """Return the shared WordTokens for the embedding model's tokenizer (regex words if it can't be loaded)."""
+    with _tokenizers_lock:
+        if model_name not in _word_tokens:
+            tokenizer = _load_tokenizer(model_name)
+            if tokenizer is None:
+                encode_offsets = lambda texts: [regex_token_offsets(text) for text in texts]
+            else:
+                encode_offsets = lambda texts: [
+                    encoding.offsets for encoding in tokenizer.encode_batch(texts, add_special_tokens=False)
+                ]
+            _word_tokens[model_name] = WordTokens(encode_offsets)
+        return _word_tokens[model_name]
+
+
+class WordTokens:
+    """Token counts of whitespace-separated words, cached across texts.
+
+    The embedding models' (BERT-style) tokenizers split on whitespace before
+    anything else and normalize character by character, so a text's tokens are
+    its words' tokens in order and a word always counts the same. Once a few
+    documents are in nearly every word is a cache hit; the tokenizer only sees
+    the new words, joined into pieces of piece_words and encoded in one batch
+    (which the Rust tokenizer spreads over the cores).
+    """
+
+    def __init__(self, encode_offsets, max_words=500_000, piece_words=1000):
+        self.encode_offsets = encode_offsets  # [text, ...] -> [[(start, end), ...], ...]
+        self.max_words = max_words
+        self.piece_words = piece_words
+        self._counts = {}
+
+    def counts(self, words):
+        """Token count of each word, as an int64 array."""
+        counts = self._counts
+        missing = set(words).difference(counts)
+        if missing:
+            if len(counts) + len(missing) > self.max_words:
+                # Start over rather than evict; concurrent callers keep the dict they hold
+                counts = self._counts = {}
+                missing = set(words)
+            missing = list(missing)
+            pieces = [' '.join(missing[n:n + self.piece_words]) for n in range(0, len(missing), self.piece_words)]
+            # Where each word and each piece starts in ' '.join(missing)
+            word_starts = np.cumsum([0] + [len(word) + 1 for word in missing[:-1]])
+            piece_starts = word_starts[::self.piece_words]
+            token_starts = np.concatenate([
+                np.fromiter((start for start, _ in offsets), dtype=np.int64, count=len(offsets)) + piece_start
+                for offsets, piece_start in zip(self.encode_offsets(pieces), piece_starts)
+            ])
+            owners = np.searchsorted(word_starts, token_starts, side='right') - 1
+            counts.update(zip(missing, np.bincount(owners, minlength=len(missing)).tolist()))
+        return np.fromiter(map(counts.__getitem__, words), dtype=np.int64, count=len(words))
+
+    def offsets(self, word):
+        """[(start, end), ...] of the word's tokens, for cutting inside it."""
+        return self.encode_offsets([word])[0]
+
+
+class LinearTokenSplitter:
+    """Splits text into chunks of at most chunk_tokens embedding-model tokens.
+
+    The text is never tokenized as a whole. Words (whitespace-separated runs,
+    located with numpy) get their token counts from WordTokens, and the running
+    sum gives the token index every word starts at. A separator can only sit
+    between words, so each one becomes a boundary token: the start of the first
+    word after it. Chunks are then cut greedily: the furthest boundary of the
+    most preferred separator within the window (what RecursiveCharacterTextSplitter's
+    merge ends up choosing), found by bisecting that separator's boundaries.
+    Unless the cut was at a paragraph break the next chunk starts at the first
+    boundary inside the overlap. Only a window with no separator at all cuts
+    inside a word, and only that word is tokenized.
+    """
+
+    def __init__(self, word_tokens, chunk_tokens=128, overlap_tokens=12, separators=DEFAULT_SEPARATORS):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        if any(not separator or not separator.isspace() for separator in separators):
+            raise ValueError("separators must be whitespace")
+        self.word_tokens = word_tokens
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.separators = separators
+
+    def _layout(self, text):
+        """(word starts, word ends, words, token index of each word start plus the total,
+        boundary tokens per separator, boundary tokens of any separator), all ascending."""
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        space = _SPACE[np.minimum(codes, len(_SPACE) - 1)]
+        edges = np.flatnonzero(np.diff(space, prepend=True, append=True))
+        starts, ends = edges[0::2], edges[1::2]
+        words = text.split()
+        if len(words) != len(starts):
+            words = [text[a:b] for a, b in zip(starts.tolist(), ends.tolist())]
+        first_token = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum(self.word_tokens.counts(words), out=first_token[1:])
+
+        def boundary_tokens(found):
+            # A separator at char p lets a chunk end before the first word starting at or after p
+            tokens = first_token[np.searchsorted(starts, np.flatnonzero(found))]
+            return tokens[np.r_[True, tokens[1:] != tokens[:-1]]].tolist() if len(tokens) else []
+
+        boundaries = []
+        anywhere = np.zeros(len(codes), dtype=bool)
+        for separator in self.separators:
+            positions = max(len(codes) - len(separator) + 1, 0)
+            found = np.ones(positions, dtype=bool)
+            for n, char in enumerate(separator):
+                found &= codes[n:n + positions] == ord(char)
+            boundaries.append(boundary_tokens(found))
+            anywhere[:positions] |= found
+        return starts, ends, words, first_token.tolist(), boundaries, boundary_tokens(anywhere)
+
+    def split_spans(self, text):
+        """Return [(start_char, end_char, token_count), ...] for the chunks of text."""
+        starts, ends, words, first_token, boundaries, anywhere = self._layout(text)
+        n = first_token[-1]
+        if n == 0:
+            return []
+
+        def char_start(token):
+            word = bisect_right(first_token, token) - 1
+            if token == first_token[word]:
+                return int(starts[word])
+            return int(starts[word]) + self.word_tokens.offsets(words[word])[token - first_token[word]][0]
+
+        def char_end(token):
+            word = bisect_right(first_token, token) - 1
+            if token == first_token[word + 1] - 1:
+                return int(ends[word])
+            return int(starts[word]) + self.word_tokens.offsets(words[word])[token - first_token[word]][1]
+
+        spans = []
+        start = 0
+        previous_end = 0
+        while start < n:
+            limit = start + self.chunk_tokens
+            cut_priority = None
+            if limit >= n:
+                end = n
+            else:
+                # Only boundaries past the previous chunk count, so a chunk is never just overlap
+                floor = max(start, previous_end)
+                end, cut_priority = limit, len(self.separators)
+                for priority, tokens in enumerate(boundaries):
+                    i = bisect_right(tokens, limit) - 1
+                    if i >= 0 and tokens[i] > floor:
+                        end, cut_priority = tokens[i], priority
+                        break
+
+            spans.append((char_start(start), char_end(end - 1), end - start))
+            if end >= n:
+                break
+            previous_end = end
+
+            # Like the recursive splitter, chunks cut at the top-level separator don't overlap;
+            # otherwise restart at the first boundary inside the last overlap_tokens of this chunk
+            chunk_start, start = start, end
+            if cut_priority != 0 and self.overlap_tokens:
+                i = bisect_left(anywhere, max(end - self.overlap_tokens, chunk_start + 1))
+                if i < len(anywhere) and anywhere[i] < end:
+                    start = anywhere[i]
+        return spans
+
+    def split_text(self, text):
+        return [text[s:e] for s, e, _ in self.split_spans(text)]
+
+    def split_documents(self, documents):
+        """Split loader Documents (one per page for PDFs). Each chunk keeps its
+        page's metadata plus start_index/end_index (character offsets within the
+        page) and token_count."""
+        chunks = []
+        for document in documents:
+            text = document.page_content
+            for start, end, tokens in self.split_spans(text):
+                metadata = dict(document.metadata)
+                metadata['start_index'] = start
+                metadata['end_index'] = end
+                metadata['token_count'] = tokens
+                chunks.append(LCDocument(page_content=text[start:end], metadata=metadata))
+        return chunks
+
+
+def split_parent_child(documents, parent_splitter, child_splitter):
+    """Small-to-big chunking: split documents into parent sections, then each section
+    into child chunks. Children keep the page metadata, with start_index/end_index
+    relative to the page as with a plain split, plus parent_index (the position of
+    their section in parents). Works with any splitter that records start_index
+    (RecursiveCharacterTextSplitter with add_start_index=True included).
+    Returns (parents, children)."""
+    parents = parent_splitter.split_documents(documents)
+    children = []
+    for n, parent in enumerate(parents):
+        offset = parent.metadata['start_index']
+        for child in child_splitter.split_documents([parent]):
+            child.metadata['start_index'] += offset
+            if 'end_index' in child.metadata:
+                child.metadata['end_index'] += offset
+            child.metadata['parent_index'] = n
+            children.append(child)
+    return parents, children
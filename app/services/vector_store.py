@@ -0,0 +1,630 @@
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.documents import Document as LCDocument
+from app.services.index_cache import IndexCache
+from app.services.metrics import Counter, Histogram
+from app.services.shared_storage import SharedIndexes, swap_in_directory
+
+VECTOR_STORE_SECONDS = Histogram(
+    'rag_vector_store_seconds',
+    'Time spent in vector store operations, by backend and operation (replace, sync, load from disk, search, filtered_search, remove, delete).',
+    ['backend', 'op']
+)
+VECTOR_STORE_RETRIES = Counter(
+    'rag_vector_store_retries_total',
+    'Remote vector store requests retried, by reason (status code or connection error).',
+    ['reason']
+)
+
+# To store local FAISS databases per document
+FAISS_STORAGE_PATH = "instance/faiss_indexes"
+
+
+def plan_sync(existing_ids, ids):
+    """Split a document's new chunk ids against what the store already holds.
+    Returns (added_ids, removed_ids, kept_ids); added and kept follow the order of ids."""
+    wanted = set(ids)
+    added = [i for i in ids if i not in existing_ids]
+    removed = [i for i in existing_ids if i not in wanted]
+    kept = [i for i in ids if i in existing_ids]
+    return added, removed, kept
+
+
+class FilterIndex:
+    """The page of every vector in a FAISS index, by position (-1: no page), so a
+    RetrievalFilter becomes an ID selector applied inside the search rather than
+    a post-filter over a larger top-k. Chunks are added in document order, so a
+    page range is usually one contiguous run of positions (an IDSelectorRange);
+    otherwise, e.g. after in-place re-ingests, it is a bitmap over the positions.
+    Written next to index.faiss at ingest, rebuilt from the docstore for indexes
+    that predate it.
+    """
+
+    FILENAME = 'filters.npy'
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    @classmethod
+    def build(cls, vectorstore):
+        import numpy as np
+        pages = np.full(vectorstore.index.ntotal, -1, dtype=np.int32)
+        for position, docstore_id in vectorstore.index_to_docstore_id.items():
+            doc = vectorstore.docstore.search(docstore_id)
+            page = doc.metadata.get('page') if isinstance(doc, LCDocument) else None
+            if isinstance(page, int) and position < len(pages):
+                pages[position] = page
+        return cls(pages)
+
+    @classmethod
+    def load(cls, index_path, vectorstore):
+        import numpy as np
+        try:
+            pages = np.load(os.path.join(index_path, cls.FILENAME))
+            if len(pages) == vectorstore.index.ntotal:
+                return cls(pages)
+        except (OSError, ValueError):
+            pass
+        return cls.build(vectorstore)
+
+    def save(self, index_path):
+        import numpy as np
+        np.save(os.path.join(index_path, self.FILENAME), self.pages)
+
+    def selector(self, retrieval_filter):
+        """(faiss.IDSelector or None for no restriction, positions selected).
+        The selector only borrows its bitmap, so keep the returned tuple alive
+        until the search has run."""
+        import faiss
+        import numpy as np
+        bounds = retrieval_filter.page_bounds if retrieval_filter is not None else None
+        if bounds is None:
+            return None, len(self.pages), None
+        mask = (self.pages >= bounds[0]) & (self.pages <= bounds[1])
+        positions = np.flatnonzero(mask)
+        if len(positions) == 0:
+            return None, 0, None
+        if positions[-1] - positions[0] + 1 == len(positions):
+            return faiss.IDSelectorRange(int(positions[0]), int(positions[-1]) + 1), len(positions), None
+        bitmap = np.packbits(mask, bitorder='little')
+        return faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap)), len(positions), bitmap
+
+
+class LoadedIndex:
+    """What the FAISS store caches per document: the LangChain vectorstore and its FilterIndex."""
+
+    __slots__ = ('vectorstore', 'filters')
+
+    def __init__(self, vectorstore, filters):
+        self.vectorstore = vectorstore
+        self.filters = filters
+
+
+class LocalFaissStore:
+    """One FAISS index directory per document under storage_path.
+
+    Loaded indexes are kept in an IndexCache; every write swaps in a whole new
+    directory, which the cache notices through the inode in its signature.
+    With shared (a SharedIndexes), storage_path is only this node's cache:
+    writes are published to the shared store and reads refresh from it.
+    """
+
+    name = 'faiss'
+
+    def __init__(self, storage_path, embeddings, shared=None):
+        self.storage_path = storage_path
+        self.embeddings = embeddings  # callable returning the shared embeddings object
+        self.shared = shared
+        self.cache = IndexCache(self._load, self._signature, 'faiss_indexes')
+
+    def index_path(self, document_id):
+        return os.path.join(self.storage_path, str(document_id))
+
+    def _load(self, document_id):
+        from langchain_community.vectorstores import FAISS
+        index_path = self.index_path(document_id)
+        if not os.path.exists(index_path):
+            return None
+        # Timed here rather than around cache.get, so cache hits don't water it down
+        # (rag_index_cache_requests_total counts those)
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='load'):
+            vectorstore = FAISS.load_local(
+                index_path,
+                self.embeddings(),
+                allow_dangerous_deserialization=True  # Required when loading local files you created
+            )
+            return LoadedIndex(vectorstore, FilterIndex.load(index_path, vectorstore))
+
+    def _refresh(self, document_id):
+        if self.shared is None:
+            return
+        try:
+            self.shared.refresh(document_id, self.index_path(document_id))
+        except Exception as e:
+            # Serve whatever copy this node has rather than failing the query
+            print(f">>>> ERROR REFRESHING INDEX {document_id} FROM SHARED STORAGE: {str(e)}")
+
+    def _signature(self, document_id):
+        self._refresh(document_id)
+        # _save swaps whole directories, so the inode changes on every rewrite
+        try:
+            st = os.stat(os.path.join(self.index_path(document_id), 'index.faiss'))
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _save(self, vectorstore, document_id):
+        """Write the index next to its final location, then swap it in,
+        so readers never load a half-written index.faiss/index.pkl pair."""
+        os.makedirs(self.storage_path, exist_ok=True)
+        index_path = self.index_path(document_id)
+        tmp_path = f"{index_path}.tmp-{uuid.uuid4().hex[:8]}"
+        try:
+            vectorstore.save_local(tmp_path)
+            FilterIndex.build(vectorstore).save(tmp_path)
+            if self.shared is not None:
+                # Publish first: a write other nodes can't see must fail the ingest
+                self.shared.publish(document_id, tmp_path)
+            swap_in_directory(tmp_path, index_path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        if self.shared is not None:
+            self.shared.stored(document_id, index_path)
+
+    def publish(self, document_id):
+        """Re-publish a local index rewritten outside _save (e.g. by compaction)."""
+        if self.shared is not None:
+            self.shared.publish(document_id, self.index_path(document_id))
+
+    def dimension(self):
+        """None: each document's index takes the dimension of the model it's built with."""
+        return None
+
+    def exists(self, document_id):
+        self._refresh(document_id)
+        return os.path.exists(self.index_path(document_id))
+
+    def replace(self, document_id, ids, texts, vectors, metadatas):
+        """Store exactly these chunks for the document, dropping whatever was there."""
+        from langchain_community.vectorstores import FAISS
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='replace'):
+            vectorstore = FAISS.from_embeddings(
+                list(zip(texts, vectors)),
+                self.embeddings(),
+                metadatas=metadatas,
+                ids=ids
+            )
+            self._save(vectorstore, document_id)
+
+    def sync(self, document_id, ids, texts, metadatas, embed):
+        """Bring the document's index in line with the given chunks, embedding only
+        the ones it doesn't already hold (embed(texts) -> vectors).
+        Returns (added, removed, kept) counts, or None if the document has no index yet."""
+        from langchain_community.vectorstores import FAISS
+        index_path = self.index_path(document_id)
+        if not self.exists(document_id):
+            return None
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='sync'):
+            vectorstore = FAISS.load_local(
+                index_path,
+                self.embeddings(),
+                allow_dangerous_deserialization=True
+            )
+            existing_ids = set(vectorstore.index_to_docstore_id.values())
+            added_ids, removed_ids, kept_ids = plan_sync(existing_ids, ids)
+            chunks = {i: (t, m) for i, t, m in zip(ids, texts, metadatas)}
+
+            if removed_ids:
+                vectorstore.delete(removed_ids)
+
+            if added_ids:
+                added_texts = [chunks[i][0] for i in added_ids]
+                vectorstore.add_embeddings(
+                    list(zip(added_texts, embed(added_texts))),
+                    metadatas=[chunks[i][1] for i in added_ids],
+                    ids=added_ids
+                )
+
+            # Unchanged text can still move pages or change source path
+            if kept_ids:
+                vectorstore.docstore.delete(kept_ids)
+                vectorstore.docstore.add({
+                    i: LCDocument(page_content=chunks[i][0], metadata=chunks[i][1], id=i)
+                    for i in kept_ids
+                })
+
+            self._save(vectorstore, document_id)
+        return len(added_ids), len(removed_ids), len(kept_ids)
+
+    def metadata(self, document_id, ids):
+        """{id: metadata} of the chunks among ids that the document's index holds."""
+        loaded = self.cache.get(document_id)
+        if loaded is None:
+            return {}
+        found = {}
+        for i in ids:
+            doc = loaded.vectorstore.docstore.search(i)
+            if isinstance(doc, LCDocument):
+                found[i] = dict(doc.metadata)
+        return found
+
+    def remove(self, document_id, ids):
+        """Drop these chunks from the document's index (ids it doesn't hold are ignored)."""
+        from langchain_community.vectorstores import FAISS
+        if not self.exists(document_id):
+            return
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='remove'):
+            vectorstore = FAISS.load_local(
+                self.index_path(document_id),
+                self.embeddings(),
+                allow_dangerous_deserialization=True
+            )
+            held = set(vectorstore.index_to_docstore_id.values())
+            ids = [i for i in ids if i in held]
+            if ids:
+                vectorstore.delete(ids)
+                self._save(vectorstore, document_id)
+
+    def search(self, document_id, query_vector, k, retrieval_filter=None):
+        """Top-k chunks for one document (among those retrieval_filter keeps), or None
+        if it has no index."""
+        if retrieval_filter is not None and retrieval_filter.pages is not None:
+            results = self.search_many(document_id, [query_vector], k, retrieval_filter)
+            return None if results is None else results[0]
+        loaded = self.cache.get(document_id)
+        if loaded is None:
+            return None
+        # FAISS releases the GIL while searching, so several documents search in parallel
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='search'):
+            return loaded.vectorstore.similarity_search_by_vector(query_vector, k=k)
+
+    def search_many(self, document_id, query_vectors, k, retrieval_filter=None):
+        """search() for several query vectors with one load and one FAISS call.
+        Returns a list of top-k lists (one per vector), or None if it has no index."""
+        import faiss
+        import numpy as np
+        loaded = self.cache.get(document_id)
+        if loaded is None:
+            return None
+        vectorstore = loaded.vectorstore
+        selector, selected, bitmap = loaded.filters.selector(retrieval_filter)
+        if selected == 0:
+            return [[] for _ in query_vectors]
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='filtered_search' if selector else 'search'):
+            params = faiss.SearchParameters(sel=selector) if selector is not None else None
+            _, positions = vectorstore.index.search(
+                np.asarray(query_vectors, dtype=np.float32), min(k, selected), params=params
+            )
+        results = []
+        for row in positions:
+            docs = []
+            for position in row:
+                if position < 0:
+                    continue  # Fewer than k vectors in the index
+                doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+                if isinstance(doc, LCDocument):
+                    docs.append(doc)
+            results.append(docs)
+        return results
+
+    def prefetch(self, document_id):
+        return self.cache.prefetch(document_id)
+
+    def delete(self, document_id):
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='delete'):
+            self.cache.invalidate(document_id)
+            index_path = self.index_path(document_id)
+            if os.path.exists(index_path):
+                shutil.rmtree(index_path)
+            if self.shared is not None:
+                self.shared.delete(document_id)
+
+    def count(self, document_id):
+        self._refresh(document_id)
+        loaded = self._load(document_id)
+        return None if loaded is None else loaded.vectorstore.index.ntotal
+
+
+class RemoteStoreError(Exception):
+    """A remote vector store request failed after all retries."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class PineconeStore:
+    """Pinecone data-plane REST API, one namespace per document.
+
+    Talks to the index host directly over a pooled requests.Session, so
+    connections are reused across calls and it works just as well against
+    scripts/pinecone_standin.py. Upserts are split into batches sent in
+    parallel; throttling, 5xx and connection errors are retried with
+    exponential back-off and jitter, honouring Retry-After.
+    """
+
+    name = 'pinecone'
+    # Metadata values Pinecone accepts as-is
+    _METADATA_TYPES = (str, int, float, bool)
+
+    def __init__(self, host, api_key, batch_size=100, upsert_workers=4, max_retries=5,
+                 backoff_seconds=0.5, timeout=30, api_version='2025-01'):
+        if not host:
+            raise ValueError("PineconeStore needs the index host (PINECONE_INDEX_HOST)")
+        self.host = host.rstrip('/')
+        if not self.host.startswith(('http://', 'https://')):
+            self.host = f"https://{self.host}"
+        self.batch_size = batch_size
+        self.upsert_workers = upsert_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(upsert_workers, 8) * 2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'X-Pinecone-API-Version': api_version,
+        })
+        if api_key:
+            self.session.headers['Api-Key'] = api_key
+        self._upsert_pool = None
+        self._pool_lock = threading.Lock()
+        self._dimension = None
+
+    @staticmethod
+    def namespace(document_id):
+        # Matches Document.pinecone_namespace
+        return str(document_id)
+
+    def _get_upsert_pool(self):
+        if self._upsert_pool is None:
+            with self._pool_lock:
+                if self._upsert_pool is None:
+                    self._upsert_pool = ThreadPoolExecutor(
+                        max_workers=self.upsert_workers, thread_name_prefix="pinecone-upsert"
+                    )
+        return self._upsert_pool
+
+    def _request(self, method, path, payload=None, params=None):
+        url = f"{self.host}{path}"
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.request(
+                    method, url, json=payload, params=params, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                reason, error = 'connection', e
+            else:
+                if response.status_code < 400:
+                    return response.json() if response.content else {}
+                if response.status_code != 429 and response.status_code < 500:
+                    raise RemoteStoreError(
+                        f"{method} {path} -> {response.status_code}: {response.text[:200]}",
+                        response.status_code
+                    )
+                reason, error = str(response.status_code), response.text[:200]
+                try:
+                    retry_after = float(response.headers.get('Retry-After', ''))
+                except ValueError:
+                    retry_after = None
+            if attempt == self.max_retries:
+                raise RemoteStoreError(f"{method} {path} failed after {attempt + 1} attempts: {error}")
+            VECTOR_STORE_RETRIES.inc(reason=reason)
+            delay = self.backoff_seconds * (2 ** attempt) * (0.5 + random.random())
+            time.sleep(max(delay, retry_after or 0))
+
+    @classmethod
+    def _clean_metadata(cls, metadata):
+        """Pinecone rejects nulls and nested values; keep scalars and string lists."""
+        cleaned = {}
+        for key, value in metadata.items():
+            if value is None:
+                continue
+            if isinstance(value, cls._METADATA_TYPES):
+                cleaned[key] = value
+            elif isinstance(value, (list, tuple)):
+                cleaned[key] = [str(v) for v in value]
+            else:
+                cleaned[key] = str(value)
+        return cleaned
+
+    def _upsert(self, namespace, ids, texts, vectors, metadatas):
+        records = [
+            {
+                'id': i,
+                'values': [float(x) for x in vector],
+                'metadata': {**self._clean_metadata(metadata), 'text': text},
+            }
+            for i, text, vector, metadata in zip(ids, texts, vectors, metadatas)
+        ]
+        batches = [records[n:n + self.batch_size] for n in range(0, len(records), self.batch_size)]
+        pool = self._get_upsert_pool()
+        futures = [
+            pool.submit(self._request, 'POST', '/vectors/upsert', {'vectors': batch, 'namespace': namespace})
+            for batch in batches
+        ]
+        # Surface the first failure only after every batch has finished or failed
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def _delete_ids(self, namespace, ids):
+        for n in range(0, len(ids), 1000):
+            self._request('POST', '/vectors/delete', {'ids': ids[n:n + 1000], 'namespace': namespace})
+
+    def _delete_namespace(self, namespace):
+        try:
+            self._request('POST', '/vectors/delete', {'deleteAll': True, 'namespace': namespace})
+        except RemoteStoreError as e:
+            # Deleting a namespace that was never written is not an error for us
+            if e.status != 404:
+                raise
+
+    def _list_ids(self, namespace):
+        ids = set()
+        token = None
+        while True:
+            params = {'namespace': namespace, 'limit': 100}
+            if token:
+                params['paginationToken'] = token
+            page = self._request('GET', '/vectors/list', params=params)
+            ids.update(v['id'] for v in page.get('vectors', []))
+            token = (page.get('pagination') or {}).get('next')
+            if not token:
+                return ids
+
+    def dimension(self):
+        """The index's vector dimension, or None while it isn't fixed yet (an empty
+        stand-in index). Every namespace lives in this one index, so every model used
+        with it must produce vectors of this dimension."""
+        if self._dimension is None:
+            stats = self._request('POST', '/describe_index_stats', {})
+            self._dimension = stats.get('dimension') or None
+        return self._dimension
+
+    def exists(self, document_id):
+        return bool(self.count(document_id))
+
+    def replace(self, document_id, ids, texts, vectors, metadatas):
+        namespace = self.namespace(document_id)
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='replace'):
+            self._delete_namespace(namespace)
+            self._upsert(namespace, ids, texts, vectors, metadatas)
+
+    def sync(self, document_id, ids, texts, metadatas, embed):
+        namespace = self.namespace(document_id)
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='sync'):
+            existing_ids = self._list_ids(namespace)
+            if not existing_ids:
+                return None
+            added_ids, removed_ids, kept_ids = plan_sync(existing_ids, ids)
+            chunks = {i: (t, m) for i, t, m in zip(ids, texts, metadatas)}
+
+            if removed_ids:
+                self._delete_ids(namespace, removed_ids)
+            if added_ids:
+                added_texts = [chunks[i][0] for i in added_ids]
+                self._upsert(
+                    namespace, added_ids, added_texts, embed(added_texts),
+                    [chunks[i][1] for i in added_ids]
+                )
+            # Unchanged text can still move pages or change source path
+            if kept_ids:
+                pool = self._get_upsert_pool()
+                futures = [
+                    pool.submit(self._request, 'POST', '/vectors/update', {
+                        'id': i,
+                        'setMetadata': {**self._clean_metadata(chunks[i][1]), 'text': chunks[i][0]},
+                        'namespace': namespace,
+                    })
+                    for i in kept_ids
+                ]
+                for future in futures:
+                    future.result()
+        return len(added_ids), len(removed_ids), len(kept_ids)
+
+    def metadata(self, document_id, ids):
+        namespace = self.namespace(document_id)
+        found = {}
+        for n in range(0, len(ids), 100):
+            page = self._request('GET', '/vectors/fetch', params={'ids': ids[n:n + 100], 'namespace': namespace})
+            for i, vector in (page.get('vectors') or {}).items():
+                metadata = dict(vector.get('metadata') or {})
+                metadata.pop('text', None)
+                found[i] = metadata
+        return found
+
+    def remove(self, document_id, ids):
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='remove'):
+            self._delete_ids(self.namespace(document_id), list(ids))
+
+    def search(self, document_id, query_vector, k, retrieval_filter=None):
+        payload = {
+            'namespace': self.namespace(document_id),
+            'vector': [float(x) for x in query_vector],
+            'topK': k,
+            'includeMetadata': True,
+            'includeValues': False,
+        }
+        # Pinecone applies metadata filters inside the search itself
+        metadata_filter = retrieval_filter.pinecone_filter() if retrieval_filter is not None else None
+        if metadata_filter:
+            payload['filter'] = metadata_filter
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='filtered_search' if metadata_filter else 'search'):
+            result = self._request('POST', '/query', payload)
+        docs = []
+        for match in result.get('matches', []):
+            metadata = dict(match.get('metadata') or {})
+            text = metadata.pop('text', '')
+            docs.append(LCDocument(page_content=text, metadata=metadata, id=match.get('id')))
+        return docs
+
+    def search_many(self, document_id, query_vectors, k, retrieval_filter=None):
+        """One query per vector (the API has no batch query), sent in parallel on the upsert pool."""
+        return list(self._get_upsert_pool().map(
+            lambda vector: self.search(document_id, vector, k, retrieval_filter), query_vectors
+        ))
+
+    def prefetch(self, document_id):
+        # Nothing is loaded locally for a remote index
+        return False
+
+    def delete(self, document_id):
+        with VECTOR_STORE_SECONDS.time(backend=self.name, op='delete'):
+            self._delete_namespace(self.namespace(document_id))
+
+    def count(self, document_id):
+        stats = self._request('POST', '/describe_index_stats', {})
+        namespace = (stats.get('namespaces') or {}).get(self.namespace(document_id))
+        return namespace.get('vectorCount', 0) if namespace else 0
+
+
+def create_store(settings, embeddings, artifacts=None):
+    """Build the backend named by settings['VECTOR_STORE_BACKEND'] ('faiss' or 'pinecone').
+    artifacts: a shared artifact store; local FAISS indexes are then published to it."""
+    backend = settings.get('VECTOR_STORE_BACKEND', 'faiss')
+    if backend == 'faiss':
+        storage_path = settings.get('FAISS_STORAGE_PATH', FAISS_STORAGE_PATH)
+        shared = None
+        if artifacts is not None:
+            shared = SharedIndexes(
+                artifacts, storage_path,
+                max_bytes=settings.get('NODE_CACHE_MAX_BYTES', 2 * 1024 ** 3),
+                check_seconds=settings.get('SHARED_VERSION_CHECK_SECONDS', 5.0),
+                level=settings.get('ARTIFACT_COMPRESSION_LEVEL', 3),
+            )
+        return LocalFaissStore(storage_path, embeddings, shared)
+    if backend == 'pinecone':
+        return PineconeStore(
+            settings.get('PINECONE_INDEX_HOST'),
+            settings.get('PINECONE_API_KEY'),
+            batch_size=settings.get('PINECONE_UPSERT_BATCH_SIZE', 100),
+            upsert_workers=settings.get('PINECONE_UPSERT_WORKERS', 4),
+            max_retries=settings.get('PINECONE_MAX_RETRIES', 5),
+            timeout=settings.get('PINECONE_TIMEOUT_SECONDS', 30),
+        )
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {backend}")
+
+
+# Config keys create_store reads, so worker processes can rebuild the same backend
+STORE_SETTINGS = (
+    'VECTOR_STORE_BACKEND', 'FAISS_STORAGE_PATH', 'PINECONE_INDEX_HOST', 'PINECONE_API_KEY',
+    'PINECONE_UPSERT_BATCH_SIZE', 'PINECONE_UPSERT_WORKERS', 'PINECONE_MAX_RETRIES',
+    'PINECONE_TIMEOUT_SECONDS', 'SHARED_STORAGE_PATH', 'NODE_CACHE_MAX_BYTES',
+    'SHARED_VERSION_CHECK_SECONDS', 'ARTIFACT_COMPRESSION_LEVEL',
+)
@@ -0,0 +1,225 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+from app.services.metrics import Counter, Gauge, Histogram
+
+WRITE_BEHIND_ROWS = Counter(
+    'rag_write_behind_rows_total',
+    'Rows written by the write-behind queue, by kind (message, document) and outcome (ok, failed).',
+    ['kind', 'outcome']
+)
+WRITE_BEHIND_LAG_SECONDS = Histogram(
+    'rag_write_behind_lag_seconds',
+    'Time from queueing a write to committing it.'
+)
+WRITE_BEHIND_BATCH_SECONDS = Histogram(
+    'rag_write_behind_batch_seconds',
+    'Time spent committing one batch of queued writes.'
+)
+WRITE_BEHIND_PENDING = Gauge(
+    'rag_write_behind_pending',
+    'Writes queued or being committed by the write-behind queue.'
+)
+
+
+class WriteBehindQueue:
+    """Batches ChatMessage inserts and Document updates into grouped transactions.
+
+    Chat turns and ingest workers queue their writes and carry on; one writer
+    thread commits them in order, max_batch writes per transaction, at most
+    max_lag_seconds after the oldest was queued. With SQLite this turns many
+    small commits contending for the database lock into a few larger ones, and
+    takes the user message's commit off the path to the first streamed token.
+
+    Durability: writes are only in memory until committed, so the lag is bounded
+    and close() (registered with atexit) drains the queue on shutdown; a crash
+    loses at most the last max_lag_seconds. Producers block once max_pending
+    writes are waiting. A batch that fails is retried row by row, so one bad row
+    doesn't take its neighbours down with it. Writes for a conversation or
+    document deleted in the meantime are dropped.
+
+    Readers that need their own writes either call flush() (the chat page) or
+    merge pending_messages() (the history of the next turn).
+    """
+
+    def __init__(self, max_lag_seconds=0.25, max_batch=200, max_pending=5000, enabled=True):
+        self.max_lag_seconds = max_lag_seconds
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self._app = None
+        self._ops = []        # (queued_at, kind, payload), oldest first
+        self._inflight = []   # the batch being committed
+        self._queued = 0      # writes queued so far
+        self._written = 0     # writes committed (or given up on) so far
+        self._flush_target = 0
+        self._closed = False
+        self._writer = None
+        self._cond = threading.Condition()
+        WRITE_BEHIND_PENDING.set_function(lambda: len(self._ops) + len(self._inflight))
+
+    def init_app(self, app):
+        self.max_lag_seconds = app.config.get('WRITE_BEHIND_MAX_LAG_MS', self.max_lag_seconds * 1000) / 1000.0
+        self.max_batch = app.config.get('WRITE_BEHIND_MAX_BATCH', self.max_batch)
+        self.max_pending = app.config.get('WRITE_BEHIND_MAX_PENDING', self.max_pending)
+        self.enabled = app.config.get('WRITE_BEHIND', self.enabled)
+        self._app = app
+        atexit.register(self.close)
+
+    def add_message(self, conversation_id, role, content, sources=None):
+        """Queue a ChatMessage insert. created_at is taken now, so the conversation
+        keeps the order of the calls rather than of the commits. Returns the row's
+        values (as ChatMessage.to_dict, without an id yet)."""
+        values = {
+            'conversation_id': conversation_id,
+            'role': role,
+            'content': content,
+            'sources': sources,
+            'created_at': datetime.utcnow(),
+        }
+        self._submit('message', values)
+        return values
+
+    def update_document(self, document_id, summary=None, **fields):
+        """Queue an update of a Document's columns (status, chunk_count, ...).
+        summary: a summary_service.build_summary result, stored with set_summary.
+        Updates of the same document in one batch become a single UPDATE."""
+        self._submit('document', (document_id, summary, fields))
+
+    def pending_messages(self, conversation_id):
+        """Messages of a conversation queued but not committed yet, oldest first,
+        as ChatMessage.to_dict (id None)."""
+        with self._cond:
+            return [
+                dict(payload, id=None, created_at=payload['created_at'].isoformat())
+                for _, kind, payload in self._inflight + self._ops
+                if kind == 'message' and payload['conversation_id'] == conversation_id
+            ]
+
+    def flush(self, timeout=None):
+        """Commit everything queued so far now, rather than within max_lag_seconds.
+        Returns False if that didn't finish within timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._queued
+            if self._written >= target:
+                return True
+            self._flush_target = max(self._flush_target, target)
+            self._cond.notify_all()
+            while self._written < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Commit what is still queued and stop the writer. Later writes go straight
+        to the database."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join(timeout)
+
+    def _submit(self, kind, payload):
+        if not self.enabled or self._app is None:
+            self._write([(time.monotonic(), kind, payload)])
+            return
+        with self._cond:
+            # Back-pressure: a writer that can't keep up slows the producers down
+            while len(self._ops) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            if not self._closed:
+                self._ops.append((time.monotonic(), kind, payload))
+                self._queued += 1
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                    self._writer.start()
+                self._cond.notify_all()
+                return
+        self._write([(time.monotonic(), kind, payload)])
+
+    def _next_batch(self):
+        """Wait until a batch is due (full, max_lag_seconds old, flushed or closing)
+        and take it. None once closed and drained."""
+        with self._cond:
+            while True:
+                if self._ops:
+                    due = self._ops[0][0] + self.max_lag_seconds - time.monotonic()
+                    if (due <= 0 or len(self._ops) >= self.max_batch or self._closed
+                            or self._flush_target > self._written):
+                        batch = self._ops[:self.max_batch]
+                        del self._ops[:self.max_batch]
+                        self._inflight = batch
+                        self._cond.notify_all()  # room for blocked producers
+                        return batch
+                    self._cond.wait(due)
+                elif self._closed:
+                    self._writer = None
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        with self._app.app_context():
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f">>>> ERROR IN WRITE-BEHIND QUEUE: {str(e)}")
+                with self._cond:
+                    self._written += len(batch)
+                    self._inflight = []
+                    self._cond.notify_all()
+
+    def _write(self, batch):
+        from app.extensions import db
+        with WRITE_BEHIND_BATCH_SECONDS.time():
+            try:
+                for op in batch:
+                    self._apply(*op[1:])
+                db.session.commit()
+                failed = ()
+            except Exception as e:
+                db.session.rollback()
+                print(f">>>> ERROR IN WRITE-BEHIND BATCH OF {len(batch)}, RETRYING ROW BY ROW: {str(e)}")
+                failed = set()
+                for i, op in enumerate(batch):
+                    try:
+                        self._apply(*op[1:])
+                        db.session.commit()
+                    except Exception as row_error:
+                        db.session.rollback()
+                        print(f">>>> ERROR WRITING {op[1].upper()} (DROPPED): {str(row_error)}")
+                        failed.add(i)
+        now = time.monotonic()
+        for i, (queued_at, kind, _) in enumerate(batch):
+            WRITE_BEHIND_ROWS.inc(kind=kind, outcome='failed' if i in failed else 'ok')
+            WRITE_BEHIND_LAG_SECONDS.observe(now - queued_at)
+
+    @staticmethod
+    def _apply(kind, payload):
+        from app.extensions import db
+        if kind == 'message':
+            from app.models.conversation import Conversation, ChatMessage
+            if db.session.get(Conversation, payload['conversation_id']) is None:
+                return  # Deleted while its message was queued (a stream still finishing, say)
+            db.session.add(ChatMessage(**payload))
+            return
+        from app.models.document import Document
+        document_id, summary, fields = payload
+        doc = db.session.get(Document, document_id)
+        if doc is None:
+            return  # Deleted while its update was queued
+        for name, value in fields.items():
+            setattr(doc, name, value)
+        doc.set_summary(summary)
+
+
+write_behind = WriteBehindQueue()
@@ -79,13 +79,14 @@ document.addEventListener("DOMContentLoaded", function () {
             const botBubbleText = document.getElementById(`${botBubbleId}-text`);
             const botBubbleSources = document.getElementById(`${botBubbleId}-sources`);
 
-            // 3. fetch the stream
+            // 3. fetch the stream, resuming from the last event we saw if the connection drops
+            const state = { streamId: null, lastEventId: 0, finished: false };
+            const streamUrl = chatForm.getAttribute('data-stream-url');
             try {
-                const streamUrl = chatForm.getAttribute('data-stream-url');
                 const formData = new FormData(chatForm);
                 formData.set('content', contentInfo); // enforce the trimmed content
 
-                const response = await fetch(streamUrl, {
+                let response = await fetch(streamUrl, {
                     method: 'POST',
                     body: formData,
                     headers: {
@@ -93,50 +94,30 @@ document.addEventListener("DOMContentLoaded", function () {
                     }
                 });
 
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status}`);
-                }
-
-                const reader = response.body.getReader();
-                const decoder = new TextDecoder('utf-8');
-                let done = false;
-                let buffer = "";
-
-                while (!done) {
-                    const { value, done: readerDone } = await reader.read();
-                    done = readerDone;
-
-                    if (value) {
-                        buffer += decoder.decode(value, { stream: true });
-                        const lines = buffer.split('\n\n');
-
-                        // Keep the last part in buffer if it doesn't end with \n\n
-                        buffer = lines.pop();
-
-                        for (const line of lines) {
-                            if (line.startsWith('data: ')) {
-                                const dataStr = line.substring(6);
-                                try {
-                                    const data = JSON.parse(dataStr);
-
-                                    if (data.error) {
-                                        botBubbleText.innerHTML = `<span class="text-danger">Error: ${data.error}</span>`;
-                                    } else if (data.chunk) {
-                                        // Append chunk, replace newlines with <br>
-                                        const cleanChunk = data.chunk.replace(/\n/g, '<br>');
-                                        botBubbleText.innerHTML += cleanChunk;
-                                        scrollToBottom();
-                                    } else if (data.sources && data.done) {
-                                        if (data.sources.length > 0) {
-                                            botBubbleSources.innerHTML = `Sources: ${data.sources.join(', ')}`;
-                                            botBubbleSources.parentElement.classList.remove('d-none');
-                                        }
-                                    }
-                                } catch (e) {
-                                    console.error("Error parsing stream JSON", e, dataStr);
+                let attempts = 0;
+                while (true) {
+                    try {
+                        if (response === null) {
+                            response = await fetch(`${streamUrl}/${state.streamId}`, {
+                                headers: {
+                                    'Accept': 'text/event-stream',
+                                    'Last-Event-ID': String(state.lastEventId),
                                 }
-                            }
+                            });
+                        }
+                        if (!response.ok) {
+                            throw new Error(`HTTP error! status: ${response.status}`);
                         }
+                        await readEventStream(response, state, botBubbleText, botBubbleSources);
+                        if (state.finished || !state.streamId) break;
+                        throw new Error("Stream closed before completion");
+                    } catch (streamError) {
+                        // Only retry once the server has told us which generation to follow
+                        if (!state.streamId || state.finished || attempts >= 3) throw streamError;
+                        attempts += 1;
+                        response = null;
+                        console.warn("Stream interrupted, resuming:", streamError);
+                        await new Promise(resolve => setTimeout(resolve, 500 * attempts));
                     }
                 }
             } catch (error) {
@@ -151,6 +132,177 @@ document.addEventListener("DOMContentLoaded", function () {
         });
     }
 
+    // 5. Incremental loading of older messages and conversations (keyset-paginated JSON API)
+    if (chatWindow && chatWindow.dataset.apiUrl) {
+        let loadingMessages = false;
+        chatWindow.addEventListener('scroll', async function () {
+            const cursor = chatWindow.dataset.nextCursor;
+            if (loadingMessages || !cursor || chatWindow.scrollTop > 50) return;
+            loadingMessages = true;
+            try {
+                const page = await fetchPage(chatWindow.dataset.apiUrl, cursor);
+                const previousHeight = chatWindow.scrollHeight;
+                // Items arrive newest-first; prepending each in turn leaves them oldest-first
+                for (const msg of page.items) {
+                    chatWindow.insertBefore(buildMessageBubble(msg), chatWindow.firstChild);
+                }
+                // Keep the message the user was looking at in place
+                chatWindow.scrollTop += chatWindow.scrollHeight - previousHeight;
+                chatWindow.dataset.nextCursor = page.next_cursor || '';
+            } catch (error) {
+                console.error("Failed to load older messages:", error);
+            } finally {
+                loadingMessages = false;
+            }
+        });
+    }
+
+    const conversationList = document.getElementById('conversationList');
+    const loadMoreConversations = document.getElementById('loadMoreConversations');
+    if (conversationList && loadMoreConversations) {
+        loadMoreConversations.addEventListener('click', async function () {
+            const cursor = conversationList.dataset.nextCursor;
+            if (!cursor) return;
+            loadMoreConversations.disabled = true;
+            try {
+                const page = await fetchPage(conversationList.dataset.apiUrl, cursor);
+                for (const conv of page.items) {
+                    conversationList.appendChild(buildConversationItem(conv));
+                }
+                conversationList.dataset.nextCursor = page.next_cursor || '';
+                if (!page.next_cursor) loadMoreConversations.remove();
+            } catch (error) {
+                console.error("Failed to load older conversations:", error);
+            } finally {
+                loadMoreConversations.disabled = false;
+            }
+        });
+    }
+
+    async function fetchPage(apiUrl, cursor) {
+        const url = `${apiUrl}?before=${encodeURIComponent(cursor)}`;
+        const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+    }
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function formatTimestamp(iso) {
+        // Matches the server-side strftime('%m/%d %H:%M') of the naive UTC timestamp
+        if (!iso) return '';
+        return `${iso.substring(5, 7)}/${iso.substring(8, 10)} ${iso.substring(11, 16)}`;
+    }
+
+    function buildMessageBubble(msg) {
+        const div = document.createElement('div');
+        if (msg.role === 'user') {
+            div.className = 'message-bubble message-user shadow-sm';
+            div.textContent = msg.content;
+            return div;
+        }
+        div.className = 'message-bubble message-bot shadow-sm';
+        let html = `<div>${escapeHtml(msg.content).replace(/\n/g, '<br>')}</div>`;
+        if (msg.sources && msg.sources.length > 0) {
+            html += `<div class="mt-2 pt-2 border-top small text-muted fst-italic">
+                Sources: ${escapeHtml(msg.sources.join(', '))}
+            </div>`;
+        }
+        div.innerHTML = html;
+        return div;
+    }
+
+    function buildConversationItem(conv) {
+        const csrfInput = document.querySelector('input[name="csrf_token"]');
+        const csrfToken = csrfInput ? csrfInput.value : '';
+        const activeId = conversationList.dataset.activeId;
+
+        const div = document.createElement('div');
+        div.className = 'list-group-item list-group-item-action d-flex justify-content-between align-items-center';
+        div.innerHTML = `
+            <a href="${conv.url}" class="text-decoration-none text-dark flex-grow-1 text-truncate">
+                <h6 class="mb-1">${escapeHtml(conv.title || '')}</h6>
+                <small class="text-muted">${formatTimestamp(conv.created_at)}</small>
+            </a>
+            <form method="POST" action="${conv.delete_url}" onsubmit="return confirm('Delete this chat?');">
+                <input type="hidden" name="csrf_token" value="${csrfToken}" />
+                <input type="hidden" name="active_conversation_id" value="${activeId}" />
+                <button type="submit" class="btn btn-sm btn-outline-danger border-0">
+                    <i class="bi bi-trash"></i>
+                </button>
+            </form>
+        `;
+        return div;
+    }
+
+    async function readEventStream(response, state, botBubbleText, botBubbleSources) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let done = false;
+        let buffer = "";
+
+        while (!done) {
+            const { value, done: readerDone } = await reader.read();
+            done = readerDone;
+
+            if (value) {
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+
+                // Keep the last part in buffer if it doesn't end with \n\n
+                buffer = events.pop();
+
+                for (const event of events) {
+                    let dataStr = null;
+                    for (const line of event.split('\n')) {
+                        if (line.startsWith('id: ')) {
+                            state.lastEventId = parseInt(line.substring(4), 10);
+                        } else if (line.startsWith('data: ')) {
+                            dataStr = line.substring(6);
+                        }
+                    }
+                    if (dataStr === null) continue;
+
+                    try {
+                        const data = JSON.parse(dataStr);
+
+                        if (data.stream_id) {
+                            state.streamId = data.stream_id;
+                        }
+                        if (data.error) {
+                            state.finished = true;
+                            botBubbleText.innerHTML = `<span class="text-danger">Error: ${data.error}</span>`;
+                        } else if (data.snapshot !== undefined) {
+                            // We missed more events than the server buffers; it sent the answer so far
+                            botBubbleText.innerHTML = data.snapshot.replace(/\n/g, '<br>');
+                            scrollToBottom();
+                        } else if (data.chunk) {
+                            // Append chunk, replace newlines with <br>
+                            const cleanChunk = data.chunk.replace(/\n/g, '<br>');
+                            botBubbleText.innerHTML += cleanChunk;
+                            scrollToBottom();
+                        }
+                        if (data.sources && data.done) {
+                            state.finished = true;
+                            if (data.sources.length > 0) {
+                                botBubbleSources.innerHTML = `Sources: ${data.sources.join(', ')}`;
+                                botBubbleSources.parentElement.classList.remove('d-none');
+                            }
+                        }
+                    } catch (e) {
+                        console.error("Error parsing stream JSON", e, dataStr);
+                    }
+                }
+            }
+        }
+    }
+
     function appendUserMessage(text) {
         if (!chatWindow) return;
 
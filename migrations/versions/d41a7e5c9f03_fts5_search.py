@@ -0,0 +1,60 @@
+"""fts5 search tables
+
+Revision ID: d41a7e5c9f03
+Revises: 8c4d1f0e6b27
+Create Date: 2026-10-19 11:48:05.112930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a7e5c9f03'
+down_revision = '8c4d1f0e6b27'
+branch_labels = None
+depends_on = None
+
+# Kept in step with app.services.search_service.FTS_TABLES
+FTS_TABLES = [
+    ('chat_messages', 'content'),
+    ('conversations', 'title'),
+    ('documents', 'original_filename'),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, column in FTS_TABLES:
+        fts = f"{table}_fts"
+        op.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{column}, content='{table}', content_rowid='id', tokenize='porter unicode61')"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+            f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END"
+        )
+        # Backfill rows that existed before the triggers
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, _ in FTS_TABLES:
+        fts = f"{table}_fts"
+        op.execute(f"DROP TRIGGER IF EXISTS {fts}_au")
+        op.execute(f"DROP TRIGGER IF EXISTS {fts}_ad")
+        op.execute(f"DROP TRIGGER IF EXISTS {fts}_ai")
+        op.execute(f"DROP TABLE IF EXISTS {fts}")
@@ -0,0 +1,110 @@
+"""Compare page-filtered retrieval strategies on one large document index.
+
+    python scripts/bench_filtered_search.py
+    python scripts/bench_filtered_search.py --pages 600 --chunks-per-page 8 --first 10 --last 20
+
+A synthetic index (one vector per chunk, chunks in page order as ingest adds
+them) is searched for the top --k chunks within a page range:
+  unfiltered   the original search over every chunk, ignoring the range
+  post-filter  search --overfetch x k over every chunk, then drop other pages
+               (may come back short when the range is a small share of the book)
+  range        FilterIndex selector on the index as ingested: an IDSelectorRange
+  bitmap       the same range with chunk positions shuffled (as after in-place
+               re-ingests): an IDSelectorBitmap
+
+Recall is the share of the exact in-range top-k each strategy returns.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+from app.services.retrieval_filter import RetrievalFilter
+from app.services.vector_store import FilterIndex
+
+
+def timed(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--pages', type=int, default=600, help='Pages in the document')
+    parser.add_argument('--chunks-per-page', type=int, default=6)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--first', type=int, default=10, help='First page of the range (1-based)')
+    parser.add_argument('--last', type=int, default=20, help='Last page of the range')
+    parser.add_argument('--k', type=int, default=20)
+    parser.add_argument('--overfetch', type=int, default=10, help='Post-filter fetches k times this')
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    n = args.pages * args.chunks_per_page
+    vectors = rng.standard_normal((n, args.dimension)).astype(np.float32)
+    pages = np.repeat(np.arange(args.pages, dtype=np.int32), args.chunks_per_page)
+    queries = rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+    retrieval_filter = RetrievalFilter(pages=(args.first, args.last))
+    low, high = retrieval_filter.page_bounds
+
+    index = faiss.IndexFlatL2(args.dimension)
+    index.add(vectors)
+    filters = FilterIndex(pages)
+
+    # Shuffled copy: same chunks, positions no longer in page order
+    order = rng.permutation(n)
+    shuffled = faiss.IndexFlatL2(args.dimension)
+    shuffled.add(vectors[order])
+    shuffled_filters = FilterIndex(pages[order])
+
+    # Exact in-range answer, by brute force over the in-range chunks only
+    in_range = np.flatnonzero((pages >= low) & (pages <= high))
+    distances = ((vectors[in_range][None, :, :] - queries[:, None, :]) ** 2).sum(axis=2)
+    truth = [set(in_range[np.argsort(row)[:args.k]]) for row in distances]
+
+    def unfiltered():
+        return index.search(queries, args.k)[1]
+
+    def post_filter():
+        _, positions = index.search(queries, args.k * args.overfetch)
+        return [[p for p in row if p >= 0 and low <= pages[p] <= high][:args.k] for row in positions]
+
+    def pushed_down(idx, filter_index):
+        def run():
+            selector, selected, _bitmap = filter_index.selector(retrieval_filter)
+            params = faiss.SearchParameters(sel=selector)
+            return idx.search(queries, min(args.k, selected), params=params)[1]
+        return run
+
+    strategies = [
+        ('unfiltered', unfiltered, None),
+        ('post-filter', post_filter, None),
+        ('range', pushed_down(index, filters), None),
+        ('bitmap', pushed_down(shuffled, shuffled_filters), order),
+    ]
+    print(f"{n} chunks over {args.pages} pages, pages {args.first}-{args.last} "
+          f"({len(in_range)} chunks, {len(in_range) / n:.1%}), k={args.k}, {args.queries} queries\n")
+    print(f"{'strategy':12} {'ms/query':>9} {'recall':>7} {'avg hits':>9}")
+    for name, fn, mapping in strategies:
+        seconds, results = timed(fn, 5)
+        recall = hits = 0
+        for expected, row in zip(truth, results):
+            found = [int(p) for p in row if p >= 0]
+            if mapping is not None:
+                found = [int(mapping[p]) for p in found]
+            hits += len(found)
+            recall += len(expected & set(found)) / len(expected)
+        print(f"{name:12} {seconds / args.queries * 1000:9.3f} {recall / args.queries:7.2f} "
+              f"{hits / args.queries:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
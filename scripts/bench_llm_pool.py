@@ -0,0 +1,84 @@
+"""Show that pooled Gemini clients reuse their connections.
+
+    python scripts/bench_llm_pool.py
+    python scripts/bench_llm_pool.py --users 4 --turns 50 --handshake-ms 40
+
+Runs the real ChatGoogleGenerativeAI against scripts/gemini_standin.py (started
+in-process) for --turns chat turns spread over --users API keys, twice:
+  fresh   a new client per turn, as before the pool
+  pooled  app.services.llm_pool.LLMClientPool, one client per key
+and reports the TCP connections the stand-in saw, the time per turn, and
+rag_llm_client_setup_seconds (the first call of each new client). --handshake-ms
+delays each new connection, standing in for the TCP and TLS setup of the real
+endpoint. Exits 1 if the pooled run opened more connections than there are keys.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gemini_standin import serve
+from app.services.llm_pool import LLMClientPool, LLM_CLIENT_SETUP_SECONDS, _default_factory, _first_call_timer
+
+
+def run(get_client, keys, turns, stats):
+    before = stats.snapshot()
+    setup_count, setup_sum = LLM_CLIENT_SETUP_SECONDS.snapshot()
+    started = time.perf_counter()
+    for turn in range(turns):
+        client = get_client(keys[turn % len(keys)])
+        # Alternate like the chat routes do: /message invokes, /stream streams
+        if turn % 2:
+            ''.join(chunk.content for chunk in client.stream(f"Question {turn}"))
+        else:
+            client.invoke(f"Question {turn}")
+    seconds = time.perf_counter() - started
+    after = stats.snapshot()
+    count, total = LLM_CLIENT_SETUP_SECONDS.snapshot()
+    setups = count - setup_count
+    return {
+        'connections': after['connections'] - before['connections'],
+        'ms_per_turn': seconds / turns * 1000,
+        'setups': setups,
+        'setup_ms': (total - setup_sum) / setups * 1000 if setups else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=4, help='Distinct API keys')
+    parser.add_argument('--turns', type=int, default=40)
+    parser.add_argument('--handshake-ms', type=float, default=30.0)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=5095)
+    args = parser.parse_args()
+
+    server, stats = serve(port=args.port, handshake_ms=args.handshake_ms, latency_ms=args.latency_ms)
+    base_url = f"http://127.0.0.1:{args.port}"
+    keys = [f"stand-in-key-{n}" for n in range(args.users)]
+    pool = LLMClientPool(base_url=base_url)
+
+    print(f"{args.turns} turns over {args.users} keys, handshake {args.handshake_ms:.0f} ms, "
+          f"answer latency {args.latency_ms:.0f} ms\n")
+    print(f"{'clients':8} {'connections':>12} {'ms/turn':>9} {'setups':>7} {'setup ms':>9}")
+    results = {}
+    for name, get_client in (
+        ('fresh', lambda key: _first_call_timer(_default_factory(key, base_url))),
+        ('pooled', pool.get),
+    ):
+        results[name] = result = run(get_client, keys, args.turns, stats)
+        print(f"{name:8} {result['connections']:12d} {result['ms_per_turn']:9.1f} "
+              f"{result['setups']:7d} {result['setup_ms']:9.1f}")
+    server.shutdown()
+
+    if results['pooled']['connections'] > args.users:
+        print(f"\nPooled clients opened {results['pooled']['connections']} connections for {args.users} keys")
+        raise SystemExit(1)
+    print(f"\nPooled clients kept one connection per key ({results['pooled']['connections']} in all).")
+
+
+if __name__ == '__main__':
+    main()
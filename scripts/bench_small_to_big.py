@@ -0,0 +1,200 @@
+"""Compare flat chunk retrieval with small-to-big (parent/child) retrieval.
+
+    python scripts/bench_small_to_big.py
+    python scripts/bench_small_to_big.py --documents 3 --pages 60 --encoder hash
+    python scripts/bench_small_to_big.py --splitter recursive
+
+A synthetic corpus (pages of filler text) is planted with facts whose question
+matches one sentence ("Zorvant coverage applies to the northern region.") while
+the answer is a sentence or two further on that doesn't repeat the name ("The
+limit is 4113 units per claim.") - the way manuals, contracts and policies
+usually read. Every document is searched for its top --k chunks per question,
+as rag_service does, and the prompt context is built by:
+  flat          no sections (PARENT_CHUNK_TOKENS = 0): 128-token chunks, the first 40 hits
+  small-to-big  128-token chunks cut from --parent-tokens sections, expanded to
+                their sections with parent_sections.expand under --budget-chars
+  small-to-big-N  the same with --small-chunk-tokens (N) chunks
+
+Recall is the share of questions whose answer sentence reaches the context;
+retrieval is searching every document plus building the context (for
+small-to-big, including the section lookup in SQLite). --splitter picks the
+ingest splitter as TEXT_SPLITTER does: token (the default) or recursive, whose
+chunks and sections are sized at four characters a token. --encoder minilm embeds
+with sentence-transformers; hash is a bag-of-words stand-in with no downloads.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+from sqlalchemy import create_engine
+from langchain_core.documents import Document as LCDocument
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app import models  # Registers every table the sections' foreign keys refer to
+from app.models.chunk import ParentSection
+from app.services import parent_sections
+from app.services.text_splitter import LinearTokenSplitter, load_token_offsets, load_word_tokens, split_parent_child
+
+FILLER = [
+    'the', 'policy', 'applies', 'to', 'all', 'employees', 'and', 'contractors', 'who',
+    'access', 'customer', 'data', 'systems', 'must', 'be', 'reviewed', 'quarterly',
+    'by', 'security', 'team', 'exceptions', 'require', 'written', 'approval', 'from',
+    'department', 'head', 'retention', 'period', 'is', 'seven', 'years', 'unless',
+]
+REGIONS = ['northern', 'southern', 'eastern', 'western', 'central', 'coastal', 'alpine', 'island']
+
+
+def _name(rng):
+    return ''.join(rng.choice('bcdfgklmnprstvz') + rng.choice('aeiou') for _ in range(4)).capitalize()
+
+
+def _paragraph(rng):
+    lines = []
+    for _ in range(rng.randint(1, 3)):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(8, 30))]
+        lines.append(' '.join(words).capitalize() + '.')
+    return '\n'.join(lines)
+
+
+def synthetic_corpus(documents, pages, fact_rate, seed=7):
+    """Returns ({document_id: [page LCDocument, ...]}, [(document_id, question, answer), ...])."""
+    rng = random.Random(seed)
+    corpus = {}
+    facts = []
+    used = set()
+    for doc_id in range(1, documents + 1):
+        corpus[doc_id] = []
+        for page in range(pages):
+            paragraphs = [_paragraph(rng) for _ in range(rng.randint(8, 14))]
+            if rng.random() < fact_rate:
+                name, region = _name(rng), rng.choice(REGIONS)
+                limit = rng.randint(1000, 9999)
+                while limit in used:
+                    limit = rng.randint(1000, 9999)
+                used.add(limit)
+                at = rng.randint(0, len(paragraphs) - 3)
+                answer = f"The limit is {limit} units per claim."
+                paragraphs[at] = f"{name} coverage applies to the {region} region.\n" + paragraphs[at]
+                paragraphs[at + rng.randint(1, 2)] += "\n" + answer
+                facts.append((doc_id, f"What is the {name} coverage limit in the {region} region?", answer))
+            corpus[doc_id].append(LCDocument(
+                page_content='\n\n'.join(paragraphs),
+                metadata={'source': f"doc{doc_id}.pdf", 'page': page, 'document_id': str(doc_id)}
+            ))
+    return corpus, facts
+
+
+def hash_encoder(dimension=512):
+    def encode(texts):
+        matrix = np.zeros((len(texts), dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().replace('.', ' ').replace('?', ' ').split():
+                if len(word) > 3:  # A crude stop word list
+                    matrix[row, zlib.crc32(word.encode('utf-8')) % dimension] += 1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-9)
+    return encode
+
+
+def minilm_encoder():
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+    return lambda texts: model.encode(texts, normalize_embeddings=True, batch_size=64).astype(np.float32)
+
+
+def splitter(kind, chunk_tokens, overlap_tokens):
+    if kind == 'recursive':
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens * 4, chunk_overlap=overlap_tokens * 4, add_start_index=True
+        )
+    return LinearTokenSplitter(load_word_tokens(), chunk_tokens, overlap_tokens)
+
+
+def build(corpus, encode, kind, chunk_tokens, overlap_tokens, parent_tokens):
+    """{document_id: (faiss index, chunks)}, storing parent sections when parent_tokens."""
+    child = splitter(kind, chunk_tokens, overlap_tokens)
+    indexes = {}
+    for doc_id, pages in corpus.items():
+        parents = []
+        if parent_tokens:
+            parents, chunks = split_parent_child(pages, splitter(kind, parent_tokens, 0), child)
+            for n, parent in enumerate(parents):
+                parent.metadata['parent_id'] = f"{doc_id}-{n}"
+            for chunk in chunks:
+                chunk.metadata['parent_id'] = parents[chunk.metadata.pop('parent_index')].metadata['parent_id']
+        else:
+            chunks = child.split_documents(pages)
+        parent_sections.replace(doc_id, 'bench', parents)
+        vectors = encode([c.page_content for c in chunks])
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        indexes[doc_id] = (index, chunks)
+    return indexes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--documents', type=int, default=3)
+    parser.add_argument('--pages', type=int, default=60, help='Pages per document')
+    parser.add_argument('--fact-rate', type=float, default=0.4, help='Share of pages with a planted fact')
+    parser.add_argument('--chunk-tokens', type=int, default=128)
+    parser.add_argument('--small-chunk-tokens', type=int, default=64)
+    parser.add_argument('--overlap-tokens', type=int, default=12)
+    parser.add_argument('--parent-tokens', type=int, default=512)
+    parser.add_argument('--budget-chars', type=int, default=12000)
+    parser.add_argument('--k', type=int, default=20, help='Chunks retrieved per document')
+    parser.add_argument('--encoder', choices=['minilm', 'hash'], default='minilm')
+    parser.add_argument('--splitter', choices=['token', 'recursive'], default='token')
+    args = parser.parse_args()
+
+    corpus, facts = synthetic_corpus(args.documents, args.pages, args.fact_rate)
+    encode = minilm_encoder() if args.encoder == 'minilm' else hash_encoder()
+    token_offsets = load_token_offsets()
+    questions = encode([question for _, question, _ in facts])
+
+    # Sections live in SQLite, as in the app; a scratch database keeps the bench self-contained
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    ParentSection.__table__.create(create_engine(url))
+    parent_sections.configure({'DEDUP_DATABASE_URL': url})
+    model_keys = {doc_id: 'bench' for doc_id in corpus}
+
+    strategies = [
+        ('flat', args.chunk_tokens, 0),
+        ('small-to-big', args.chunk_tokens, args.parent_tokens),
+        (f"small-to-big-{args.small_chunk_tokens}", args.small_chunk_tokens, args.parent_tokens),
+    ]
+    print(f"{args.documents} documents x {args.pages} pages, {len(facts)} questions, k={args.k}, "
+          f"encoder={args.encoder}, splitter={args.splitter}\n")
+    print(f"{'strategy':18} {'chunks':>7} {'ms/query':>9} {'blocks':>7} {'ctx tokens':>11} {'recall':>7}")
+    for name, chunk_tokens, parent_tokens in strategies:
+        indexes = build(corpus, encode, args.splitter, chunk_tokens, args.overlap_tokens, parent_tokens)
+        seconds = blocks = tokens = found = 0
+        for vector, (_, _, answer) in zip(questions, facts):
+            started = time.perf_counter()
+            hits = []
+            for doc_id, (index, chunks) in indexes.items():
+                _, positions = index.search(vector[None, :], args.k)
+                hits.extend(chunks[p] for p in positions[0] if p >= 0)
+            if parent_tokens:
+                context = parent_sections.expand(hits, model_keys, args.budget_chars)
+            else:
+                context = hits[:40]
+            seconds += time.perf_counter() - started
+            text = "\n\n".join(doc.page_content for doc in context)
+            blocks += len(context)
+            tokens += len(token_offsets(text))
+            found += answer in text
+        n = max(len(facts), 1)
+        print(f"{name:18} {sum(len(c) for _, c in indexes.values()):7d} {seconds / n * 1000:9.2f} "
+              f"{blocks / n:7.1f} {tokens / n:11.0f} {found / n:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Compare ingest splitters on throughput and chunk boundaries.
+
+    python scripts/bench_splitter.py                  # synthetic ~5 MB corpus
+    python scripts/bench_splitter.py docs/*.pdf notes.txt --chunk-tokens 128
+
+Splitters:
+  recursive-chars   the original RecursiveCharacterTextSplitter(500, 50)
+  recursive-tokens  RecursiveCharacterTextSplitter measuring the same model tokens
+  linear-tokens     app.services.text_splitter.LinearTokenSplitter, first with an
+                    empty word cache (every distinct word goes through the
+                    tokenizer), then again with the cache it filled
+
+Boundary agreement compares where linear-tokens and recursive-tokens end their
+chunks (same size unit, same separators), as the share of chunk end offsets
+they have in common.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.services.text_splitter import LinearTokenSplitter, WordTokens, load_token_offsets, load_word_tokens
+
+
+def load_texts(paths):
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+    loaders = {'pdf': PyPDFLoader, 'txt': TextLoader, 'docx': Docx2txtLoader}
+    texts = []
+    for path in paths:
+        loader = loaders[path.rsplit('.', 1)[-1].lower()](path)
+        texts.extend(doc.page_content for doc in loader.load())
+    return texts
+
+
+def synthetic_texts(megabytes, seed=7):
+    rng = random.Random(seed)
+    vocabulary = [
+        'the', 'policy', 'applies', 'to', 'all', 'employees', 'and', 'contractors', 'who',
+        'access', 'customer', 'data', 'systems', 'must', 'be', 'reviewed', 'quarterly',
+        'by', 'security', 'team', 'exceptions', 'require', 'written', 'approval', 'from',
+        'department', 'head', 'retention', 'period', 'is', 'seven', 'years', 'unless',
+    ]
+    texts = []
+    size = 0
+    while size < megabytes * 1_000_000:
+        paragraphs = []
+        for _ in range(rng.randint(3, 12)):
+            lines = []
+            for _ in range(rng.randint(1, 5)):
+                words = [rng.choice(vocabulary) for _ in range(rng.randint(5, 60))]
+                lines.append(' '.join(words).capitalize() + '.')
+            paragraphs.append('\n'.join(lines))
+        text = '\n\n'.join(paragraphs)
+        texts.append(text)
+        size += len(text)
+    return texts
+
+
+def run(name, split, texts, token_offsets):
+    started = time.perf_counter()
+    spans = [split(text) for text in texts]
+    seconds = time.perf_counter() - started
+    chunks = sum(len(s) for s in spans)
+    tokens = [len(token_offsets(text[a:b])) for text, page in zip(texts, spans) for a, b in page]
+    megabytes = sum(len(t) for t in texts) / 1e6
+    print(f"{name:17} {seconds:8.2f}s {megabytes / seconds:8.2f} MB/s {chunks:8d} chunks "
+          f"{sum(tokens) / max(chunks, 1):7.1f} avg tok {max(tokens, default=0):5d} max tok")
+    return spans
+
+
+def recursive_spans(splitter):
+    def split(text):
+        spans = []
+        for doc in splitter.create_documents([text]):
+            start = doc.metadata['start_index']
+            spans.append((start, start + len(doc.page_content)))
+        return spans
+    return split
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('files', nargs='*', help='PDF/TXT/DOCX files (default: synthetic text)')
+    parser.add_argument('--megabytes', type=float, default=5.0, help='Size of the synthetic corpus')
+    parser.add_argument('--chunk-tokens', type=int, default=128)
+    parser.add_argument('--overlap-tokens', type=int, default=12)
+    args = parser.parse_args()
+
+    texts = load_texts(args.files) if args.files else synthetic_texts(args.megabytes)
+    token_offsets = load_token_offsets()
+    print(f"{len(texts)} text(s), {sum(len(t) for t in texts) / 1e6:.1f} MB\n")
+
+    run('recursive-chars', recursive_spans(RecursiveCharacterTextSplitter(
+        chunk_size=500, chunk_overlap=50, add_start_index=True
+    )), texts, token_offsets)
+    recursive = run('recursive-tokens', recursive_spans(RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_tokens, chunk_overlap=args.overlap_tokens, add_start_index=True,
+        length_function=lambda t: len(token_offsets(t))
+    )), texts, token_offsets)
+    # A fresh cache on the app's tokenizer, so the first run pays for every distinct word
+    splitter = LinearTokenSplitter(
+        WordTokens(load_word_tokens().encode_offsets), args.chunk_tokens, args.overlap_tokens
+    )
+    split = lambda text: [(a, b) for a, b, _ in splitter.split_spans(text)]
+    linear = run('linear-tokens', split, texts, token_offsets)
+    run('  warm cache', split, texts, token_offsets)
+
+    shared = total = 0
+    for r, l in zip(recursive, linear):
+        r_ends = {b for _, b in r}
+        l_ends = {b for _, b in l}
+        shared += len(r_ends & l_ends)
+        total += len(r_ends | l_ends)
+    print(f"\nBoundary agreement (linear vs recursive-tokens): {100.0 * shared / max(total, 1):.1f}% of chunk ends")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Compare chat stream flush policies on events, writes and bytes per turn.
+
+    python scripts/bench_sse.py
+    python scripts/bench_sse.py --turns 20 --chars 4000 --chunk-ms 5 --flush-chars 128
+
+A synthetic answer is published in small fragments (like Gemini's streamed
+chunks) on a producer thread, while the response body is consumed as a client
+would. Policies:
+  per-chunk       the original behaviour: one event and one write per chunk
+  coalesced       STREAM_FLUSH_CHARS / STREAM_FLUSH_MS batching, one write per ready batch
+  coalesced+gzip  the same body sync-flushed through gzip
+  per-chunk+gzip  original event granularity through gzip, for reference
+
+First event is the delay from the producer's first chunk to the client's
+first chunk event.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.stream_buffer import GenerationStream, format_sse, sse_body
+
+
+def synthetic_chunks(chars, seed):
+    rng = random.Random(seed)
+    words = ['the', 'retention', 'policy', 'requires', 'that', 'records', 'are', 'kept',
+             'for', 'seven', 'years', 'unless', 'legal', 'approves', 'an', 'exception', '.', '\n']
+    text = ""
+    while len(text) < chars:
+        text += rng.choice(words) + ' '
+    chunks = []
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, 12)
+        chunks.append(text[i:i + n])
+        i += n
+    return chunks
+
+
+def original_body(stream):
+    # What chat._sse_response did before coalescing: a write per event
+    for event_id, data in stream.follow(0):
+        yield format_sse(event_id, data).encode('utf-8')
+
+
+def gzip_per_event_body(stream):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in original_body(stream):
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def run_turn(chunks, chunk_seconds, flush_chars, flush_seconds, body, gzip, rng):
+    stream = GenerationStream('bench', 1, 1, max_events=100000,
+                              flush_chars=flush_chars, flush_seconds=flush_seconds)
+    stream.publish({'stream_id': stream.stream_id})
+    first_chunk_at = []
+
+    def produce():
+        for chunk in chunks:
+            if not first_chunk_at:
+                first_chunk_at.append(time.perf_counter())
+            stream.publish_chunk(chunk)
+            time.sleep(chunk_seconds * rng.uniform(0.5, 1.5))
+        stream.publish({'sources': ['bench.pdf'], 'done': True}, final=True)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    started = time.perf_counter()
+    producer.start()
+    writes = size = 0
+    first_event = None
+    answer = ""
+    decoder = zlib.decompressobj(31) if gzip else None
+    for data in body(stream):
+        writes += 1
+        size += len(data)
+        if decoder is not None:
+            data = decoder.decompress(data)
+        for line in data.decode('utf-8').split('\n'):
+            if line.startswith('data: '):
+                payload = json.loads(line[6:])
+                if 'chunk' in payload:
+                    if first_event is None:
+                        first_event = time.perf_counter()
+                    answer += payload['chunk']
+    elapsed = time.perf_counter() - started
+    producer.join()
+    assert answer == "".join(chunks), "client did not receive the full answer"
+    return {
+        'events': stream.next_id - 1,
+        'writes': writes,
+        'bytes': size,
+        'seconds': elapsed,
+        'first_event': first_event - first_chunk_at[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--turns', type=int, default=10)
+    parser.add_argument('--chars', type=int, default=2000, help='Answer length per turn')
+    parser.add_argument('--chunk-ms', type=float, default=5.0, help='Mean delay between upstream chunks')
+    parser.add_argument('--flush-chars', type=int, default=64)
+    parser.add_argument('--flush-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    flush_seconds = args.flush_ms / 1000.0
+    policies = [
+        ('per-chunk', 0, 0.0, original_body, False),
+        ('coalesced', args.flush_chars, flush_seconds, sse_body, False),
+        ('coalesced+gzip', args.flush_chars, flush_seconds, lambda s: sse_body(s, gzip=True), True),
+        ('per-chunk+gzip', 0, 0.0, gzip_per_event_body, True),
+    ]
+    chunks = synthetic_chunks(args.chars, seed=7)
+    print(f"{args.turns} turn(s), {len(chunks)} chunks / {args.chars} chars per turn, "
+          f"~{args.chunk_ms:g} ms between chunks\n")
+    print(f"{'policy':15} {'events/turn':>11} {'writes/turn':>11} {'bytes/turn':>10} "
+          f"{'events/s':>9} {'first event':>11}")
+    for name, flush_chars, flush_seconds, body, gzip in policies:
+        rng = random.Random(11)
+        results = [run_turn(chunks, args.chunk_ms / 1000.0, flush_chars, flush_seconds, body, gzip, rng)
+                   for _ in range(args.turns)]
+        events = sum(r['events'] for r in results) / args.turns
+        writes = sum(r['writes'] for r in results) / args.turns
+        size = sum(r['bytes'] for r in results) / args.turns
+        rate = sum(r['events'] for r in results) / sum(r['seconds'] for r in results)
+        first = sum(r['first_event'] for r in results) / args.turns
+        print(f"{name:15} {events:11.1f} {writes:11.1f} {size:10.0f} {rate:9.1f} {first * 1000:9.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,12 @@
 from pinecone import Pinecone, ServerlessSpec
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import embedding_models
+
 load_dotenv()
 
 def create_index():
@@ -12,18 +17,23 @@ def create_index():
         print("Please set PINECONE_API_KEY and PINECONE_INDEX_NAME in .env")
         return
 
+    # Every document namespace lives in this index, so it only takes models of one dimension
+    model = embedding_models.get(os.environ.get("EMBEDDING_MODEL", embedding_models.EMBEDDING_MODEL))
     pc = Pinecone(api_key=api_key)
 
     if index_name not in [i.name for i in pc.list_indexes()]:
         pc.create_index(
             name=index_name,
-            dimension=3072,
+            dimension=model.dimension,
             metric="cosine",
             spec=ServerlessSpec(cloud="aws", region="us-east-1")
         )
-        print(f"Index '{index_name}' created.")
+        print(f"Index '{index_name}' created for {model.key} ({model.dimension} dimensions).")
     else:
-        print(f"Index '{index_name}' already exists.")
+        print(f"Index '{index_name}' already exists ({pc.describe_index(index_name).dimension} dimensions).")
+
+    # PineconeStore talks to the index host directly
+    print(f"Set PINECONE_INDEX_HOST={pc.describe_index(index_name).host}")
 
 if __name__ == "__main__":
     create_index()
@@ -0,0 +1,131 @@
+"""Local stand-in for the Gemini generateContent REST API.
+
+Answers generateContent and streamGenerateContent (SSE) with a canned reply,
+so the chat path and the pooled clients (app.services.llm_pool) can be
+exercised offline, and counts the TCP connections clients open:
+
+    python scripts/gemini_standin.py --port 5082
+    GEMINI_BASE_URL=http://127.0.0.1:5082 flask run
+    curl http://127.0.0.1:5082/stats          # {"connections": ..., "requests": ...}
+
+--handshake-ms delays every new connection, standing in for the TCP and TLS
+setup a pooled client saves; --latency-ms delays every answer.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class Stats:
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        with self.lock:
+            return {'connections': self.connections, 'requests': self.requests}
+
+
+def _reply(model, text, final=True):
+    chunk = {
+        'candidates': [{
+            'content': {'parts': [{'text': text}], 'role': 'model'},
+            'index': 0,
+        }],
+        'modelVersion': model,
+    }
+    if final:
+        chunk['candidates'][0]['finishReason'] = 'STOP'
+        chunk['usageMetadata'] = {'promptTokenCount': 1, 'candidatesTokenCount': 1, 'totalTokenCount': 2}
+    return chunk
+
+
+def make_handler(stats, reply, handshake_ms, latency_ms):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real service
+
+        def log_message(self, format, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            with stats.lock:
+                stats.connections += 1
+            if handshake_ms:
+                time.sleep(handshake_ms / 1000.0)
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if urlparse(self.path).path == '/stats':
+                return self._send(200, stats.snapshot())
+            self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+            path = urlparse(self.path).path
+            # /v1beta/models/<model>:generateContent or :streamGenerateContent
+            model, _, method = path.rsplit('/', 1)[-1].partition(':')
+            if method not in ('generateContent', 'streamGenerateContent'):
+                return self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+            with stats.lock:
+                stats.requests += 1
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            if method == 'generateContent':
+                return self._send(200, _reply(model, reply))
+
+            words = reply.split(' ')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for n, word in enumerate(words):
+                last = n == len(words) - 1
+                event = f"data: {json.dumps(_reply(model, word if last else word + ' ', last))}\r\n\r\n".encode('utf-8')
+                self.wfile.write(f"{len(event):x}\r\n".encode('ascii') + event + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def serve(host='127.0.0.1', port=5082, reply="This is the stand-in's answer.", handshake_ms=0, latency_ms=0):
+    """Start the stand-in on a background thread. Returns (server, stats)."""
+    stats = Stats()
+    server = ThreadingHTTPServer((host, port), make_handler(stats, reply, handshake_ms, latency_ms))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="gemini-standin", daemon=True).start()
+    return server, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5082)
+    parser.add_argument('--reply', default="This is the stand-in's answer.")
+    parser.add_argument('--handshake-ms', type=float, default=0.0, help='Delay on every new connection')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay on every answer')
+    args = parser.parse_args()
+
+    server, _ = serve(args.host, args.port, args.reply, args.handshake_ms, args.latency_ms)
+    print(f"Gemini stand-in listening on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""In-memory stand-in for a Pinecone index's data-plane REST API.
+
+Implements the endpoints PineconeStore uses (upsert, query, delete, update,
+fetch, list, describe_index_stats) with exact cosine search and metadata filters
+($eq, $ne, $gt, $gte, $lt, $lte, $in, $nin), so the remote backend can be
+exercised offline:
+
+    python scripts/pinecone_standin.py --port 5081
+    VECTOR_STORE_BACKEND=pinecone PINECONE_INDEX_HOST=http://127.0.0.1:5081 flask run
+
+--fail-rate makes a fraction of requests answer 503 (or 429 with Retry-After)
+to exercise the client's retry/back-off path.
+"""
+import argparse
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+
+_OPERATORS = {
+    '$eq': lambda value, arg: value == arg,
+    '$ne': lambda value, arg: value != arg,
+    '$gt': lambda value, arg: value is not None and value > arg,
+    '$gte': lambda value, arg: value is not None and value >= arg,
+    '$lt': lambda value, arg: value is not None and value < arg,
+    '$lte': lambda value, arg: value is not None and value <= arg,
+    '$in': lambda value, arg: value in arg,
+    '$nin': lambda value, arg: value not in arg,
+}
+
+
+def matches_filter(metadata, filter):
+    """Whether metadata passes a Pinecone metadata filter ({field: value} or
+    {field: {operator: value}}, combined with an implicit or explicit $and)."""
+    for field, condition in (filter or {}).items():
+        if field == '$and':
+            if not all(matches_filter(metadata, f) for f in condition):
+                return False
+        elif field == '$or':
+            if not any(matches_filter(metadata, f) for f in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(field)
+            for operator, arg in condition.items():
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator {operator}")
+                if not _OPERATORS[operator](value, arg):
+                    return False
+        elif metadata.get(field) != condition:
+            return False
+    return True
+
+
+class Index:
+    """namespace -> {id: (unit vector, metadata)}"""
+
+    def __init__(self, dimension=None):
+        self.dimension = dimension
+        self.namespaces = {}
+        self.lock = threading.Lock()
+
+    def upsert(self, namespace, vectors):
+        with self.lock:
+            records = self.namespaces.setdefault(namespace, {})
+            for v in vectors:
+                values = np.asarray(v['values'], dtype=np.float32)
+                if self.dimension is None:
+                    self.dimension = len(values)
+                if len(values) != self.dimension:
+                    raise ValueError(f"Vector dimension {len(values)} does not match the dimension of the index {self.dimension}")
+                norm = np.linalg.norm(values)
+                records[v['id']] = (values / norm if norm else values, v.get('metadata') or {})
+        return len(vectors)
+
+    def query(self, namespace, vector, top_k, include_metadata, filter=None):
+        with self.lock:
+            records = list(self.namespaces.get(namespace, {}).items())
+        if filter:
+            records = [r for r in records if matches_filter(r[1][1], filter)]
+        if not records:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        matrix = np.stack([values for _, (values, _) in records])
+        scores = matrix @ query
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for i in order:
+            record_id, (_, metadata) = records[i]
+            match = {'id': record_id, 'score': float(scores[i])}
+            if include_metadata:
+                match['metadata'] = metadata
+            matches.append(match)
+        return matches
+
+    def delete(self, namespace, ids=None, delete_all=False):
+        with self.lock:
+            if namespace not in self.namespaces:
+                return False
+            if delete_all:
+                del self.namespaces[namespace]
+            else:
+                records = self.namespaces[namespace]
+                for i in ids or []:
+                    records.pop(i, None)
+                if not records:
+                    del self.namespaces[namespace]
+        return True
+
+    def update(self, namespace, record_id, set_metadata):
+        with self.lock:
+            records = self.namespaces.get(namespace, {})
+            if record_id in records:
+                values, metadata = records[record_id]
+                records[record_id] = (values, {**metadata, **set_metadata})
+
+    def fetch(self, namespace, ids):
+        with self.lock:
+            records = self.namespaces.get(namespace, {})
+            return {
+                'vectors': {
+                    i: {'id': i, 'values': records[i][0].tolist(), 'metadata': records[i][1]}
+                    for i in ids if i in records
+                },
+                'namespace': namespace,
+            }
+
+    def list_ids(self, namespace, limit, token):
+        with self.lock:
+            ids = sorted(self.namespaces.get(namespace, {}))
+        start = int(token or 0)
+        page = ids[start:start + limit]
+        result = {'vectors': [{'id': i} for i in page], 'namespace': namespace}
+        if start + limit < len(ids):
+            result['pagination'] = {'next': str(start + limit)}
+        return result
+
+    def stats(self):
+        with self.lock:
+            namespaces = {ns: {'vectorCount': len(r)} for ns, r in self.namespaces.items()}
+        return {
+            'namespaces': namespaces,
+            'dimension': self.dimension or 0,
+            'totalVectorCount': sum(n['vectorCount'] for n in namespaces.values()),
+        }
+
+
+def make_handler(index, api_key, fail_rate):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real service
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=None, headers=None):
+            payload = json.dumps(body if body is not None else {}).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _check(self):
+            if api_key and self.headers.get('Api-Key') != api_key:
+                self._send(401, {'code': 16, 'message': 'Invalid API Key'})
+                return False
+            if fail_rate and random.random() < fail_rate:
+                if random.random() < 0.5:
+                    self._send(429, {'code': 8, 'message': 'Too many requests'}, {'Retry-After': '0.1'})
+                else:
+                    self._send(503, {'code': 14, 'message': 'Unavailable'})
+                return False
+            return True
+
+        def do_GET(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            if not self._check():
+                return
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            namespace = params.get('namespace', [''])[0]
+            if url.path == '/vectors/fetch':
+                return self._send(200, index.fetch(namespace, params.get('ids', [])))
+            if url.path != '/vectors/list':
+                return self._send(404, {'message': 'Not found'})
+            limit = int(params.get('limit', ['100'])[0])
+            token = params.get('paginationToken', [None])[0]
+            self._send(200, index.list_ids(namespace, limit, token))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self._send(400, {'message': 'Invalid JSON'})
+            if not self._check():
+                return
+            path = urlparse(self.path).path
+            namespace = body.get('namespace', '')
+            try:
+                if path == '/vectors/upsert':
+                    return self._send(200, {'upsertedCount': index.upsert(namespace, body.get('vectors', []))})
+                if path == '/query':
+                    matches = index.query(
+                        namespace, body['vector'], int(body.get('topK', 10)),
+                        body.get('includeMetadata', False), body.get('filter')
+                    )
+                    return self._send(200, {'matches': matches, 'namespace': namespace})
+                if path == '/vectors/delete':
+                    if not index.delete(namespace, body.get('ids'), body.get('deleteAll', False)):
+                        return self._send(404, {'code': 5, 'message': 'Namespace not found'})
+                    return self._send(200, {})
+                if path == '/vectors/update':
+                    index.update(namespace, body['id'], body.get('setMetadata') or {})
+                    return self._send(200, {})
+                if path == '/describe_index_stats':
+                    return self._send(200, index.stats())
+            except (KeyError, ValueError) as e:
+                return self._send(400, {'code': 3, 'message': str(e)})
+            self._send(404, {'message': 'Not found'})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5081)
+    parser.add_argument('--dimension', type=int, default=None, help='Fixed dimension (default: first upsert decides)')
+    parser.add_argument('--api-key', default=None, help='Require this Api-Key header')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests to fail with 429/503')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(Index(args.dimension), args.api_key, args.fail_rate))
+    print(f"Pinecone stand-in listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()